@@ -1,32 +1,51 @@
 from __future__ import absolute_import
 import contextlib
 import logging
+import threading
 
 from cassette.player import Player
+from cassette.utils import register_encoder, unregister_encoder  # noqa
 
 player = None
+# Players inserted by the current thread
+_players = threading.local()
 logging.getLogger("cassette").addHandler(logging.NullHandler())
 
 
 def insert(filename, file_format=''):
     """Setup cassette.
 
+    Cassettes are inserted for the current thread only, other threads keep
+    their own.
+
     :param filename: path to where requests and responses will be stored.
     """
     global player
 
     player = Player(filename, file_format)
+    if not hasattr(_players, 'stack'):
+        _players.stack = []
+    _players.stack.append(player)
     player.__enter__()
 
 
 def eject(exc_type=None, exc_value=None, tb=None):
-    """Remove cassette, unpatching HTTP requests."""
-    player.__exit__(exc_type, exc_value, tb)
+    """Remove the last cassette inserted by the current thread, unpatching
+    HTTP requests if no other cassette is inserted."""
+    stack = getattr(_players, 'stack', None)
+    if not stack:
+        raise RuntimeError('No cassette inserted by this thread.')
+
+    stack.pop().__exit__(exc_type, exc_value, tb)
 
 
 @contextlib.contextmanager
 def play(filename, file_format=''):
     """Use cassette."""
     insert(filename, file_format=file_format)
-    yield
-    eject()
+    try:
+        yield
+    finally:
+        # Eject even on errors, so that the cassette does not stay active
+        # for the rest of the process
+        eject()
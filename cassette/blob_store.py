@@ -0,0 +1,92 @@
+"""
+    blob_store.py
+
+    Content-addressed store for response bodies.
+"""
+import hashlib
+import mmap
+import os
+
+from cassette.files import write_atomically
+
+
+class BlobStore(object):
+    """Store bodies in files named after the digest of their content.
+
+    Identical bodies are stored once, whatever the cassette or library they
+    belong to.
+
+    :param str directory: path to the directory holding the blobs.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    @staticmethod
+    def digest(content):
+        """Return the digest identifying the content."""
+        return hashlib.sha1(content).hexdigest()
+
+    def path(self, digest):
+        """Return the path to the blob file for the digest."""
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def __contains__(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, content):
+        """Store the content and return its digest."""
+        digest = self.digest(content)
+        path = self.path(digest)
+        if os.path.exists(path):
+            return digest
+
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        write_atomically(path, content)
+
+        return digest
+
+    def put_spool(self, spool):
+        """Store the content of a spool and return its digest.
+
+        Spools that spilled to disk are moved into the store rather than
+        read again.
+        """
+        spool.drain()
+        if spool.is_in_memory():
+            return self.put(spool.getvalue())
+
+        digest = spool.digest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            dirname = os.path.dirname(path)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            spool.move_to(path)
+
+        return digest
+
+    def get(self, digest):
+        """Return the content stored for the digest."""
+        try:
+            with open(self.path(digest), 'rb') as f:
+                return f.read()
+        except IOError:
+            raise KeyError('Blob %s does not exist in %s.' %
+                           (digest, self.directory))
+
+    def map(self, digest):
+        """Return a read-only memory map of the content stored for the
+        digest."""
+        try:
+            with open(self.path(digest), 'rb') as f:
+                if not os.fstat(f.fileno()).st_size:
+                    # Empty files cannot be mapped
+                    return ''
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except IOError:
+            raise KeyError('Blob %s does not exist in %s.' %
+                           (digest, self.directory))
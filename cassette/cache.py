@@ -0,0 +1,114 @@
+"""
+    cache.py
+
+    Bounded cache of decoded cassette files, shared by all the libraries of
+    the process.
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Cache evicting the least recently used entries.
+
+    The cache is bounded by a number of entries and by an approximate number
+    of bytes, usually the size of the encoded files the entries were decoded
+    from. A bound of ``None`` disables it.
+
+    :param int max_entries: maximum number of entries.
+    :param int max_bytes: maximum total size of the entries.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Remove all the entries and reset the counters."""
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def resize(self, max_entries=None, max_bytes=None):
+        """Change the bounds of the cache, evicting entries if needed."""
+        with self.lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def get(self, key, default=None):
+        """Return the entry for the key and mark it as recently used."""
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size=0):
+        """Add an entry to the cache.
+
+        :param key: key of the entry.
+        :param value: value of the entry.
+        :param int size: approximate size of the entry, in bytes.
+        """
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.total_bytes += size
+            self._evict()
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+
+        return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        """Return a dict of the counters and current usage of the cache."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+        }
+
+    def _remove(self, key):
+        if key in self.entries:
+            del self.entries[key]
+            self.total_bytes -= self.sizes.pop(key)
+
+    def _is_full(self):
+        if self.max_entries is not None and \
+                len(self.entries) > self.max_entries:
+            return True
+
+        return self.max_bytes is not None and \
+            self.total_bytes > self.max_bytes
+
+    def _evict(self):
+        while self.entries and self._is_full():
+            key = next(iter(self.entries))
+            self._remove(key)
+            self.evictions += 1
@@ -1,16 +1,44 @@
 from __future__ import absolute_import
 import hashlib
 import logging
+import json
+import multiprocessing
 import os
+import sqlite3
 import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 from urlparse import urlparse
 
+from cassette.blob_store import BlobStore
+from cassette.cache import LRUCache
 from cassette.config import Config
-from cassette.http_response import MockedHTTPResponse
-from cassette.utils import Encoder
+from cassette.files import TEMP_PREFIX, create_temp_file, write_atomically
+from cassette.http_response import MockedHTTPResponse, RecordingCursor
+from cassette.indexed import IndexedResponses
+from cassette.journal import append_records, read_records
+from cassette.locking import locked
+from cassette.manifest import Manifest, walk_files
+from cassette.matcher import Matcher
+from cassette.request_body import StreamedBody
+from cassette.shared import SharedCache
+from cassette.snapshot import SnapshotCache
+from cassette.spool import Spool
+from cassette.utils import TEXT_ENCODING, Encoder, JsonEncoder
 
 log = logging.getLogger("cassette")
 
+SQLITE_EXTENSIONS = ('.sqlite', '.db')
+
+# Default bounds of the cache of decoded files
+CACHE_MAX_ENTRIES = 1024
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Files modified less than this many seconds ago may be modified again
+# without changing their size nor their modification time
+RACY_DELAY = 2
+
 
 def _hash(content):
     m = hashlib.md5()
@@ -18,6 +46,82 @@ def _hash(content):
     return m.digest()
 
 
+def _file_signature(filename):
+    """Return a ``(inode, size, mtime_ns)`` tuple identifying the content of
+    the file, or None if the file was modified too recently to be trusted."""
+    stat = os.stat(filename)
+    if time.time() - stat.st_mtime < RACY_DELAY:
+        return None
+
+    # os.stat does not return nanoseconds on Python 2
+    mtime_ns = getattr(stat, 'st_mtime_ns', int(stat.st_mtime * 1e9))
+    return stat.st_ino, stat.st_size, mtime_ns
+
+
+def _stat_signature(filename):
+    """Return a ``(inode, size, mtime)`` tuple changing whenever the file is
+    replaced, or None if the file does not exist."""
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+
+    return stat.st_ino, stat.st_size, stat.st_mtime
+
+
+def _map_in_pool(function, iterable, workers, pool):
+    """Return the results of the function applied to every item, computed
+    in a pool of workers.
+
+    :param int workers: size of the pool.
+    :param str pool: ``'thread'`` or ``'process'``.
+    """
+    if pool == 'thread':
+        pool = ThreadPool(workers)
+    elif pool == 'process':
+        pool = multiprocessing.Pool(workers)
+    else:
+        raise ValueError('%r is not a supported pool.' % pool)
+
+    try:
+        return pool.map(function, iterable)
+    finally:
+        pool.terminate()
+
+
+def _write_file_content(args):
+    """Write an entry to a file with the encoder, without syncing it.
+
+    Module-level so that process pools can pickle it.
+
+    :return: the hash and the size of the encoded entry.
+    """
+    encoder, entry, path = args
+    encoded_str = encoder.dump(entry)
+    with open(path, 'w') as f:
+        f.write(encoded_str)
+    return _hash(encoded_str), len(encoded_str)
+
+
+def _fsync_path(path):
+    """Flush the file or directory to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _load_file_content(args):
+    """Return the content of an encoded file, as loaded by the encoder.
+
+    Module-level so that process pools can pickle it.
+    """
+    encoder, path = args
+    with open(path) as f:
+        return encoder.load(f.read())
+
+
 class CassetteName(unicode):
 
     """
@@ -39,7 +143,11 @@ class CassetteName(unicode):
             headers = hashlib.md5(repr(sorted(headers.items()))).hexdigest()
 
         if will_hash_body:
-            if body:
+            if isinstance(body, StreamedBody):
+                # Streamed bodies are not held in memory: use the digest
+                # computed while streaming them
+                body = body.hexdigest if body else ''
+            elif body:
                 body = hashlib.md5(body).hexdigest()
             else:
                 body = ''
@@ -58,6 +166,9 @@ class CassetteName(unicode):
             name = ("httplib:{method} {host}:{port}{url} {query} "
                     "{headers} {body}").format(**locals())
         else:
+            if isinstance(body, StreamedBody):
+                body = body.hexdigest if body else ''
+
             # note that old yaml files will not contain the correct matching
             # query and body
             name = ("httplib:{method} {host}:{port}{url} "
@@ -79,19 +190,83 @@ class CassetteLibrary(object):
     :param Encoder encoder: the instantiated encodeder to use
     """
 
-    cache = {}
+    # Decoded files, shared by all the libraries of the process. Use
+    # ``CassetteLibrary.cache.resize`` to change its bounds.
+    cache = LRUCache(max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES)
+
+    # Whether cassette names hold hashes of the query and the body rather
+    # than the raw values (see CassetteName.from_httplib_connection)
+    will_hash_body = False
 
     def __init__(self, filename, encoder, config=None):
         self.filename = os.path.abspath(filename)
         self.is_dirty = False
+        self.dirty_names = set()
         self.used = set()
-        self.config = config or self.get_default_config()
+        # Options that are not provided keep their default value
+        self.config = self.get_default_config()
+        self.config.update(config or {})
 
         self.encoder = encoder
 
     def get_default_config(self):
         return Config()
 
+    @property
+    def blob_store(self):
+        """Store for large response bodies, if enabled."""
+        if not hasattr(self, "_blob_store"):
+            directory = self.config['blob_store']
+            self._blob_store = BlobStore(directory) if directory else None
+
+        return self._blob_store
+
+    @property
+    def snapshot_cache(self):
+        """On-disk cache of decoded files, if enabled."""
+        if not hasattr(self, "_snapshot_cache"):
+            directory = self.config['snapshot_dir']
+            self._snapshot_cache = SnapshotCache(
+                directory, self.config['snapshot_max_bytes']
+            ) if directory else None
+
+        return self._snapshot_cache
+
+    @property
+    def shared_cache(self):
+        """Cache of decoded files shared across processes, if enabled."""
+        if not hasattr(self, "_shared_cache"):
+            self._shared_cache = SharedCache(
+                self.config['shared_cache_dir'],
+                self.config['shared_cache_max_bytes']
+            ) if self.config['shared_cache'] else None
+
+        return self._shared_cache
+
+    def encode_response(self, response):
+        """Return the dict representation of a response, ready to encode.
+
+        Contents larger than the blob threshold are moved to the blob store
+        and referenced by their digest. Spooled contents are moved there
+        without being read in memory.
+        """
+        store = self.blob_store
+        threshold = self.config['blob_threshold']
+        if store is not None and response.content_digest is None:
+            spool = response.spool
+            if spool is not None:
+                spool.drain()
+                if spool.size >= threshold:
+                    response.content_digest = store.put_spool(spool)
+            elif len(response.content) >= threshold:
+                response.content_digest = store.put(response.content)
+
+        return response.to_dict()
+
+    def decode_response(self, data):
+        """Return a mocked response from its decoded dict representation."""
+        return MockedHTTPResponse.from_dict(data, self.blob_store)
+
     def add_response(self, cassette_name, response):
         """Add a new response to the mocked response.
 
@@ -103,23 +278,127 @@ class CassetteLibrary(object):
             raise TypeError("No cassette name provided.")
 
         mock_response_class = MockedHTTPResponse
-        mocked = mock_response_class.from_response(response)
+        spool_threshold = self.config['spool_threshold']
+        if spool_threshold is None:
+            mocked = mock_response_class.from_response(response)
+            cursor = mocked.cursor()
+        else:
+            # Spool the body as the client reads it, next to the blob store
+            # so that it can be moved there
+            store = self.blob_store
+            spool = Spool(response, spool_threshold,
+                          store.directory if store else None)
+            mocked = mock_response_class.from_spool(response, spool)
+            cursor = RecordingCursor(mocked)
         self.data[cassette_name] = mocked
 
         # Mark the cassette changes as dirty for ejection
         self.is_dirty = True
+        self.dirty_names.add(cassette_name)
 
-        return mocked
+        return cursor
 
-    def save_to_cache(self, file_hash, data):
-        """Save a decoded data object into cache."""
-        CassetteLibrary.cache[self.filename] = {
+    def save_to_cache(self, file_hash, data, key=None, size=0,
+                      signature=None):
+        """Save a decoded data object into cache.
+
+        :param str key: cache key, defaults to the library filename.
+        :param int size: size of the encoded data, in bytes.
+        :param tuple signature: stat signature of the file, if trusted.
+        """
+        CassetteLibrary.cache.put(key or self.filename, {
             'hash': file_hash,
+            'signature': signature,
             'data': data
-        }
+        }, size=size)
+
+    def load_encoded(self, encoded_str, encoded_hash):
+        """Return the content of an encoded file, from its snapshot if the
+        snapshot cache is enabled."""
+        snapshots = self.snapshot_cache
+        if snapshots is None:
+            return self.encoder.load(encoded_str)
+
+        key = snapshots.key(encoded_hash.encode('hex'), self.encoder.file_ext)
+        content = snapshots.get(key)
+        if content is None:
+            content = self.encoder.load(encoded_str)
+            snapshots.put(key, content)
+
+        return content
+
+    def read_entries(self, filename):
+        """Return the content of an encoded file, as loaded by the
+        encoder."""
+        with open(filename) as f:
+            encoded_str = f.read()
+
+        return self.load_encoded(encoded_str, _hash(encoded_str))
+
+    def attach_shared_file(self, filename, build):
+        """Return the responses of a file from the shared cache.
+
+        Return None if the shared cache is disabled, or if the file is
+        missing or was modified too recently to be identified by its stat
+        signature.
+
+        :param str filename: path to the file.
+        :param callable build: returns the dict of entries to publish.
+        """
+        if self.shared_cache is None or not os.path.exists(filename):
+            return None
+
+        signature = _file_signature(filename)
+        if signature is None:
+            return None
+
+        return self.shared_cache.attach(filename, signature, build,
+                                        self.encode_response,
+                                        self.decode_response)
+
+    def load_cached_file(self, filename, decode):
+        """Return the decoded content of a file, from the cache if the file
+        did not change.
+
+        The file is not read at all when its stat signature matches the
+        cached one. Otherwise, its content is hashed and only decoded when
+        the hash differs from the cached one.
+
+        :param str filename: path to the file.
+        :param callable decode: turns the loaded content into the data to
+            cache.
+        """
+        signature = _file_signature(filename)
+        cached_result = CassetteLibrary.cache.get(filename, None)
+        if (cached_result and signature is not None and
+                cached_result['signature'] == signature):
+            return cached_result['data']
+
+        # Open and read in the file
+        with open(filename) as f:
+            encoded_str = f.read()
+        encoded_hash = _hash(encoded_str)
+
+        # If the contents are cached, return them
+        if cached_result and cached_result['hash'] == encoded_hash:
+            cached_result['signature'] = signature
+            return cached_result['data']
+
+        # Otherwise, parse the contents
+        data = decode(self.load_encoded(encoded_str, encoded_hash))
+
+        # Cache the file for later
+        self.save_to_cache(file_hash=encoded_hash, data=data, key=filename,
+                           size=len(encoded_str), signature=signature)
+
+        return data
 
     def rewind(self):
-        """Restore all responses to a re-seekable state."""
+        """Restore all responses to a re-seekable state.
+
+        Deprecated: lookups return a new cursor over the response, which
+        does not need to be rewound.
+        """
         for k, v in self.data.items():
             v.rewind()
 
@@ -131,11 +410,20 @@ class CassetteLibrary(object):
         """
         pass
 
+    @property
+    def matcher(self):
+        """Matcher compiled from the ``matcher`` option."""
+        if not hasattr(self, "_matcher"):
+            self._matcher = Matcher(self.config['matcher'],
+                                    will_hash_body=self.will_hash_body)
+
+        return self._matcher
+
     def cassette_name_for_httplib_connection(self, host, port, method,
                                              url, body, headers):
         """Create a cassette name from an httplib request."""
-        return CassetteName.from_httplib_connection(
-            host, port, method, url, body, headers)
+        return self.matcher.cassette_name(host, port, method, url, body,
+                                          headers)
 
     def _log_contains(self, cassette_name, contains):
         """Logging for checking access to cassettes."""
@@ -158,6 +446,19 @@ class CassetteLibrary(object):
         unused = available.difference(self.used)
         output.write('\n'.join(unused))
 
+    def preload(self, names=None, workers=None, pool=None):
+        """Load responses before they are requested.
+
+        Single-file libraries load the whole file.
+
+        :param list names: cassette names to load, defaults to all.
+        :param int workers: size of the pool of workers, defaults to the
+            ``preload_workers`` option.
+        :param str pool: ``'thread'`` or ``'process'``, defaults to the
+            ``preload_pool`` option.
+        """
+        self.data
+
     # Methods that need to be implemented by subclasses
     def write_to_file(self):
         """Write the response data to file."""
@@ -178,7 +479,8 @@ class CassetteLibrary(object):
         back the cassette based on the filename. The method assumes that
         all file names with an extension (e.g. ``/file.json``) are files,
         and all file names without extensions are directories (e.g.
-        ``/requests``).
+        ``/requests``). Files with a SQLite extension (e.g. ``/file.db``)
+        are SQLite databases.
 
         :param str path: filename of file or directory for storing requests
         :param str file_format: the file_format to use for storing requests
@@ -187,7 +489,7 @@ class CassetteLibrary(object):
         if not Encoder.is_supported_format(file_format):
             raise KeyError('%r is not a supported file_format.' % file_format)
 
-        _, extension = os.path.splitext(path)
+        extension = Encoder.get_extension(path)
         if file_format:
             encoder = Encoder.get_encoder_from_file_format(file_format)
         else:
@@ -198,7 +500,12 @@ class CassetteLibrary(object):
             if os.path.isdir(path):
                 raise IOError('Expected a file, but found a directory at %s'
                               % path)
-            klass = FileCassetteLibrary
+            if extension.lower() in SQLITE_EXTENSIONS:
+                klass = SqliteCassetteLibrary
+            elif encoder.lazy:
+                klass = IndexedFileCassetteLibrary
+            else:
+                klass = FileCassetteLibrary
         else:
             if os.path.isfile(path):
                 raise IOError('Expected a directory, but found a file at %r' %
@@ -215,54 +522,171 @@ class FileCassetteLibrary(CassetteLibrary):
     def data(self):
         """Lazily loaded data."""
         if not hasattr(self, "_data"):
+            # Taken before loading, so that a concurrent write is detected
+            self.disk_signature = self.stat_files()
             self._data = self.load_file()
 
         return self._data
 
+    @property
+    def journal_filename(self):
+        """Path to the journal holding responses appended to the file."""
+        return self.filename + '.journal'
+
     def write_to_file(self):
-        """Write mocked responses to file."""
+        """Write mocked responses to file.
+
+        In journal mode, only the responses recorded since the last write are
+        appended to the journal, leaving the file untouched. With appendable
+        encoders, they are appended to the file itself.
+
+        Writes hold an advisory lock on the file, so that processes recording
+        into the same file do not lose each other's responses.
+        """
+        with locked(self.filename):
+            if self.config['journal']:
+                self.write_to_journal()
+            elif self.encoder.appendable and os.path.exists(self.filename):
+                self.append_to_file()
+            else:
+                self.dump_to_file()
+
+    def stat_files(self):
+        """Return the stat signatures of the file and of its journal."""
+        return (_stat_signature(self.filename),
+                _stat_signature(self.journal_filename))
+
+    def write_to_journal(self):
+        """Append the responses recorded since the last write to the
+        journal."""
+        append_records(self.journal_filename,
+                       ((name, self.encode_response(self.data[name]))
+                        for name in self.dirty_names))
+
+        self.dirty_names.clear()
+        self.is_dirty = False
+
+    def append_to_file(self):
+        """Append the responses recorded since the last write to the file."""
+        data = {name: self.encode_response(self.data[name])
+                for name in self.dirty_names}
+
+        with open(self.filename, "a+b") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                last_character = f.read(1)
+                f.seek(0, os.SEEK_END)
+                if last_character != '\n':
+                    # Keep the new entries apart from the partial entry left
+                    # by a torn write
+                    f.write('\n')
+            f.write(self.encoder.dump(data))
+
+        self.dirty_names.clear()
+        self.is_dirty = False
+
+    def dump_to_file(self):
+        """Rewrite the whole file with all the mocked responses.
+
+        The responses written by other processes since the file was loaded
+        are merged first. The caller holds the lock on the file.
+        """
+        # Loading the data replays the journal
+        self.data
+        if self.stat_files() != self.disk_signature:
+            self.merge_from_disk()
+
+        self.write_data()
+        self.disk_signature = self.stat_files()
+
+        self.dirty_names.clear()
+        self.is_dirty = False
+
+    def write_data(self):
+        """Replace the file with all the mocked responses."""
         # Serialize the items via YAML
-        data = {k: v.to_dict() for k, v in self.data.items()}
+        data = {k: self.encode_response(v) for k, v in self.data.items()}
         encoded_str = self.encoder.dump(data)
-
-        # Save the changes to file
-        with open(self.filename, "w+") as f:
-            f.write(encoded_str)
+        self.replace_file(encoded_str)
 
         # Update our hash
-        self.save_to_cache(file_hash=_hash(encoded_str), data=self.data)
+        self.save_to_cache(file_hash=_hash(encoded_str), data=self.data,
+                           size=len(encoded_str))
 
-        self.is_dirty = False
+    def replace_file(self, encoded_str):
+        """Replace the file with the encoded string and remove the journal,
+        whose responses the string holds."""
+        write_atomically(self.filename, encoded_str)
+
+        # Replaying the journal over the file would restore older responses
+        if os.path.exists(self.journal_filename):
+            os.remove(self.journal_filename)
+
+    def merge_from_disk(self):
+        """Merge the responses currently on disk into the data.
+
+        Responses recorded by this library since the last write conflict
+        with the ones on disk under the same name. The ``merge_conflicts``
+        option decides which one is kept: ``'ours'`` (the default) or
+        ``'theirs'``. Other responses on disk replace the ones in memory.
+        """
+        policy = self.config['merge_conflicts']
+        if policy not in ('ours', 'theirs'):
+            raise ValueError('%r is not a supported merge policy.' % policy)
+
+        disk_data = self.load_file()
+        for name in disk_data.keys():
+            if policy == 'ours' and name in self.dirty_names:
+                continue
+            self.merge_response(name, disk_data)
+
+        if hasattr(disk_data, 'close'):
+            disk_data.close()
+
+    def merge_response(self, name, disk_data):
+        """Replace a response with the one on disk."""
+        self.data[name] = disk_data[name]
+
+    def compact(self):
+        """Fold the journal back into the file."""
+        with locked(self.filename):
+            self.dump_to_file()
 
     def load_file(self):
+        """Load MockedResponses from YAML file and replay the journal."""
+        data = self.attach_shared_file(
+            self.filename, lambda: self.read_entries(self.filename) or {})
+        if data is None:
+            # Leave the cached data untouched by new responses
+            data = dict(self.load_base_file())
+
+        if os.path.exists(self.journal_filename):
+            self.replay_journal(data)
+
+        return data
+
+    def replay_journal(self, data):
+        """Apply the responses stored in the journal over the data."""
+        for name, entry in read_records(self.journal_filename):
+            data[name] = self.decode_response(entry)
+
+    def load_base_file(self):
         """Load MockedResponses from YAML file."""
-        data = {}
         filename = self.filename
 
         if not os.path.exists(filename):
             log.info("File '{f}' does not exist.".format(f=filename))
-            return data
+            return {}
 
-        # Open and read in the file
-        with open(filename) as f:
-            encoded_str = f.read()
-        encoded_hash = _hash(encoded_str)
-
-        # If the contents are cached, return them
-        cached_result = CassetteLibrary.cache.get(filename, None)
-        if cached_result and cached_result['hash'] == encoded_hash:
-            return cached_result['data']
-
-        # Otherwise, parse the contents
-        content = self.encoder.load(encoded_str)
+        return self.load_cached_file(filename, self.decode_responses)
 
+    def decode_responses(self, content):
+        """Return a dict of mocked responses from the loaded file."""
+        data = {}
         if content:
             for k, v in content.items():
-                mock_response_class = MockedHTTPResponse
-                data[k] = mock_response_class.from_dict(v)
-
-        # Cache the file for later
-        self.save_to_cache(file_hash=encoded_hash, data=data)
+                data[k] = self.decode_response(v)
 
         return data
 
@@ -280,59 +704,200 @@ class FileCassetteLibrary(CassetteLibrary):
             raise KeyError("Cassette '{c}' does not exist in \
                     library.".format(c=cassette_name))
 
-        req.rewind()
-        return req
+        # Responses are shared, every lookup gets its own cursor
+        return req.cursor()
 
     def get_all_available(self):
         """Return all available cassette."""
         return self.data.keys()
 
 
+class IndexedFileCassetteLibrary(FileCassetteLibrary):
+    """Store and manage requests with a single indexed file.
+
+    Only the index of the file is read when the library is loaded. The file
+    is memory-mapped and every response is decoded the first time it is
+    requested.
+    """
+
+    def write_data(self):
+        """Replace the file with all the mocked responses.
+
+        Responses that were never requested are copied over without being
+        decoded. The file is replaced atomically since it is still mapped in
+        memory.
+        """
+        encoded_str = self.encoder.dump_encoded(self.data.iter_encoded())
+        self.replace_file(encoded_str)
+
+        self.data.close()
+        self._data = self.load_file()
+
+    def merge_response(self, name, disk_data):
+        """Replace a response with the one on disk, without decoding it."""
+        self.data.merge_entry(name, disk_data.encoded_entry(name))
+
+    def load_file(self):
+        """Load the index of the file, map its entries and replay the
+        journal."""
+        filename = self.filename
+
+        if os.path.exists(filename):
+            data = IndexedResponses.open(filename, self.encoder,
+                                         self.encode_response,
+                                         self.decode_response)
+        else:
+            log.info("File '{f}' does not exist.".format(f=filename))
+            data = IndexedResponses('', self.encoder, self.encode_response,
+                                    self.decode_response)
+
+        if os.path.exists(self.journal_filename):
+            self.replay_journal(data)
+
+        return data
+
+
 class DirectoryCassetteLibrary(CassetteLibrary):
     """A CassetteLibrary that stores and manages requests with directory."""
 
+    # Cassette names are used as filenames
+    will_hash_body = True
+
     def __init__(self, *args, **kwargs):
         super(DirectoryCassetteLibrary, self).__init__(*args, **kwargs)
 
+        if self.config['layout'] not in ('flat', 'hashed'):
+            raise ValueError('%r is not a supported layout.' %
+                             self.config['layout'])
+
         self.data = {}
+        # Responses loaded by preload, by filename. They are moved to
+        # self.data when requested.
+        self.preloaded = {}
+
+    @property
+    def manifest(self):
+        """Lazily loaded manifest of the directory."""
+        if not hasattr(self, "_manifest"):
+            self._manifest = Manifest.load(self.filename)
+
+        return self._manifest
 
     def generate_filename(self, cassette_name):
-        """Generate the filename for a given cassette name."""
+        """Generate the filename for a given cassette name.
+
+        With the hashed layout, the filename is a path relative to the
+        directory.
+        """
         for character in ('/', ':', ' '):
             cassette_name = cassette_name.replace(character, '_')
 
+        if self.config['layout'] == 'hashed':
+            return self.generate_hashed_filename(cassette_name)
+
         return cassette_name + self.encoder.file_ext
 
+    def generate_hashed_filename(self, flat_name):
+        """Generate the fixed-length, sharded filename for the flat layout
+        filename (without extension) of a cassette."""
+        if isinstance(flat_name, unicode):
+            flat_name = flat_name.encode('utf-8')
+
+        digest = hashlib.sha1(flat_name).hexdigest()
+        return os.path.join(digest[:2], digest[2:4],
+                            digest + self.encoder.file_ext)
+
     def generate_path_from_cassette_name(self, cassette_name):
         """Generate the full path to cassette file."""
         return os.path.join(
             self.filename, self.generate_filename(cassette_name))
 
     def write_to_file(self):
-        """Write mocked response to a directory of files."""
+        """Write the responses recorded since the last write to a directory
+        of files.
+
+        Responses are encoded and written to temporary files in a pool of
+        ``flush_workers`` workers, synced, then renamed into place, so that
+        an interrupted write never leaves a partial file.
+        """
         if not os.path.exists(self.filename):
             os.mkdir(self.filename)
 
-        for cassette_name, response in self.data.items():
-            filename = self.generate_filename(cassette_name)
-            encoded_str = self.encoder.dump(response.to_dict())
+        hashed = self.config['layout'] == 'hashed'
+        cassette_names = list(self.dirty_names)
+        filenames = []
+        temp_paths = []
+        tasks = []
+        try:
+            for cassette_name in cassette_names:
+                filename = self.generate_path_from_cassette_name(cassette_name)
+                entry = self.encode_response(self.data[cassette_name])
+                dirname = os.path.dirname(filename)
+                if hashed:
+                    # Keep the human-readable name along with the response
+                    entry['name'] = cassette_name
+                    if not os.path.isdir(dirname):
+                        os.makedirs(dirname)
+
+                temp_path = create_temp_file(dirname)
+                filenames.append(filename)
+                temp_paths.append(temp_path)
+                tasks.append((self.encoder, entry, temp_path))
+
+            workers = min(self.config['flush_workers'], len(tasks))
+            pool = self.config['flush_pool']
+            if workers > 1:
+                results = _map_in_pool(_write_file_content, tasks,
+                                       workers, pool)
+                # Sync all the files at once, before any of them replaces
+                # the previous version
+                _map_in_pool(_fsync_path, temp_paths, workers, pool)
+            else:
+                results = map(_write_file_content, tasks)
+                map(_fsync_path, temp_paths)
+        except BaseException:
+            for temp_path in temp_paths:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+            raise
+
+        for temp_path, filename in zip(temp_paths, filenames):
+            os.rename(temp_path, filename)
+        for dirname in set(os.path.dirname(f) for f in filenames):
+            _fsync_path(dirname)
+
+        for cassette_name, filename, (encoded_hash, size) in zip(
+                cassette_names, filenames, results):
+            # Update our hash
+            self.save_to_cache(file_hash=encoded_hash,
+                               data=self.data[cassette_name],
+                               key=filename, size=size)
 
-            with open(os.path.join(self.filename, filename), 'w') as f:
-                f.write(encoded_str)
+            if self.config['manifest']:
+                self.manifest.update(self.generate_filename(cassette_name),
+                                     encoded_hash.encode('hex'))
 
-            # Update our hash
-            self.save_to_cache(file_hash=_hash(encoded_str), data=response)
+        if self.config['manifest']:
+            self.manifest.save()
 
+        self.dirty_names.clear()
         self.is_dirty = False
 
     def __contains__(self, cassette_name):
         """Return whether or not the cassette already exists.
 
         The method first checks if it is already stored in memory. If not, it
-        will check if a file supporting the cassette name exists.
+        will check if a file supporting the cassette name exists, using the
+        manifest if enabled.
         """
-        contains = cassette_name in self.data
-        if not contains:
+        contains = (cassette_name in self.data or
+                    self.generate_filename(cassette_name) in self.preloaded)
+        if not contains and self.config['manifest']:
+            filename = self.generate_filename(cassette_name)
+            contains = filename in self.manifest
+        elif not contains:
             # Check file directory if it exists
             filename = self.generate_path_from_cassette_name(cassette_name)
             contains = os.path.exists(filename)
@@ -346,15 +911,24 @@ class DirectoryCassetteLibrary(CassetteLibrary):
         if cassette_name in self.data:
             req = self.data[cassette_name]
         else:
-            # If not in self.data, need to fetch from disk
-            req = self._load_request_from_file(cassette_name)
+            # If not in self.data, need to fetch from disk (unless it was
+            # preloaded). Keep it in memory so that replaying it again costs
+            # no I/O.
+            filename = self.generate_filename(cassette_name)
+            req = self.preloaded.pop(filename, None)
+            if req is not None:
+                self.log_cassette_used(filename)
+            else:
+                req = self._load_request_from_file(cassette_name)
+            if req:
+                self.data[cassette_name] = req
 
         if not req:
             raise KeyError('Cassette %s does not exist in library.' %
                            cassette_name)
 
-        req.rewind()
-        return req
+        # Responses are shared, every lookup gets its own cursor
+        return req.cursor()
 
     def _load_request_from_file(self, cassette_name):
         """Return the mocked response object from the encoded file.
@@ -363,36 +937,248 @@ class DirectoryCassetteLibrary(CassetteLibrary):
         from the disk to fetch the particular request.
         """
         filename = self.generate_path_from_cassette_name(cassette_name)
+        shared = self.attach_shared_file(
+            filename, lambda: {cassette_name: self.read_entries(filename)})
+        if shared is not None:
+            req = shared[cassette_name]
+            shared.close()
+        else:
+            req = self.load_cached_file(filename, self.decode_response)
+        self.log_cassette_used(self.generate_filename(cassette_name))
+        return req
 
-        with open(filename) as f:
-            encoded_str = f.read()
+    def preload(self, names=None, workers=None, pool=None):
+        """Load responses before they are requested, in a pool of workers.
 
-        self.log_cassette_used(self.generate_filename(cassette_name))
-        encoded_hash = _hash(encoded_str)
+        Workers read and decode the files, the responses are then kept in
+        memory until they are requested.
 
-        # If the contents are cached, return them
-        cached_result = CassetteLibrary.cache.get(filename, None)
-        if cached_result and cached_result['hash'] == encoded_hash:
-            return cached_result['data']
+        :param list names: cassette names to load, defaults to every file of
+            the directory.
+        :param int workers: size of the pool of workers, defaults to the
+            ``preload_workers`` option.
+        :param str pool: ``'thread'`` or ``'process'``, defaults to the
+            ``preload_pool`` option. Processes decode in parallel, threads
+            only overlap the reads.
+        :return: number of responses loaded.
+        """
+        if names is None:
+            if not os.path.isdir(self.filename):
+                return 0
+            filenames = [f for f in self.get_all_available()
+                         if f.endswith(self.encoder.file_ext)]
+        else:
+            filenames = [self.generate_filename(name) for name in names
+                         if name not in self.data]
 
-        # Otherwise, parse the contents
-        content = self.encoder.load(encoded_str)
+        paths = {}
+        for filename in filenames:
+            path = os.path.join(self.filename, filename)
+            if filename not in self.preloaded and os.path.isfile(path):
+                paths[filename] = path
+        if not paths:
+            return 0
 
-        if content:
-            mock_response_class = MockedHTTPResponse
-            req = mock_response_class.from_dict(content)
+        filenames = list(paths)
+        contents = _map_in_pool(_load_file_content,
+                                [(self.encoder, paths[f]) for f in filenames],
+                                workers or self.config['preload_workers'],
+                                pool or self.config['preload_pool'])
 
-        # Cache the file for later
-        self.save_to_cache(file_hash=encoded_hash, data=req)
-        return req
+        for filename, content in zip(filenames, contents):
+            if content:
+                self.preloaded[filename] = self.decode_response(content)
 
-    # Override
-    def cassette_name_for_httplib_connection(self, host, port, method,
-                                             url, body, headers):
-        """Create a cassette name from an httplib request."""
-        return CassetteName.from_httplib_connection(
-            host, port, method, url, body, headers, will_hash_body=True)
+        return len(filenames)
+
+    def get_all_available(self):
+        """Return all available cassette."""
+        if self.config['manifest']:
+            return self.manifest.filenames()
+
+        if self.config['layout'] == 'hashed':
+            # Skip the temporary files left by interrupted writes
+            return [filename for filename in walk_files(self.filename)
+                    if not os.path.basename(filename).startswith(TEMP_PREFIX)]
+
+        return [filename for filename in os.listdir(self.filename)
+                if filename != Manifest.FILENAME and
+                not filename.startswith(TEMP_PREFIX)]
+
+    def migrate_to_hashed_layout(self):
+        """Move the files of the flat layout to the hashed layout.
+
+        Files that do not match the encoder extension are left in place.
+        Every entry keeps a human-readable ``name``: the flat filename,
+        since the original name cannot be recovered from it. Update the
+        ``layout`` option to ``'hashed'`` afterwards.
+
+        :return: number of files moved.
+        """
+        extension = self.encoder.file_ext
+        moved = 0
+        for filename in os.listdir(self.filename):
+            path = os.path.join(self.filename, filename)
+            if not filename.endswith(extension) or not os.path.isfile(path):
+                continue
+
+            flat_name = filename[:-len(extension)]
+            new_filename = self.generate_hashed_filename(flat_name)
+            new_path = os.path.join(self.filename, new_filename)
+            dirname = os.path.dirname(new_path)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+
+            with open(path) as f:
+                entry = self.encoder.load(f.read())
+            if 'name' not in entry:
+                entry['name'] = flat_name.decode('utf-8')
+
+            # An interrupted migration never leaves a partial file
+            write_atomically(new_path, self.encoder.dump(entry))
+            os.remove(path)
+            moved += 1
+
+        if self.config['manifest']:
+            self.manifest.rebuild()
+
+        return moved
+
+
+class SqliteCassetteLibrary(CassetteLibrary):
+    """A CassetteLibrary that stores and manages requests in a SQLite
+    database.
+
+    Every lookup is a single query on the primary key, and bodies are stored
+    as BLOBs. The database uses write-ahead logging, so that several
+    processes can replay from it while another one records.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            name TEXT PRIMARY KEY,
+            status INTEGER,
+            reason TEXT,
+            version INTEGER,
+            length INTEGER,
+            headers TEXT,
+            raw_headers TEXT,
+            content BLOB,
+            content_digest TEXT
+        )
+    """
+
+    # Seconds to wait for the lock of another writer
+    TIMEOUT = 30
+
+    will_hash_body = True
+
+    def __init__(self, *args, **kwargs):
+        super(SqliteCassetteLibrary, self).__init__(*args, **kwargs)
+
+        self.data = {}
+        self.lock = threading.Lock()
+
+    @property
+    def connection(self):
+        """Lazily opened connection to the database."""
+        if not hasattr(self, "_connection"):
+            connection = sqlite3.connect(self.filename, timeout=self.TIMEOUT,
+                                         check_same_thread=False)
+            # Names and texts are byte strings
+            connection.text_factory = str
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(self.SCHEMA)
+            connection.commit()
+            self._connection = connection
+
+        return self._connection
+
+    def _execute(self, query, parameters=()):
+        with self.lock:
+            return self.connection.execute(query, parameters).fetchall()
+
+    def write_to_file(self):
+        """Write the responses recorded since the last write to the
+        database."""
+        rows = []
+        for cassette_name in self.dirty_names:
+            entry = self.encode_response(self.data[cassette_name])
+            content = entry.get('content')
+            rows.append((
+                cassette_name,
+                entry['status'],
+                entry['reason'],
+                entry['version'],
+                entry['length'],
+                json.dumps(entry['headers'], encoding=TEXT_ENCODING),
+                json.dumps(entry['raw_headers'], encoding=TEXT_ENCODING),
+                None if content is None else sqlite3.Binary(content),
+                entry.get('content_digest'),
+            ))
+
+        with self.lock:
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO responses VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+        self.dirty_names.clear()
+        self.is_dirty = False
+
+    def __contains__(self, cassette_name):
+        """Return whether or not the cassette already exists."""
+        contains = cassette_name in self.data
+        if not contains:
+            contains = bool(self._execute(
+                'SELECT 1 FROM responses WHERE name = ?', (cassette_name,)))
+
+        self._log_contains(cassette_name, contains)
+
+        return contains
+
+    def __getitem__(self, cassette_name):
+        """Return the request if it is in memory. Otherwise, query the
+        database."""
+        req = self.data.get(cassette_name)
+        if req is None:
+            req = self._load_request_from_database(cassette_name)
+            self.data[cassette_name] = req
+
+        # Responses are shared, every lookup gets its own cursor
+        return req.cursor()
+
+    def _load_request_from_database(self, cassette_name):
+        """Return the mocked response object stored in the database."""
+        rows = self._execute(
+            'SELECT status, reason, version, length, headers, raw_headers, '
+            'content, content_digest FROM responses WHERE name = ?',
+            (cassette_name,))
+        if not rows:
+            raise KeyError('Cassette %s does not exist in library.' %
+                           cassette_name)
+
+        self.log_cassette_used(cassette_name)
+
+        (status, reason, version, length, headers, raw_headers, content,
+         content_digest) = rows[0]
+        data = {
+            'status': status,
+            'reason': reason,
+            'version': version,
+            'length': length,
+            'headers': JsonEncoder.json_str_decode_dict(
+                json.loads(headers, TEXT_ENCODING)),
+            'raw_headers': JsonEncoder.json_str_decode_list(
+                json.loads(raw_headers, TEXT_ENCODING)),
+        }
+        if content_digest is None:
+            data['content'] = str(content)
+        else:
+            data['content_digest'] = content_digest
+
+        return self.decode_response(data)
 
     def get_all_available(self):
         """Return all available cassette."""
-        return os.listdir(self.filename)
+        return [name for name, in self._execute('SELECT name FROM responses')]
@@ -3,3 +3,51 @@ class Config(dict):
     def __init__(self):
         # Defaults
         self['log_cassette_used'] = False
+        # Append new responses to a journal next to single-file libraries
+        # instead of rewriting the whole file (see
+        # FileCassetteLibrary.compact)
+        self['journal'] = False
+        # Keep a manifest of the files of directory libraries to avoid
+        # hitting the filesystem for every lookup
+        self['manifest'] = False
+        # File layout of directory libraries: 'flat' names files after the
+        # cassette name, 'hashed' uses fixed-length hashed filenames sharded
+        # over two levels of subdirectories
+        self['layout'] = 'flat'
+        # Directory of a content-addressed store, shared across libraries,
+        # holding the response bodies of at least blob_threshold bytes
+        self['blob_store'] = None
+        self['blob_threshold'] = 64 * 1024
+        # Directory of an on-disk cache of decoded files, shared across
+        # processes, and its maximum size in bytes
+        self['snapshot_dir'] = None
+        self['snapshot_max_bytes'] = 512 * 1024 * 1024
+        # Publish decoded files in memory-mapped files shared by the
+        # processes of the host, in shared_cache_dir (defaults to a directory
+        # in /dev/shm), capped to shared_cache_max_bytes when processes exit
+        self['shared_cache'] = False
+        self['shared_cache_dir'] = None
+        self['shared_cache_max_bytes'] = 1024 * 1024 * 1024
+        # Tee the bodies of recorded responses into a spool as they are
+        # read, kept in memory up to spool_threshold bytes then in a
+        # temporary file moved into the blob store when written. None
+        # buffers the whole body in memory.
+        self['spool_threshold'] = None
+        # Rules deciding which requests share the same cassette name (see
+        # cassette.matcher.Matcher)
+        self['matcher'] = None
+        # Responses loaded by the player before the first request: True for
+        # all of them, or a list of cassette names. Directory libraries load
+        # them in a pool of preload_workers threads or processes
+        # (preload_pool is 'thread' or 'process').
+        self['preload'] = False
+        self['preload_workers'] = 8
+        self['preload_pool'] = 'thread'
+        # Directory libraries encode and write the recorded responses in a
+        # pool of flush_workers threads or processes (flush_pool is 'thread'
+        # or 'process').
+        self['flush_workers'] = 8
+        self['flush_pool'] = 'thread'
+        # Response kept when another process recorded the same cassette name
+        # into a single-file library: 'ours' or 'theirs'.
+        self['merge_conflicts'] = 'ours'
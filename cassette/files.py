@@ -0,0 +1,82 @@
+"""
+    files.py
+
+    Helpers for the files written by cassette.
+"""
+import os
+import tempfile
+
+# Prefix of the temporary files written before being renamed into place
+TEMP_PREFIX = '.cassette-tmp-'
+
+
+def _read_umask():
+    """Return the umask of the process."""
+    # The umask can only be read by setting it
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Permissions open() gives to new files, read before any thread records.
+# Temporary files are created private and given them before being renamed
+# into place.
+FILE_MODE = 0666 & ~_read_umask()
+
+
+def create_temp_file(dirname):
+    """Create an empty temporary file in the directory, with the permissions
+    open() would give it, and return its path."""
+    fd, temp_path = tempfile.mkstemp(dir=dirname or os.curdir,
+                                     prefix=TEMP_PREFIX)
+    os.close(fd)
+    os.chmod(temp_path, FILE_MODE)
+    return temp_path
+
+
+def write_atomically(path, content):
+    """Write the content to a temporary file next to the path, then rename
+    it into place, so that readers never see a partial file."""
+    temp_path = create_temp_file(os.path.dirname(path))
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        os.rename(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def evict_least_recently_used(paths, max_bytes):
+    """Remove the least recently modified files until their total size is
+    at most ``max_bytes``, and return the total size of the files left.
+
+    Files removed by other processes in the meantime are skipped.
+    """
+    files = []
+    total_bytes = 0
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+
+        files.append((stat.st_mtime, stat.st_size, path))
+        total_bytes += stat.st_size
+
+    files.sort()
+    for _, size, path in files:
+        if total_bytes <= max_bytes:
+            break
+
+        # Processes that mapped the file keep their mapping
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total_bytes -= size
+
+    return total_bytes
@@ -13,16 +13,42 @@ from httplib import HTTPConnection, HTTPSConnection
 
 import semver
 
+from cassette.request_body import StreamedBody, is_streamed
+
 log = logging.getLogger("cassette")
 
 
 class CassetteConnectionMixin(object):
     _delete_sock_when_returning_from_library = False
+    # Library of the connection, instead of the active one of the thread
+    _cassette_library = None
+
+    def _get_cassette_library(self):
+        """Return the library handling the requests of the connection."""
+        if self._cassette_library is not None:
+            return self._cassette_library
+
+        # Imported here since the patcher imports the connections
+        from cassette.patcher import current_library
+        return current_library()
 
     def request(self, method, url, body=None, headers=None):
         """Send HTTP request."""
 
-        lib = self._cassette_library
+        lib = self._active_library = self._get_cassette_library()
+        if lib is None:
+            # No cassette in this thread, e.g. a thread started by the code
+            # under test that was not routed with push_library
+            log.warning("Making external HTTP request from a thread without "
+                        "cassette: %s %s%s" % (method, self.host, url))
+            return self._baseclass.request(self, method, url, body,
+                                           headers or {})
+
+        if is_streamed(body):
+            # Hash the body in chunks. It can still be sent if the library
+            # does not have the response.
+            body = StreamedBody(body)
+
         self._cassette_name = lib.cassette_name_for_httplib_connection(
             host=self.host,
             port=self.port,
@@ -33,6 +59,8 @@ class CassetteConnectionMixin(object):
         )
         if self._cassette_name in lib:
             self._response = lib[self._cassette_name]
+            if isinstance(body, StreamedBody):
+                body.close()
 
             if self._delete_sock_when_returning_from_library:
                 if hasattr(self, 'sock') and self.sock is None:
@@ -41,7 +69,11 @@ class CassetteConnectionMixin(object):
             return
 
         log.warning("Making external HTTP request: %s" % self._cassette_name)
-        self._baseclass.request(self, method, url, body, headers or {})
+        try:
+            self._baseclass.request(self, method, url, body, headers or {})
+        finally:
+            if isinstance(body, StreamedBody):
+                body.close()
 
     def getresponse(self, buffering=False):
         """Return HTTP response."""
@@ -52,8 +84,10 @@ class CassetteConnectionMixin(object):
         if hasattr(self, "_response"):
             return self._response
 
-        lib = self._cassette_library
+        lib = getattr(self, '_active_library', None)
         response = self._baseclass.getresponse(self)
+        if lib is None:
+            return response
 
         # If we were just returning the response here, the file
         # descriptor would be at the end of the file, and read() would
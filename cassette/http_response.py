@@ -1,15 +1,157 @@
 import cStringIO
 import io
+import mmap
+import zlib
 from httplib import HTTPMessage
 
 from cassette.mocked_response import MockedResponse
 
 
+def _intern(value):
+    """Intern byte strings so that identical header names and values are
+    shared across responses."""
+    if type(value) is str:
+        return intern(value)
+
+    return value
+
+
+def content_decompressor(headers):
+    """Return a decompressor for the content encoding of the headers, or
+    None if the content is not compressed."""
+    encoding = headers.get('content-encoding', '').lower()
+    if encoding == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        return zlib.decompressobj()
+
+    return None
+
+
+def iter_chunks(read, chunk_size, decompressor=None):
+    """Yield the chunks returned by ``read`` until the content is exhausted.
+
+    :param callable read: takes the maximum number of bytes to return.
+    :param int chunk_size: number of bytes to read at a time.
+    :param decompressor: ``zlib`` decompression object applied to the
+        chunks, if any.
+    """
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        if chunk:
+            yield chunk
+
+    if decompressor is not None:
+        chunk = decompressor.flush()
+        if chunk:
+            yield chunk
+
+
 class MockedHTTPResponse(MockedResponse):
+    """Recorded HTTP response.
+
+    Responses stored in a library are shared by every replay of the request
+    and must not be modified: use :meth:`cursor` to get an object to read
+    from.
+    """
 
     attrs = ("headers", "content", "status", "reason", "raw_headers", "length",
              "version")
 
+    # There can be tens of thousands of responses per library: keep the
+    # attributes in slots. Clients such as urllib2 set their own attributes
+    # (e.g. recv) on replayed responses, so keep a __dict__, which is only
+    # allocated when they do.
+    __slots__ = ("headers", "status", "reason", "raw_headers", "length",
+                 "version", "content_digest", "_content", "_blob_store",
+                 "_fp", "_msg", "_closed", "spool", "__dict__")
+
+    def __init__(self):
+        # Set when the content lives in a blob store (see BlobStore)
+        self.content_digest = None
+        self._content = None
+        self._blob_store = None
+        # The file descriptor and the message are only built when accessed
+        # (False means not built yet)
+        self._fp = False
+        self._msg = None
+        self._closed = False
+        # Set while the content is being recorded (see Spool)
+        self.spool = None
+
+    @property
+    def content(self):
+        """Response body, read from the spool or the blob store on first
+        access."""
+        if self._content is None:
+            if self.spool is not None:
+                self._content = self.spool.getvalue()
+            elif self.content_digest is not None:
+                self._content = self._blob_store.get(self.content_digest)
+
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+
+    @property
+    def body_is_mapped(self):
+        """Whether :attr:`body` returns a new memory map of the blob store,
+        to be closed by the caller."""
+        return (self._content is None and self.spool is None and
+                self.content_digest is not None)
+
+    @property
+    def body(self):
+        """Buffer holding the content.
+
+        Contents stored in a blob store are memory-mapped instead of being
+        read, so that they can be replayed in chunks without loading them
+        in memory. Every access maps them again: the caller closes the map
+        (see :attr:`body_is_mapped`), so that responses kept in the cache do
+        not hold file descriptors.
+        """
+        if self._content is None and self.spool is not None:
+            return self.spool.body()
+
+        if self._content is not None or self.content_digest is None:
+            return self._content
+
+        return self._blob_store.map(self.content_digest)
+
+    @property
+    def fp(self):
+        """File descriptor over the content, built on first access. None
+        once the response is closed."""
+        if self._closed:
+            return None
+
+        return self._get_fp()
+
+    def _get_fp(self):
+        if self._fp is False:
+            self._fp = self.create_file_descriptor(self.content)
+
+        return self._fp
+
+    @property
+    def msg(self):
+        """HTTPMessage holding the headers, built on first access."""
+        if self._msg is None:
+            msg = HTTPMessage(io.StringIO(unicode()), 0)
+            # Equivalent to calling addheader for every header
+            msg.dict = dict(self.headers)
+            msg.headers = self.raw_headers
+            self._msg = msg
+
+        return self._msg
+
     @classmethod
     def from_response(cls, response):
         """Create object from true response."""
@@ -26,28 +168,74 @@ class MockedHTTPResponse(MockedResponse):
         return cls.from_dict(d)
 
     @classmethod
-    def from_dict(cls, data):
-        """Create object from dict."""
+    def from_spool(cls, response, spool):
+        """Create object from true response, whose content is read through
+        the spool."""
+
+        obj = cls.from_dict({
+            "headers": dict(response.getheaders()),
+            "content": None,
+            "status": response.status,
+            "reason": response.reason,
+            "raw_headers": response.msg.headers,
+            "length": response.length,
+            "version": response.version,
+        })
+        obj.spool = spool
+        return obj
+
+    @classmethod
+    def from_dict(cls, data, blob_store=None):
+        """Create object from dict.
+
+        Header names and values are interned. The file descriptor and the
+        message are only built when they are first accessed.
+
+        :param BlobStore blob_store: store holding the content when the dict
+            references it by ``content_digest``. The content is then only
+            read when the response is read.
+        """
+
+        obj = cls()
+
+        if 'content_digest' in data:
+            obj.content_digest = data['content_digest']
+            obj._blob_store = blob_store
+            obj._content = None
+        else:
+            obj._content = data['content']
 
         # Hack to ensure backwards compatibility with older versions of the
         # that did not have the length and version attributes.
-        data.setdefault('length', len(data['content']))
-        data.setdefault('version', 10)
+        if 'length' in data:
+            obj.length = data['length']
+        else:
+            obj.length = len(data['content'])
+        obj.version = data.get('version', 10)
 
-        obj = cls()
+        obj.status = data['status']
+        obj.reason = _intern(data['reason'])
+        obj.headers = {_intern(k): _intern(v)
+                       for k, v in data['headers'].iteritems()}
+        obj.raw_headers = [_intern(h) for h in data['raw_headers']]
 
-        for k in cls.attrs:
-            setattr(obj, k, data[k])
+        return obj
 
-        obj.fp = cls.create_file_descriptor(obj.content)
+    def cursor(self):
+        """Return a new cursor to replay the response."""
+        return ResponseCursor(self)
 
-        obj.msg = HTTPMessage(io.StringIO(unicode()), 0)
-        for k, v in obj.headers.iteritems():
-            obj.msg.addheader(k, v)
+    def to_dict(self):
+        """Return dict representation.
 
-        obj.msg.headers = data["raw_headers"]
+        Contents stored in a blob store are referenced by their digest.
+        """
+        if self.content_digest is None:
+            return super(MockedHTTPResponse, self).to_dict()
 
-        return obj
+        data = {k: getattr(self, k) for k in self.attrs if k != 'content'}
+        data['content_digest'] = self.content_digest
+        return data
 
     @staticmethod
     def create_file_descriptor(content):
@@ -57,8 +245,19 @@ class MockedHTTPResponse(MockedResponse):
 
         return fp
 
-    def read(self, chunked=None):
-        return self.fp.read()
+    def read(self, amt=None):
+        # Closing the response does not prevent reading the rest of the
+        # content: responses are shared and clients (e.g. urllib2) may close
+        # one after it was rewound for the next request.
+        if amt is None:
+            return self._get_fp().read()
+
+        return self._get_fp().read(amt)
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
 
     def getheaders(self):
         return self.headers.items()
@@ -66,16 +265,169 @@ class MockedHTTPResponse(MockedResponse):
     def getheader(self, name):
         return self.headers.get(name)
 
-    def stream(self, chunk_size, decode_content):
-        yield self.read()
+    def stream(self, chunk_size=2 ** 16, decode_content=None):
+        """Yield the content read ``chunk_size`` bytes at a time,
+        decompressed if ``decode_content`` is true (decompressed chunks can
+        then be larger)."""
+        decompressor = None
+        if decode_content:
+            decompressor = content_decompressor(self.headers)
+
+        return iter_chunks(self.read, chunk_size, decompressor)
 
     def rewind(self):
-        self.fp = self.create_file_descriptor(self.content)
-        self.read = self.fp.read
+        # The file descriptor is built again on next access
+        self._fp = False
+        self._closed = False
         return self
 
     def close(self):
-        self.fp = None
+        self._closed = True
 
     def isclosed(self):
         return True
+
+
+class ResponseCursor(object):
+    """Read position over a shared :class:`MockedHTTPResponse`.
+
+    Every replay gets its own cursor, so that concurrent replays of the same
+    response do not interfere with each other. Reads slice the content of
+    the response directly, without copying it into a file object.
+
+    :param MockedHTTPResponse response: the response to replay.
+    """
+
+    # Clients such as urllib2 set their own attributes (e.g. recv) on
+    # replayed responses, so keep a __dict__, which is only allocated when
+    # they do.
+    __slots__ = ("response", "position", "_closed", "_body", "_owns_body",
+                 "__dict__")
+
+    def __init__(self, response):
+        self.response = response
+        self.position = 0
+        self._closed = False
+        # Content of the response, fetched on first read
+        self._body = None
+        self._owns_body = False
+
+    status = property(lambda self: self.response.status)
+    reason = property(lambda self: self.response.reason)
+    version = property(lambda self: self.response.version)
+    length = property(lambda self: self.response.length)
+    headers = property(lambda self: self.response.headers)
+    raw_headers = property(lambda self: self.response.raw_headers)
+    msg = property(lambda self: self.response.msg)
+    content = property(lambda self: self.response.content)
+    content_digest = property(lambda self: self.response.content_digest)
+
+    @property
+    def fp(self):
+        """The cursor itself, or None once it is closed."""
+        return None if self._closed else self
+
+    def read(self, amt=None):
+        # Closing the cursor does not prevent reading the rest of the
+        # content, like with httplib responses whose fp was already read.
+        body = self._get_body()
+        start = self.position
+        if start >= len(body):
+            return ''
+        if amt is None:
+            end = len(body)
+        else:
+            end = min(start + amt, len(body))
+
+        self.position = end
+        if start == 0 and end == len(body) and isinstance(body, str):
+            # Avoid copying the whole content
+            return body
+
+        data = body[start:end]
+        if end == len(body) and self._owns_body:
+            self._release_body()
+            # Reads past the end return nothing without mapping it again
+            self._body = ''
+        return data
+
+    def _get_body(self):
+        if self._body is None:
+            self._owns_body = self.response.body_is_mapped
+            self._body = self.response.body
+
+        return self._body
+
+    def _release_body(self):
+        """Close the memory map of the content, if the cursor mapped it. It
+        is mapped again if the cursor is read again."""
+        if self._owns_body:
+            if isinstance(self._body, mmap.mmap):
+                self._body.close()
+            self._body = None
+            self._owns_body = False
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def getheaders(self):
+        return self.response.getheaders()
+
+    def getheader(self, name):
+        return self.response.getheader(name)
+
+    def stream(self, chunk_size=2 ** 16, decode_content=None):
+        """Yield the content read ``chunk_size`` bytes at a time,
+        decompressed if ``decode_content`` is true (decompressed chunks can
+        then be larger)."""
+        decompressor = None
+        if decode_content:
+            decompressor = content_decompressor(self.headers)
+
+        return iter_chunks(self.read, chunk_size, decompressor)
+
+    def rewind(self):
+        self._release_body()
+        self._body = None
+        self.position = 0
+        self._closed = False
+        return self
+
+    def to_dict(self):
+        """Return dict representation of the response."""
+        return self.response.to_dict()
+
+    def close(self):
+        self._release_body()
+        self._closed = True
+
+    def isclosed(self):
+        """Return whether the cursor was closed or its content read, like
+        httplib responses do (clients such as urllib3 stream the content
+        until then)."""
+        return self._closed or self.position >= len(self._get_body())
+
+
+class RecordingCursor(ResponseCursor):
+    """Cursor of the client recording a response: reads go through the
+    spool, which tees them from the upstream response."""
+
+    __slots__ = ()
+
+    def read(self, amt=None):
+        return self.response.spool.read(amt)
+
+    def rewind(self):
+        raise IOError('Responses being recorded cannot be rewound.')
+
+    def isclosed(self):
+        spool = self.response.spool
+        return self._closed or (spool.done and spool.position >= spool.size)
+
+    def close(self):
+        # Clients closing the response early would otherwise leave the
+        # recorded body truncated
+        self.response.spool.drain()
+        super(RecordingCursor, self).close()
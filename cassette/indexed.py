@@ -0,0 +1,145 @@
+"""
+    indexed.py
+
+    Lazily decoded responses backed by an indexed, memory-mapped file (see
+    IndexedEncoder and JsonLinesEncoder).
+"""
+import logging
+import mmap
+import os
+
+log = logging.getLogger("cassette")
+
+
+class IndexedResponses(object):
+    """Dict-like mapping of cassette names to lazily decoded responses.
+
+    Entries stay encoded in the memory-mapped file until they are requested
+    through ``__getitem__``. Responses that are set afterwards are kept in
+    memory and take precedence over the entries of the file. Entries merged
+    from another file are kept encoded as well.
+
+    :param buf: buffer holding the encoded file (usually an ``mmap``).
+    :param Encoder encoder: the indexed encoder that wrote the buffer.
+    :param callable encode: turns a response into an entry to encode.
+    :param callable decode: turns a decoded entry into a response.
+    :param dict index: index of the buffer, loaded from it by default.
+    """
+
+    def __init__(self, buf, encoder, encode, decode, index=None):
+        self.buf = buf
+        self.encoder = encoder
+        self.encode = encode
+        self.decode = decode
+        if index is None:
+            index = encoder.load_index(buf)
+        self.index = index
+        self.responses = {}
+        self.added = set()
+        # Entries merged from another file, by name
+        self.merged = {}
+
+    @classmethod
+    def open(cls, filename, encoder, encode, decode):
+        """Return the responses of an indexed file, mapped read-only.
+
+        Only the entries written before a truncated file was cut are kept.
+        The next write rewrites the file with a complete index.
+        """
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # Empty files cannot be mapped
+                buf = ''
+
+        try:
+            index = encoder.load_index(buf)
+        except ValueError as e:
+            try:
+                index = encoder.recover_index(buf)
+            except ValueError:
+                if isinstance(buf, mmap.mmap):
+                    buf.close()
+                raise
+            log.warning("Ignoring truncated entries of '%s': %s", filename, e)
+
+        return cls(buf, encoder, encode, decode, index)
+
+    def close(self):
+        """Release the underlying buffer."""
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+
+    def __contains__(self, name):
+        return (name in self.responses or name in self.merged or
+                name in self.index)
+
+    def __getitem__(self, name):
+        response = self.responses.get(name)
+        if response is None:
+            buf, offset, length = self._locate(name)
+            entry = self.encoder.load_entry(buf, offset, length)
+            response = self.responses[name] = self.decode(entry)
+
+        return response
+
+    def _locate(self, name):
+        """Return the buffer, offset and length of an encoded entry."""
+        encoded = self.merged.get(name)
+        if encoded is not None:
+            return encoded, 0, len(encoded)
+
+        offset, length = self.index[name]
+        return self.buf, offset, length
+
+    def __setitem__(self, name, response):
+        self.responses[name] = response
+        self.added.add(name)
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(set(self.index).union(self.merged, self.responses))
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def iter_encoded(self):
+        """Yield ``(name, encoded_entry)`` tuples for every response.
+
+        Entries that were not replaced since the file was opened are copied
+        over as they are, without being decoded.
+        """
+        for name in self.keys():
+            yield name, self.encoded_entry(name)
+
+    def encoded_entry(self, name):
+        """Return the encoded entry of a response."""
+        if name in self.added:
+            return self.encoder.dump_entry(name,
+                                           self.encode(self.responses[name]))
+
+        buf, offset, length = self._locate(name)
+        return buf[offset:offset + length]
+
+    def merge_entry(self, name, encoded):
+        """Replace a response with an entry encoded by another file, unless
+        they are the same. The entry is only decoded when requested."""
+        if name not in self.added and name in self:
+            if self.encoded_entry(name) == encoded:
+                return
+
+        self.merged[name] = encoded
+        self.responses.pop(name, None)
+        self.added.discard(name)
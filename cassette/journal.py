@@ -0,0 +1,66 @@
+"""
+    journal.py
+
+    Append-only journal of recorded responses.
+
+    Each record is self-delimiting: a header holding the length and the CRC32
+    checksum of the payload, followed by the marshalled ``(name, entry)``
+    payload.
+"""
+import logging
+import marshal
+import struct
+import zlib
+
+log = logging.getLogger("cassette")
+
+RECORD_HEADER = struct.Struct('>II')
+
+
+def _checksum(payload):
+    return zlib.crc32(payload) & 0xffffffff
+
+
+def append_records(filename, records):
+    """Append records to the journal.
+
+    :param str filename: path to the journal.
+    :param records: iterable of ``(name, entry)`` tuples.
+    """
+    chunks = []
+    for record in records:
+        payload = marshal.dumps(record)
+        chunks.append(RECORD_HEADER.pack(len(payload), _checksum(payload)))
+        chunks.append(payload)
+
+    with open(filename, 'ab') as f:
+        f.write(''.join(chunks))
+
+
+def read_records(filename):
+    """Yield the ``(name, entry)`` records of the journal in order.
+
+    Reading stops at the first truncated or corrupted record (e.g. after an
+    interrupted write), since the records following it cannot be delimited.
+
+    :param str filename: path to the journal.
+    """
+    with open(filename, 'rb') as f:
+        content = f.read()
+
+    offset = 0
+    while offset < len(content):
+        header = content[offset:offset + RECORD_HEADER.size]
+        if len(header) < RECORD_HEADER.size:
+            log.warning("Truncated record in journal '%s'.", filename)
+            return
+
+        length, checksum = RECORD_HEADER.unpack(header)
+        start = offset + RECORD_HEADER.size
+        payload = content[start:start + length]
+        if len(payload) < length or _checksum(payload) != checksum:
+            log.warning("Corrupted record in journal '%s'.", filename)
+            return
+
+        yield marshal.loads(payload)
+        offset = start + length
@@ -0,0 +1,53 @@
+"""
+    locking.py
+
+    Advisory locks held by the processes writing the same files.
+"""
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Without locks, concurrent writers are not serialized
+    fcntl = None
+
+
+@contextmanager
+def locked(path):
+    """Hold an exclusive advisory lock on the path.
+
+    The lock is taken on a ``.lock`` file next to the path, so that the path
+    itself can be replaced while the lock is held. The lock file is removed
+    when the lock is released. Locks are not reentrant.
+
+    :param str path: path to the locked file.
+    """
+    if not fcntl:
+        yield
+        return
+
+    lock_path = path + '.lock'
+    while True:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0666)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            locked_inode = os.stat(lock_path).st_ino
+        except OSError:
+            locked_inode = None
+        if locked_inode == os.fstat(fd).st_ino:
+            break
+
+        # The previous holder removed the lock file while we waited for it
+        os.close(fd)
+
+    try:
+        yield
+    finally:
+        # Remove the file before releasing the lock, so that waiters notice
+        # it and lock a new file
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+        os.close(fd)
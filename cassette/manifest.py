@@ -0,0 +1,286 @@
+"""
+    manifest.py
+
+    On-disk manifest of the files stored in a directory library.
+
+    The first line of the manifest is a JSON header holding the modification
+    times of the directory and of its subdirectories when the manifest was
+    written and a bloom filter of the filenames. Every following line is a
+    JSON ``[filename, size, mtime, hash]`` entry. The header alone answers
+    lookups for missing files; the entries are only read when a lookup might
+    hit or when all the filenames are needed.
+"""
+import base64
+import hashlib
+import json
+import logging
+import math
+import os
+import struct
+
+log = logging.getLogger("cassette")
+
+
+class BloomFilter(object):
+    """Compact probabilistic set of strings.
+
+    Lookups can return false positives, but never false negatives.
+
+    :param int size: number of bits in the filter.
+    :param int hash_count: number of bits set per item.
+    :param bytearray bits: existing bits of the filter.
+    """
+
+    def __init__(self, size, hash_count, bits=None):
+        self.size = size
+        self.hash_count = hash_count
+        self.bits = bits or bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01):
+        """Return an empty filter sized for the number of items."""
+        capacity = max(capacity, 1)
+        size = int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        hash_count = int(round(size / float(capacity) * math.log(2)))
+        return cls(max(size, 64), max(hash_count, 1))
+
+    def _positions(self, item):
+        if isinstance(item, unicode):
+            item = item.encode('utf-8')
+
+        # Double hashing: derive all the positions from two hashes
+        first, second = struct.unpack('>QQ', hashlib.md5(item).digest())
+        for i in xrange(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, item):
+        return all(self.bits[position // 8] & (1 << (position % 8))
+                   for position in self._positions(item))
+
+    def to_dict(self):
+        """Return dict representation."""
+        return {
+            'size': self.size,
+            'hash_count': self.hash_count,
+            'bits': base64.b64encode(str(self.bits)),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create object from dict."""
+        return cls(data['size'], data['hash_count'],
+                   bytearray(base64.b64decode(data['bits'])))
+
+
+def _parent_directories(filename):
+    """Yield the directories holding the relative path, innermost first,
+    except the top-level one."""
+    dirname = os.path.dirname(filename)
+    while dirname:
+        yield dirname
+        dirname = os.path.dirname(dirname)
+
+
+def walk_files(directory):
+    """Yield the path, relative to the directory, of every file in the
+    directory and its subdirectories, except the manifest."""
+    for dirpath, _, filenames in os.walk(directory):
+        relative_dirpath = os.path.relpath(dirpath, directory)
+        for filename in filenames:
+            if relative_dirpath == os.curdir:
+                if filename == Manifest.FILENAME:
+                    continue
+                yield filename
+            else:
+                yield os.path.join(relative_dirpath, filename)
+
+
+def _file_hash(path):
+    m = hashlib.md5()
+    with open(path, 'rb') as f:
+        m.update(f.read())
+    return m.hexdigest()
+
+
+class Manifest(object):
+    """Manifest of the files of a directory library.
+
+    Use :meth:`load` to get an up-to-date manifest.
+
+    :param str directory: path to the directory library.
+    """
+
+    FILENAME = '.cassette-manifest'
+    VERSION = 2
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, self.FILENAME)
+        self.bloom = BloomFilter.for_capacity(0)
+        self._entries = {}
+        # Subdirectories, relative to the directory
+        self.subdirectories = set()
+
+    @classmethod
+    def load(cls, directory):
+        """Return the manifest of the directory.
+
+        The manifest is rebuilt from the directory content when it is
+        missing, unreadable or stale, i.e. when the directory or one of its
+        subdirectories was modified after (or during the same clock tick as)
+        the manifest was written.
+        """
+        manifest = cls(directory)
+        if not os.path.isdir(directory):
+            return manifest
+
+        try:
+            fresh = manifest.read_header()
+        except (IOError, OSError, ValueError, KeyError):
+            fresh = False
+
+        if not fresh:
+            log.info("Rebuilding manifest of '%s'.", directory)
+            manifest.rebuild()
+
+        return manifest
+
+    def read_header(self):
+        """Read the header of the manifest and return whether it is fresh."""
+        with open(self.path) as f:
+            header = json.loads(f.readline())
+            manifest_mtime = os.fstat(f.fileno()).st_mtime
+
+        if header['version'] != self.VERSION:
+            return False
+
+        # Files added to a subdirectory only modify the subdirectory
+        dir_mtimes = header['dir_mtimes']
+        for dirname, dir_mtime in dir_mtimes.iteritems():
+            path = os.path.join(self.directory, dirname)
+            if (os.stat(path).st_mtime != dir_mtime or
+                    dir_mtime >= manifest_mtime):
+                return False
+
+        self.subdirectories = set(dirname.encode('utf-8')
+                                  for dirname in dir_mtimes if dirname)
+        self.bloom = BloomFilter.from_dict(header['bloom'])
+        # Entries are read on demand
+        self._entries = None
+        return True
+
+    @property
+    def entries(self):
+        """Dict mapping filenames to ``(size, mtime, hash)`` tuples."""
+        if self._entries is None:
+            self._entries = {}
+            with open(self.path) as f:
+                f.readline()  # Skip the header
+                for line in f:
+                    filename, size, mtime, file_hash = json.loads(line)
+                    # Filenames are handled as bytes, like os.listdir does
+                    filename = filename.encode('utf-8')
+                    self._entries[filename] = (size, mtime, file_hash)
+
+        return self._entries
+
+    def __contains__(self, filename):
+        return filename in self.bloom and filename in self.entries
+
+    def filenames(self):
+        """Return all the filenames of the directory."""
+        return self.entries.keys()
+
+    def update(self, filename, file_hash=None):
+        """Record a file that was just written.
+
+        :param str filename: name of the file, relative to the directory.
+        :param str file_hash: hex digest of the file content, computed if
+            not given.
+        """
+        path = os.path.join(self.directory, filename)
+        stat = os.stat(path)
+        if file_hash is None:
+            file_hash = _file_hash(path)
+        self.entries[filename] = (stat.st_size, stat.st_mtime, file_hash)
+        self.bloom.add(filename)
+        self.subdirectories.update(_parent_directories(filename))
+
+    def rebuild(self):
+        """Rebuild the manifest from the content of the directory.
+
+        Hashes of files whose size and modification time did not change are
+        reused from the previous manifest.
+        """
+        self._entries = None
+        try:
+            previous = self.entries
+        except (IOError, OSError, ValueError):
+            previous = {}
+
+        entries = {}
+        self.subdirectories = set(
+            os.path.relpath(dirpath, self.directory)
+            for dirpath, _, _ in os.walk(self.directory)
+            if dirpath != self.directory)
+        for filename in walk_files(self.directory):
+            path = os.path.join(self.directory, filename)
+            stat = os.stat(path)
+            size, mtime = stat.st_size, stat.st_mtime
+            old = previous.get(filename)
+            if old and old[:2] == (size, mtime):
+                file_hash = old[2]
+            else:
+                file_hash = _file_hash(path)
+            entries[filename] = (size, mtime, file_hash)
+
+        self._entries = entries
+        self.reset_bloom()
+        try:
+            self.save()
+        except (IOError, OSError) as e:
+            # e.g. read-only fixtures; the manifest still works in memory
+            log.warning("Could not save manifest of '%s': %s",
+                        self.directory, e)
+
+    def reset_bloom(self):
+        """Rebuild the bloom filter, sized for the current entries."""
+        self.bloom = BloomFilter.for_capacity(len(self.entries))
+        for filename in self.entries:
+            self.bloom.add(filename)
+
+    def save(self):
+        """Write the manifest to the directory."""
+        self.reset_bloom()
+
+        dir_mtimes = {
+            dirname: os.stat(os.path.join(self.directory, dirname)).st_mtime
+            for dirname in self.subdirectories}
+        dir_mtimes[''] = os.stat(self.directory).st_mtime
+        self._write(dir_mtimes)
+
+        # Creating the manifest modifies the directory itself. Overwriting an
+        # existing file in place does not, so write it again with the final
+        # modification time.
+        new_dir_mtime = os.stat(self.directory).st_mtime
+        if new_dir_mtime != dir_mtimes['']:
+            dir_mtimes[''] = new_dir_mtime
+            self._write(dir_mtimes)
+
+    def _write(self, dir_mtimes):
+        header = {
+            'version': self.VERSION,
+            'dir_mtimes': dir_mtimes,
+            'bloom': self.bloom.to_dict(),
+        }
+        lines = [json.dumps(header)]
+        for filename, (size, mtime, file_hash) in self.entries.iteritems():
+            lines.append(json.dumps([filename, size, mtime, file_hash]))
+
+        with open(self.path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
@@ -0,0 +1,184 @@
+"""
+    matcher.py
+
+    Rules deciding which requests share the same cassette name.
+"""
+import hashlib
+import json
+import urllib
+from urlparse import parse_qsl, urlsplit, urlunsplit
+
+from cassette.cache import LRUCache
+from cassette.request_body import StreamedBody
+
+# Fields of a request that can be matched on
+FIELDS = ('method', 'host', 'port', 'path', 'query', 'headers', 'body')
+# Bodies larger than this many bytes are kept in the memo as a digest
+MEMO_BODY_SIZE = 1024
+
+
+class Matcher(object):
+    """Compute cassette names from httplib requests.
+
+    Without options, names are the ones of
+    :meth:`CassetteName.from_httplib_connection`. Options make requests that
+    only differ in irrelevant ways share the same name:
+
+    - ``ignore_headers``: names of headers left out of the name (e.g.
+      ``['Date', 'User-Agent']``).
+    - ``normalize_headers``: dict mapping header names to a function
+      returning the value to use in the name.
+    - ``canonicalize_query``: sort the query parameters.
+    - ``canonicalize_json``: decode JSON bodies and encode them again with
+      sorted keys and no whitespace.
+    - ``match_on``: subset of :data:`FIELDS` the name depends on.
+
+    Header names are case-insensitive. Names are memoized, so that repeated
+    identical requests are only normalized and hashed once.
+
+    :param dict options: matching rules.
+    :param bool will_hash_body: see
+        :meth:`CassetteName.from_httplib_connection`.
+    :param int memo_size: number of names memoized.
+    """
+
+    def __init__(self, options=None, will_hash_body=False, memo_size=1024):
+        options = options or {}
+        unknown = set(options) - set(['ignore_headers', 'normalize_headers',
+                                      'canonicalize_query',
+                                      'canonicalize_json', 'match_on'])
+        if unknown:
+            raise ValueError('Unknown matcher options: %s' %
+                             ', '.join(sorted(unknown)))
+
+        match_on = options.get('match_on', FIELDS)
+        unknown = set(match_on) - set(FIELDS)
+        if unknown:
+            raise ValueError('Cannot match on: %s' %
+                             ', '.join(sorted(unknown)))
+
+        # Compile the rules once
+        self.ignore_headers = frozenset(
+            h.lower() for h in options.get('ignore_headers', ()))
+        self.normalize_headers = dict(
+            (h.lower(), f)
+            for h, f in options.get('normalize_headers', {}).iteritems())
+        self.canonicalize_query = options.get('canonicalize_query', False)
+        self.canonicalize_json = options.get('canonicalize_json', False)
+        self.match_on = frozenset(match_on)
+        self.will_hash_body = will_hash_body
+        self.memo = LRUCache(max_entries=memo_size)
+
+    def cassette_name(self, host, port, method, url, body, headers):
+        """Return the cassette name of an httplib request."""
+        try:
+            memo_key = (host, port, method, url, memo_body(body),
+                        tuple(sorted(headers.iteritems())) if headers
+                        else headers)
+            name = self.memo.get(memo_key)
+        except TypeError:
+            # Unhashable body (e.g. a file object)
+            memo_key = name = None
+
+        if name is None:
+            name = self.compute_name(host, port, method, url, body, headers)
+            if memo_key is not None:
+                self.memo.put(memo_key, name)
+
+        return name
+
+    def compute_name(self, host, port, method, url, body, headers):
+        """Return the cassette name of an httplib request, without
+        memoization."""
+        # Imported here since the library imports the matcher
+        from cassette.cassette_library import CassetteName
+
+        if headers:
+            headers = self.filter_headers(headers)
+        if url and self.canonicalize_query:
+            url = canonicalize_query(url)
+        if body and self.canonicalize_json:
+            body = canonicalize_json(body)
+
+        match_on = self.match_on
+        if 'method' not in match_on:
+            method = ''
+        if 'host' not in match_on:
+            host = ''
+        if 'port' not in match_on:
+            port = ''
+        if url and not match_on.issuperset(('path', 'query')):
+            url = filter_url(url, 'path' in match_on, 'query' in match_on)
+        if 'headers' not in match_on:
+            headers = None
+        if 'body' not in match_on:
+            body = None
+
+        return CassetteName.from_httplib_connection(
+            host, port, method, url, body, headers,
+            will_hash_body=self.will_hash_body)
+
+    def filter_headers(self, headers):
+        """Return a copy of the headers without the ignored ones, and with
+        normalized values."""
+        filtered = {}
+        for name, value in headers.iteritems():
+            lower_name = name.lower()
+            if lower_name in self.ignore_headers:
+                continue
+
+            normalize = self.normalize_headers.get(lower_name)
+            if normalize is not None:
+                value = normalize(value)
+            filtered[name] = value
+
+        return filtered
+
+
+def memo_body(body):
+    """Return the part of the memo key identifying the body.
+
+    Streamed bodies and large bodies are identified by their digest, so that
+    the memo does not keep them (and their spool) alive.
+    """
+    if isinstance(body, StreamedBody):
+        return StreamedBody, body.hexdigest
+
+    if isinstance(body, basestring) and len(body) > MEMO_BODY_SIZE:
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+        return hashlib, hashlib.md5(body).digest()
+
+    return body
+
+
+def canonicalize_query(url):
+    """Return the URL with its query parameters sorted."""
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+
+    query = urllib.urlencode(sorted(parse_qsl(parts.query,
+                                              keep_blank_values=True)))
+    return urlunsplit(parts._replace(query=query))
+
+
+def canonicalize_json(body):
+    """Return the JSON body with sorted keys and no whitespace, or the body
+    itself if it is not JSON."""
+    if not isinstance(body, basestring):
+        return body
+
+    try:
+        decoded = json.loads(body)
+    except ValueError:
+        return body
+
+    return json.dumps(decoded, sort_keys=True, separators=(',', ':'))
+
+
+def filter_url(url, keep_path, keep_query):
+    """Return the URL without its path or its query string."""
+    parts = urlsplit(url)
+    return urlunsplit(parts._replace(path=parts.path if keep_path else '/',
+                                     query=parts.query if keep_query else ''))
@@ -2,6 +2,8 @@
 
 class MockedResponse(object):
 
+    __slots__ = ()
+
     def to_dict(self):
         """Return dict representation."""
 
@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 
 import httplib
+import threading
 
 try:
     import requests
@@ -19,32 +20,105 @@ unpatched_HTTPSConnection = httplib.HTTPSConnection
 if requests:
     unpatched_requests_HTTPConnection = requests.packages.urllib3.connection.HTTPConnection
     unpatched_requests_HTTPSConnection = requests.packages.urllib3.connection.HTTPSConnection
+    unpatched_requests_HTTPConnectionPool_ConnectionCls = \
+        requests.packages.urllib3.connectionpool.HTTPConnectionPool.ConnectionCls
+    unpatched_requests_HTTPSConnectionPool_ConnectionCls = \
+        requests.packages.urllib3.connectionpool.HTTPSConnectionPool.ConnectionCls
+
+# Stack of the libraries used by the current thread
+_routing = threading.local()
+# Libraries active in any thread. The standard library stays patched while
+# there is one. Threads without a library of their own reach the network.
+_active = []
+_lock = threading.Lock()
+
+
+def _thread_stack():
+    stack = getattr(_routing, 'stack', None)
+    if stack is None:
+        stack = _routing.stack = []
+    return stack
+
+
+def current_library():
+    """Return the library handling the requests of the current thread, or
+    None if they should reach the network."""
+    stack = getattr(_routing, 'stack', None)
+    if stack:
+        return stack[-1]
+
+    return None
+
+
+def push_library(cassette_library):
+    """Route the requests of the current thread to the library (or to the
+    network if None), until :func:`pop_library` is called.
+
+    Threads started by the code under test have no library: push the one of
+    the test to replay their requests too.
+    """
+    _thread_stack().append(cassette_library)
+
+
+def pop_library():
+    """Restore the library previously used by the current thread."""
+    return _thread_stack().pop()
 
 
 def patch(cassette_library):
+    """Route the requests of the current thread to the library.
+
+    The standard library is only patched when no other library is active,
+    so that activating a library is cheap and libraries of other threads are
+    left untouched.
+    """
+    with _lock:
+        if not _active:
+            _patch()
+        _active.append(cassette_library)
+
+    push_library(cassette_library)
+
+
+def unpatch(cassette_library=None):
+    """Stop routing requests to the library, by default the last one of the
+    current thread.
+
+    The standard library is unpatched when no library is active anymore.
+    """
+    stack = _thread_stack()
+    if cassette_library is None and stack:
+        cassette_library = stack[-1]
+    if cassette_library in stack:
+        # Remove the last occurrence
+        del stack[len(stack) - 1 - stack[::-1].index(cassette_library)]
+
+    with _lock:
+        if cassette_library in _active:
+            del _active[len(_active) - 1 - _active[::-1].index(
+                cassette_library)]
+        if not _active:
+            _unpatch()
+
+
+def _patch():
     """Replace standard library."""
 
     # Inspired by vcrpy
 
-    CassetteHTTPConnection._cassette_library = cassette_library
-    CassetteHTTPSConnection._cassette_library = cassette_library
-
     httplib.HTTPConnection = CassetteHTTPConnection
     httplib.HTTP._connection_class = CassetteHTTPConnection
     httplib.HTTPSConnection = CassetteHTTPSConnection
     httplib.HTTPS._connection_class = CassetteHTTPSConnection
 
     if requests:
-        UL3CassetteHTTPConnection._cassette_library = cassette_library
-        UL3CassetteHTTPSConnection._cassette_library = cassette_library
-
         requests.packages.urllib3.connectionpool.HTTPConnectionPool.ConnectionCls = \
             UL3CassetteHTTPConnection
         requests.packages.urllib3.connectionpool.HTTPSConnectionPool.ConnectionCls = \
             UL3CassetteHTTPSConnection
 
 
-def unpatch():
+def _unpatch():
     """Unpatch standard library."""
 
     # Inspired by vcrpy
@@ -59,3 +133,7 @@ def unpatch():
             unpatched_requests_HTTPConnection
         requests.packages.urllib3.connection.HTTPSConnection = \
             unpatched_requests_HTTPSConnection
+        requests.packages.urllib3.connectionpool.HTTPConnectionPool.ConnectionCls = \
+            unpatched_requests_HTTPConnectionPool_ConnectionCls
+        requests.packages.urllib3.connectionpool.HTTPSConnectionPool.ConnectionCls = \
+            unpatched_requests_HTTPSConnectionPool_ConnectionCls
@@ -9,20 +9,35 @@ class Player(object):
     def __init__(self, path, file_format='', config=None):
         self.library = CassetteLibrary.create_new_cassette_library(
             path, file_format, config)
+        self.preloaded = False
 
     def play(self):
         """Return contextenv."""
         return self
 
+    def preload(self, names=None):
+        """Load responses before the requests are made.
+
+        :param list names: cassette names to load, defaults to all.
+        """
+        return self.library.preload(names)
+
     def __enter__(self):
+        preload = self.library.config['preload']
+        if preload and not self.preloaded:
+            self.preload(None if preload is True else preload)
+            self.preloaded = True
+
         patch(self.library)
 
     def __exit__(self, exc_type, exc_value, tb):
-        # If the cassette items have changed, save the changes to file
-        if self.library.is_dirty:
-            self.library.write_to_file()
-        # Remove our overrides
-        unpatch()
+        try:
+            # If the cassette items have changed, save the changes to file
+            if self.library.is_dirty:
+                self.library.write_to_file()
+        finally:
+            # Stop routing this thread's requests to the library
+            unpatch(self.library)
 
     def report_unused_cassettes(self, output=sys.stdout):
         """Report unused cassettes to file."""
@@ -0,0 +1,117 @@
+"""
+    request_body.py
+
+    Request bodies streamed from file-like objects or iterables.
+"""
+import hashlib
+import tempfile
+from array import array
+
+# Number of bytes read at a time from file-like bodies
+CHUNK_SIZE = 64 * 1024
+# Number of bytes of non-seekable bodies kept in memory before spilling to
+# a temporary file
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def is_streamed(body):
+    """Return whether the body is a file-like object or an iterable of
+    chunks, rather than a buffer."""
+    if body is None or isinstance(body, (basestring, bytearray, array,
+                                         buffer, memoryview)):
+        return False
+
+    return hasattr(body, 'read') or hasattr(body, '__iter__')
+
+
+def _tell(fp):
+    """Return the position of the file, or None if it cannot seek."""
+    try:
+        position = fp.tell()
+        fp.seek(position)
+    except (AttributeError, IOError, OSError):
+        return None
+
+    return position
+
+
+def _iter_file(fp, chunk_size):
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+class StreamedBody(object):
+    """Request body hashed in chunks, without being held in memory.
+
+    Seekable files are read once to compute the digest, then seeked back so
+    that the request can still send them. Other bodies (non-seekable files,
+    generators, ...) are copied into a spool, kept in memory up to
+    ``max_size`` bytes then in a temporary file, and sent from it.
+
+    Streamed bodies compare equal when their contents are equal.
+
+    :param body: file-like object or iterable of byte strings.
+    :param int chunk_size: number of bytes read at a time from files.
+    :param int max_size: number of bytes spooled in memory.
+    """
+
+    def __init__(self, body, chunk_size=CHUNK_SIZE, max_size=SPOOL_MAX_SIZE):
+        md5 = hashlib.md5()
+        self.length = 0
+
+        if hasattr(body, 'read'):
+            chunks = _iter_file(body, chunk_size)
+            position = _tell(body)
+        else:
+            chunks = iter(body)
+            position = None
+
+        spool = None
+        if position is None:
+            spool = tempfile.SpooledTemporaryFile(max_size=max_size)
+
+        for chunk in chunks:
+            md5.update(chunk)
+            self.length += len(chunk)
+            if spool is not None:
+                spool.write(chunk)
+
+        if spool is None:
+            body.seek(position)
+            self.fp = body
+        else:
+            spool.seek(0)
+            self.fp = spool
+        self.spool = spool
+
+        self.hexdigest = md5.hexdigest()
+
+    def read(self, amt=None):
+        """Read the body to send it."""
+        return self.fp.read() if amt is None else self.fp.read(amt)
+
+    def close(self):
+        """Remove the spool, once the body is sent or not needed anymore.
+
+        Seekable files are left open for their owner.
+        """
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+        self.fp = None
+
+    def __len__(self):
+        return self.length
+
+    def __eq__(self, other):
+        return (isinstance(other, StreamedBody) and
+                other.hexdigest == self.hexdigest)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.hexdigest)
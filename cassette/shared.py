@@ -0,0 +1,145 @@
+"""
+    shared.py
+
+    Decoded files published in memory-mapped files, so that the processes of
+    a host (e.g. pytest-xdist workers) decode each file once and share the
+    pages of the result.
+
+    The first process to need a file decodes it and publishes it with the
+    indexed encoder, under an exclusive lock. The others map the published
+    file read-only and decode each response on demand.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import tempfile
+
+from cassette.files import evict_least_recently_used, write_atomically
+from cassette.indexed import IndexedResponses
+from cassette.locking import locked
+from cassette.utils import IndexedEncoder
+
+log = logging.getLogger("cassette")
+
+# Maximum size of the directories this process published in, enforced when
+# it exits
+_directories_to_evict = {}
+
+
+def default_directory():
+    """Return the directory used to publish files, in shared memory when
+    available."""
+    root = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(root, 'cassette-%d' % os.getuid())
+
+
+def _evict_directories():
+    for directory, max_bytes in _directories_to_evict.items():
+        SharedCache(directory, max_bytes).evict()
+
+
+class SharedCache(object):
+    """Directory of published files.
+
+    Published files are named after the path and the stat signature of the
+    file they were decoded from, so that a modified file is published again.
+    The files published for a path are grouped in a subdirectory, and
+    publishing a file removes the ones previously published there.
+
+    Past ``max_bytes``, the least recently used files are removed when the
+    processes that published files exit.
+
+    :param str directory: path to the directory holding the published files.
+    :param int max_bytes: maximum total size of the published files.
+    """
+
+    # Bump when the content of the published files changes
+    VERSION = 2
+    EXTENSION = '.idx'
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+        self.encoder = IndexedEncoder()
+
+    def path(self, filename, signature):
+        """Return the path to the published file.
+
+        :param str filename: absolute path to the source file.
+        :param tuple signature: stat signature of the source file.
+        """
+        prefix = hashlib.sha1(filename).hexdigest()
+        key = hashlib.sha1(repr((self.VERSION, signature))).hexdigest()
+        return os.path.join(self.directory, prefix, key + self.EXTENSION)
+
+    def attach(self, filename, signature, build, encode, decode):
+        """Return the responses of the file, publishing them first if no
+        other process did.
+
+        :param str filename: absolute path to the source file.
+        :param tuple signature: stat signature of the source file.
+        :param callable build: returns the dict of entries to publish.
+        :param callable encode: see :class:`IndexedResponses`.
+        :param callable decode: see :class:`IndexedResponses`.
+        """
+        path = self.path(filename, signature)
+        if os.path.exists(path):
+            # The modification time tracks the last use for eviction
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+        else:
+            self.publish(path, build)
+
+        return IndexedResponses.open(path, self.encoder, encode, decode)
+
+    def publish(self, path, build):
+        """Publish the entries returned by ``build`` unless another process
+        already did."""
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # Created by another process
+                pass
+
+        with locked(path):
+            if os.path.exists(path):
+                return
+
+            # Other processes never map a partial file
+            write_atomically(path, self.encoder.dump(build()))
+
+        self.remove_outdated(path)
+
+        if self.max_bytes is not None:
+            if not _directories_to_evict:
+                atexit.register(_evict_directories)
+            _directories_to_evict[self.directory] = self.max_bytes
+
+    def remove_outdated(self, path):
+        """Remove the files previously published for the same source file.
+
+        Processes that mapped them keep their mapping.
+        """
+        dirname = os.path.dirname(path)
+        for filename in os.listdir(dirname):
+            other = os.path.join(dirname, filename)
+            # Leave the temporary files and the locks of other processes
+            # alone
+            if other != path and filename.endswith(self.EXTENSION):
+                try:
+                    os.remove(other)
+                except OSError:
+                    pass
+
+    def evict(self):
+        """Remove the least recently used files past the size cap."""
+        published = [os.path.join(dirpath, filename)
+                     for dirpath, _, filenames in os.walk(self.directory)
+                     for filename in filenames
+                     if filename.endswith(self.EXTENSION)]
+        evict_least_recently_used(published, self.max_bytes)
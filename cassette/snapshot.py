@@ -0,0 +1,111 @@
+"""
+    snapshot.py
+
+    On-disk cache of decoded cassette files, shared across processes.
+
+    A snapshot holds the content of a cassette file as the encoder loaded it,
+    stored with the binary encoder so that loading it skips the text decode.
+    Snapshots are named after the hash of the source file content, the
+    source format and the snapshot format version, so that they never need
+    to be invalidated: a modified file simply maps to another snapshot.
+"""
+import hashlib
+import logging
+import os
+
+from cassette.files import evict_least_recently_used, write_atomically
+from cassette.utils import BinaryEncoder
+
+log = logging.getLogger("cassette")
+
+
+class SnapshotCache(object):
+    """Directory of snapshots, bounded in size.
+
+    Past ``max_bytes``, the least recently used snapshots are removed. The
+    directory is only scanned on the first write and when the running total
+    of the sizes crosses the cap, so the cap is approximate when several
+    processes write snapshots.
+
+    :param str directory: path to the directory holding the snapshots.
+    :param int max_bytes: maximum total size of the snapshots.
+    """
+
+    # Bump when the content of the snapshots changes
+    VERSION = 1
+    EXTENSION = '.snap'
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.encoder = BinaryEncoder()
+        # Total size of the snapshots, known after the first scan
+        self.total_bytes = None
+
+    def key(self, file_hash, file_format):
+        """Return the key of the snapshot of a file.
+
+        :param str file_hash: digest of the content of the source file.
+        :param str file_format: extension of the source encoder.
+        """
+        return hashlib.sha1('%d:%s:%s' % (
+            self.VERSION, file_format, file_hash)).hexdigest()
+
+    def path(self, key):
+        """Return the path to the snapshot file for the key."""
+        return os.path.join(self.directory, key + self.EXTENSION)
+
+    def get(self, key):
+        """Return the content stored for the key, or None."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                encoded_str = f.read()
+            content = self.encoder.load(encoded_str)
+        except IOError:
+            return None
+        except (ValueError, EOFError, TypeError) as e:
+            log.warning("Ignoring corrupted snapshot '%s': %s", path, e)
+            return None
+
+        # The modification time tracks the last use for eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return content
+
+    def put(self, key, content):
+        """Store the content for the key."""
+        try:
+            encoded_str = self.encoder.dump(content)
+        except ValueError as e:
+            # e.g. YAML files holding objects unknown to marshal
+            log.info("Cannot snapshot content: %s", e)
+            return
+
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+
+            write_atomically(self.path(key), encoded_str)
+        except (IOError, OSError) as e:
+            # The snapshot is only an optimization
+            log.warning("Could not save snapshot in '%s': %s",
+                        self.directory, e)
+            return
+
+        if self.max_bytes is not None:
+            if self.total_bytes is not None:
+                self.total_bytes += len(encoded_str)
+            if self.total_bytes is None or self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Remove the least recently used snapshots past the size cap."""
+        snapshots = [os.path.join(self.directory, filename)
+                     for filename in os.listdir(self.directory)
+                     if filename.endswith(self.EXTENSION)]
+        self.total_bytes = evict_least_recently_used(snapshots,
+                                                     self.max_bytes)
@@ -0,0 +1,152 @@
+"""
+    spool.py
+
+    Body of a response being recorded, teed from the upstream response as it
+    is read.
+"""
+import cStringIO
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+
+from cassette.files import FILE_MODE
+
+# Number of bytes read at a time when draining the upstream response
+CHUNK_SIZE = 64 * 1024
+
+
+class Spool(object):
+    """Copy of the body of an upstream response.
+
+    Bytes read through the spool are kept in memory up to ``max_size`` bytes,
+    then in a temporary file. The digest of the content is computed as it is
+    read, so that the spool can be moved into a blob store without reading it
+    again.
+
+    :param source: upstream response, read with ``read([amt])``.
+    :param int max_size: number of bytes kept in memory.
+    :param str directory: directory of the temporary file, preferably on the
+        same filesystem as where the spool will be moved.
+    """
+
+    def __init__(self, source, max_size, directory=None):
+        self.source = source
+        self.max_size = max_size
+        self.directory = directory
+        self.buf = cStringIO.StringIO()
+        self.file = None
+        self.name = None
+        self.moved = False
+        self.size = 0
+        self.position = 0
+        self.done = False
+        self._sha1 = hashlib.sha1()
+        self._map = None
+
+    def __del__(self):
+        self.close()
+
+    def read(self, amt=None):
+        """Return the next bytes of the content.
+
+        Bytes that were already spooled (e.g. by :meth:`drain`) are read
+        from the spool, the following ones from the upstream response.
+        """
+        if self.position < self.size:
+            f = self.file or self.buf
+            f.seek(self.position)
+            data = f.read() if amt is None else f.read(amt)
+            f.seek(0, os.SEEK_END)
+            if amt is None:
+                data += self._pull(None)
+        else:
+            data = self._pull(amt)
+
+        self.position += len(data)
+        return data
+
+    def drain(self):
+        """Spool the rest of the upstream response."""
+        while not self.done:
+            self._pull(CHUNK_SIZE)
+
+    def digest(self):
+        """Return the SHA-1 digest of the whole content."""
+        self.drain()
+        return self._sha1.hexdigest()
+
+    def is_in_memory(self):
+        return self.file is None
+
+    def getvalue(self):
+        """Return the whole content as a string."""
+        self.drain()
+        if self.file is None:
+            return self.buf.getvalue()
+
+        self.file.seek(0)
+        content = self.file.read()
+        self.file.seek(0, os.SEEK_END)
+        return content
+
+    def body(self):
+        """Return a buffer holding the whole content: the content itself
+        when it is kept in memory, else a memory map of the file."""
+        if self.is_in_memory():
+            return self.getvalue()
+
+        self.drain()
+        if self._map is None:
+            self.file.flush()
+            self._map = mmap.mmap(self.file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+        return self._map
+
+    def move_to(self, path):
+        """Move the file of the spool, once complete, to the path."""
+        self.drain()
+        self.file.flush()
+        # The temporary file is only readable by its owner
+        os.chmod(self.name, FILE_MODE)
+        shutil.move(self.name, path)
+        self.name = path
+        self.moved = True
+
+    def close(self):
+        """Remove the temporary file, unless it was moved."""
+        if self.file is not None and not self.moved:
+            self.file.close()
+            try:
+                os.remove(self.name)
+            except OSError:
+                pass
+            self.file = None
+
+    def _pull(self, amt):
+        if self.done:
+            return ''
+
+        data = self.source.read() if amt is None else self.source.read(amt)
+        if amt is None or not data:
+            self.done = True
+        self._write(data)
+        return data
+
+    def _write(self, data):
+        self._sha1.update(data)
+        self.size += len(data)
+
+        if self.file is None and self.size > self.max_size:
+            # Spill to disk
+            if self.directory and not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            fd, self.name = tempfile.mkstemp(dir=self.directory,
+                                             prefix='.spool-')
+            self.file = os.fdopen(fd, 'w+b')
+            self.file.write(self.buf.getvalue())
+            self.buf = None
+
+        (self.file or self.buf).write(data)
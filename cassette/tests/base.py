@@ -1,9 +1,18 @@
+import os
 import unittest
 
 TEMPORARY_RESPONSES_FILENAME = "./cassette/tests/data/responses.temp"
 TEMPORARY_RESPONSES_DIRECTORY = "./cassette/tests/data/responsedir"
+TEMPORARY_RESPONSES_DATABASE = "./cassette/tests/data/responses.temp.db"
 TEMPORARY_RESPONSES_ROOT = "./cassette/tests/data/"
 
 
+def remove_file(filename):
+    """Remove a cassette file along with its journal."""
+    for path in (filename, filename + '.journal'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
 class TestCase(unittest.TestCase):
     pass
@@ -16,8 +16,10 @@ import mock
 
 import cassette
 from cassette.cassette_library import CassetteLibrary
-from cassette.tests.base import (TEMPORARY_RESPONSES_DIRECTORY,
-                                 TEMPORARY_RESPONSES_FILENAME, TestCase)
+from cassette.tests.base import (TEMPORARY_RESPONSES_DATABASE,
+                                 TEMPORARY_RESPONSES_DIRECTORY,
+                                 TEMPORARY_RESPONSES_FILENAME, TestCase,
+                                 remove_file)
 from cassette.tests.server.run import app
 
 IMAGE_FILENAME = "./cassette/tests/server/image.png"
@@ -106,8 +108,7 @@ class TestCassette(TestCase):
         self.had_response = patcher.start()
         self.addCleanup(patcher.stop)
 
-        if os.path.exists(self.filename):
-            os.remove(self.filename)
+        remove_file(self.filename)
 
     @classmethod
     def setUpClass(cls):
@@ -120,8 +121,7 @@ class TestCassette(TestCase):
             cls.server_thread.start()
 
     def tearDown(self):
-        if os.path.exists(self.filename):
-            os.remove(self.filename)
+        remove_file(self.filename)
 
     def check_urllib2_flow(self, url, expected_content=None,
                            allow_incomplete_match=False,
@@ -344,8 +344,92 @@ class TestCassetteJson(TestCassette):
         self.had_response = patcher.start()
         self.addCleanup(patcher.stop)
 
-        if os.path.exists(self.filename):
-            os.remove(self.filename)
+        remove_file(self.filename)
+
+
+class TestCassetteJsonLines(TestCassette):
+    """Perform the same test but in JSON Lines."""
+
+    def setUp(self):
+        self.filename = TEMPORARY_RESPONSES_FILENAME
+        self.file_format = 'jsonl'
+
+        # This is a dummy method that we use to check if cassette had
+        # the response.
+        patcher = mock.patch.object(CassetteLibrary, "_had_response")
+        self.had_response = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        remove_file(self.filename)
+
+
+class TestCassetteYamlStream(TestCassette):
+    """Perform the same test but in a YAML stream."""
+
+    def setUp(self):
+        self.filename = TEMPORARY_RESPONSES_FILENAME
+        self.file_format = 'yamls'
+
+        # This is a dummy method that we use to check if cassette had
+        # the response.
+        patcher = mock.patch.object(CassetteLibrary, "_had_response")
+        self.had_response = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        remove_file(self.filename)
+
+
+class TestCassetteIndexed(TestCassette):
+    """Perform the same test but in the indexed binary format."""
+
+    def setUp(self):
+        self.filename = TEMPORARY_RESPONSES_FILENAME
+        self.file_format = 'idx'
+
+        # This is a dummy method that we use to check if cassette had
+        # the response.
+        patcher = mock.patch.object(CassetteLibrary, "_had_response")
+        self.had_response = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        remove_file(self.filename)
+
+
+class TestCassetteCompressed(TestCassette):
+    """Perform the same test but in gzipped JSON."""
+
+    def setUp(self):
+        self.filename = TEMPORARY_RESPONSES_FILENAME
+        self.file_format = 'json.gz'
+
+        # This is a dummy method that we use to check if cassette had
+        # the response.
+        patcher = mock.patch.object(CassetteLibrary, "_had_response")
+        self.had_response = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        remove_file(self.filename)
+
+
+class TestCassetteSqlite(TestCassette):
+    """Perform the same test but with a SQLite database."""
+
+    def setUp(self):
+        self.filename = TEMPORARY_RESPONSES_DATABASE
+        self.file_format = ''
+
+        # This is a dummy method that we use to check if cassette had
+        # the response.
+        patcher = mock.patch.object(CassetteLibrary, "_had_response")
+        self.had_response = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.tearDown()
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.filename + suffix):
+                os.remove(self.filename + suffix)
 
 
 class TestCassetteDirectory(TestCassette):
@@ -386,6 +470,24 @@ class TestCassetteDirectoryJson(TestCassetteDirectory):
             shutil.rmtree(self.filename)
 
 
+class TestCassetteDirectoryCompressed(TestCassetteDirectory):
+    """Testing the whole flow with a temporary response directory in gzipped
+    json."""
+
+    def setUp(self):
+        self.filename = TEMPORARY_RESPONSES_DIRECTORY
+        self.file_format = 'json.gz'
+
+        # This is a dummy method that we use to check if cassette had
+        # the response.
+        patcher = mock.patch.object(CassetteLibrary, "_had_response")
+        self.had_response = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        if os.path.exists(self.filename) and os.path.isdir(self.filename):
+            shutil.rmtree(self.filename)
+
+
 class TestCassetteFile(TestCase):
     """Verify that cassette can read from an existing file. This is also
     the base test case for regression testing older versions of the schema.
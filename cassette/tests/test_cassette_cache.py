@@ -0,0 +1,182 @@
+import os
+import shutil
+import time
+
+import mock
+
+from cassette import cassette_library
+from cassette.cache import LRUCache
+from cassette.cassette_library import (CACHE_MAX_BYTES, CACHE_MAX_ENTRIES,
+                                       RACY_DELAY, CassetteLibrary)
+from cassette.tests.base import (TEMPORARY_RESPONSES_ROOT, TestCase,
+                                 remove_file)
+from cassette.tests.test_cassette_library import record
+
+
+class TestLRUCache(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        """Verify that the least recently used entry is evicted first."""
+        cache = LRUCache(max_entries=2)
+        cache.put('first', 1)
+        cache.put('second', 2)
+        self.assertEqual(cache.get('first'), 1)
+        cache.put('third', 3)
+
+        self.assertTrue('first' in cache)
+        self.assertFalse('second' in cache)
+        self.assertTrue('third' in cache)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_max_bytes(self):
+        """Verify that entries are evicted past the bytes budget."""
+        cache = LRUCache(max_bytes=100)
+        cache.put('first', 1, size=60)
+        cache.put('second', 2, size=30)
+        cache.put('first', 1, size=50)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats()['bytes'], 80)
+
+        cache.put('third', 3, size=40)
+        self.assertEqual(sorted(cache.entries), ['first', 'third'])
+        self.assertEqual(cache.stats()['bytes'], 90)
+
+        # Entries larger than the budget are not kept
+        cache.put('fourth', 4, size=200)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_counters(self):
+        cache = LRUCache()
+        cache.put('first', 1)
+        cache.get('first')
+        cache.get('second')
+        with self.assertRaises(KeyError):
+            cache['third']
+
+        self.assertEqual(cache.stats(), {
+            'hits': 1,
+            'misses': 2,
+            'evictions': 0,
+            'entries': 1,
+            'bytes': 0,
+        })
+
+        cache.clear()
+        self.assertEqual(cache.stats()['misses'], 0)
+
+    def test_resize(self):
+        cache = LRUCache()
+        for i in range(10):
+            cache.put(i, i)
+
+        cache.resize(max_entries=3)
+        self.assertEqual(list(cache.entries), [7, 8, 9])
+        self.assertEqual(cache.stats()['evictions'], 7)
+
+
+class TestCassetteLibraryCache(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.json')
+        self.addCleanup(self.clean_up)
+        CassetteLibrary.cache.clear()
+
+    def clean_up(self):
+        CassetteLibrary.cache.resize(max_entries=CACHE_MAX_ENTRIES,
+                                     max_bytes=CACHE_MAX_BYTES)
+        CassetteLibrary.cache.clear()
+        remove_file(self.filename)
+
+    def test_file_library(self):
+        """Verify that file libraries are loaded from the cache, sized after
+        the encoded file."""
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        record(lib, 'first', 'first content')
+        lib.write_to_file()
+
+        stats = CassetteLibrary.cache.stats()
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['bytes'], os.path.getsize(self.filename))
+
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertEqual(lib['first'].read(), 'first content')
+        self.assertEqual(CassetteLibrary.cache.stats()['hits'], 1)
+
+    def test_bounded(self):
+        """Verify that loading more files than the cache can hold evicts
+        the oldest ones."""
+        CassetteLibrary.cache.resize(max_entries=1)
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        record(lib, 'first', 'first content')
+        lib.write_to_file()
+
+        other = CassetteLibrary.create_new_cassette_library(
+            os.path.join(TEMPORARY_RESPONSES_ROOT, 'other.json'), '')
+        self.addCleanup(remove_file, other.filename)
+        record(other, 'second', 'second content')
+        other.write_to_file()
+
+        self.assertFalse(lib.filename in CassetteLibrary.cache)
+        self.assertTrue(other.filename in CassetteLibrary.cache)
+        self.assertEqual(CassetteLibrary.cache.stats()['evictions'], 1)
+
+    def test_stat_validation(self):
+        """Verify that files whose stat signature did not change are not read
+        again."""
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        record(lib, 'first', 'first content')
+        lib.write_to_file()
+        CassetteLibrary.cache.clear()
+
+        # Recently modified files are always hashed
+        with mock.patch('cassette.cassette_library._hash',
+                        wraps=cassette_library._hash) as hash_:
+            CassetteLibrary.create_new_cassette_library(self.filename, '').data
+            CassetteLibrary.create_new_cassette_library(self.filename, '').data
+        self.assertEqual(hash_.call_count, 2)
+
+        past = time.time() - RACY_DELAY - 1
+        os.utime(self.filename, (past, past))
+        with mock.patch('cassette.cassette_library._hash',
+                        wraps=cassette_library._hash) as hash_:
+            CassetteLibrary.create_new_cassette_library(self.filename, '').data
+            lib = CassetteLibrary.create_new_cassette_library(
+                self.filename, '')
+            self.assertEqual(lib['first'].read(), 'first content')
+        self.assertEqual(hash_.call_count, 1)
+
+        # Modifying the file invalidates the signature
+        with open(self.filename) as f:
+            content = f.read()
+        with open(self.filename, 'w') as f:
+            f.write(content.replace('first content', 'other content'))
+        os.utime(self.filename, (past + 1, past + 1))
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertEqual(lib['first'].read(), 'other content')
+
+
+class TestDirectoryCassetteLibraryCache(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmpdir')
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        if os.path.isdir(self.filename):
+            shutil.rmtree(self.filename)
+
+    def test_memoize_loaded_entries(self):
+        """Verify that entries are only loaded from disk once."""
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        record(lib, 'first', 'first content')
+        lib.write_to_file()
+
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        with mock.patch.object(lib, 'load_cached_file',
+                               wraps=lib.load_cached_file) as load:
+            self.assertEqual(lib['first'].read(), 'first content')
+            self.assertEqual(lib['first'].read(), 'first content')
+
+        self.assertEqual(load.call_count, 1)
+        self.assertFalse(lib.is_dirty)
@@ -0,0 +1,53 @@
+import os
+import shutil
+
+import mock
+
+from cassette.files import (FILE_MODE, evict_least_recently_used,
+                            write_atomically)
+from cassette.tests.base import TEMPORARY_RESPONSES_ROOT, TestCase
+
+DIRECTORY = os.path.join(TEMPORARY_RESPONSES_ROOT, 'files')
+
+
+class TestFiles(TestCase):
+
+    def setUp(self):
+        os.makedirs(DIRECTORY)
+        self.addCleanup(shutil.rmtree, DIRECTORY)
+
+    def test_write_atomically(self):
+        path = os.path.join(DIRECTORY, 'file')
+        write_atomically(path, 'content')
+
+        with open(path) as f:
+            self.assertEqual(f.read(), 'content')
+        self.assertEqual(os.stat(path).st_mode & 0777, FILE_MODE)
+        self.assertEqual(os.listdir(DIRECTORY), ['file'])
+
+    def test_interrupted_write(self):
+        """Verify that a failed write leaves the previous file intact and no
+        temporary file."""
+        path = os.path.join(DIRECTORY, 'file')
+        write_atomically(path, 'content')
+
+        with mock.patch('os.rename', side_effect=OSError):
+            self.assertRaises(OSError, write_atomically, path, 'new content')
+
+        with open(path) as f:
+            self.assertEqual(f.read(), 'content')
+        self.assertEqual(os.listdir(DIRECTORY), ['file'])
+
+    def test_evict_least_recently_used(self):
+        paths = []
+        for i in range(4):
+            path = os.path.join(DIRECTORY, 'file%d' % i)
+            write_atomically(path, 'x' * 10)
+            os.utime(path, (i, i))
+            paths.append(path)
+        missing = os.path.join(DIRECTORY, 'missing')
+
+        total_bytes = evict_least_recently_used(paths + [missing], 25)
+
+        self.assertEqual(total_bytes, 20)
+        self.assertEqual(sorted(os.listdir(DIRECTORY)), ['file2', 'file3'])
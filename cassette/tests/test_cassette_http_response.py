@@ -0,0 +1,247 @@
+import gzip
+import os
+import shutil
+import threading
+from cStringIO import StringIO
+
+from requests.packages.urllib3.response import HTTPResponse
+
+from cassette.blob_store import BlobStore
+from cassette.http_response import MockedHTTPResponse
+from cassette.tests.base import TEMPORARY_RESPONSES_ROOT, TestCase
+
+
+def response_dict(content='content'):
+    return {
+        'headers': {'content-type': 'text/plain',
+                    'content-length': str(len(content))},
+        'content': content,
+        'status': 200,
+        'reason': 'OK',
+        'raw_headers': ['Content-Type: text/plain\r\n',
+                        'Content-Length: %d\r\n' % len(content)],
+        'length': len(content),
+        'version': 11,
+    }
+
+
+class TestMockedHTTPResponse(TestCase):
+
+    def test_lazy_file_descriptor_and_message(self):
+        """Verify that the file descriptor and the message are only built
+        when accessed."""
+        response = MockedHTTPResponse.from_dict(response_dict())
+        self.assertEqual(response._fp, False)
+        self.assertEqual(response._msg, None)
+
+        self.assertEqual(response.read(), 'content')
+        self.assertEqual(response.msg.getheader('content-type'),
+                         'text/plain')
+        self.assertEqual(response.msg.headers[0],
+                         'Content-Type: text/plain\r\n')
+
+    def test_read_amt(self):
+        response = MockedHTTPResponse.from_dict(response_dict())
+        self.assertEqual(response.read(3), 'con')
+        self.assertEqual(response.read(), 'tent')
+
+        response.rewind()
+        self.assertEqual(response.read(), 'content')
+
+    def test_close(self):
+        """Verify that closed responses can still be read."""
+        response = MockedHTTPResponse.from_dict(response_dict())
+        response.close()
+        self.assertEqual(response.fp, None)
+        self.assertEqual(response.read(), 'content')
+
+        response.rewind()
+        self.assertNotEqual(response.fp, None)
+
+    def test_intern_headers(self):
+        """Verify that header names and values are shared across
+        responses."""
+        def build():
+            # Build new strings, as a decoder would
+            data = response_dict()
+            data['headers'] = {''.join(['content-', 'type']):
+                               ''.join(['text/', 'plain'])}
+            data['raw_headers'] = [''.join(['Content-Type: ', 'text/plain'])]
+            return data
+
+        first = MockedHTTPResponse.from_dict(build())
+        second = MockedHTTPResponse.from_dict(build())
+
+        (name, value), = first.headers.items()
+        (other_name, other_value), = second.headers.items()
+        self.assertTrue(name is other_name)
+        self.assertTrue(value is other_value)
+        self.assertTrue(first.raw_headers[0] is second.raw_headers[0])
+
+    def test_to_dict(self):
+        data = response_dict()
+        response = MockedHTTPResponse.from_dict(data)
+        self.assertEqual(response.to_dict(), data)
+        self.assertFalse(hasattr(response, 'content_type'))
+
+
+class TestResponseCursor(TestCase):
+
+    def test_independent_cursors(self):
+        """Verify that cursors over the same response do not interfere."""
+        response = MockedHTTPResponse.from_dict(response_dict())
+        first = response.cursor()
+        second = response.cursor()
+
+        self.assertEqual(first.read(3), 'con')
+        self.assertEqual(second.read(), 'content')
+        self.assertEqual(first.read(), 'tent')
+        self.assertEqual(first.read(), '')
+
+        first.rewind()
+        self.assertEqual(first.read(), 'content')
+
+    def test_zero_copy(self):
+        """Verify that reading the whole content does not copy it."""
+        response = MockedHTTPResponse.from_dict(response_dict())
+        self.assertTrue(response.cursor().read() is response.content)
+
+    def test_attributes(self):
+        response = MockedHTTPResponse.from_dict(response_dict())
+        cursor = response.cursor()
+        self.assertEqual(cursor.status, 200)
+        self.assertEqual(cursor.getheader('content-type'), 'text/plain')
+        self.assertTrue(cursor.msg is response.msg)
+        self.assertEqual(cursor.to_dict(), response.to_dict())
+
+        # Clients can set their own attributes
+        cursor.recv = cursor.read
+        self.assertFalse(hasattr(response.cursor(), 'recv'))
+
+    def test_close(self):
+        cursor = MockedHTTPResponse.from_dict(response_dict()).cursor()
+        self.assertTrue(cursor.fp is cursor)
+        cursor.close()
+        self.assertEqual(cursor.fp, None)
+        self.assertEqual(cursor.read(), 'content')
+
+    def test_concurrent_replays(self):
+        """Verify that threads replaying the same response read the whole
+        content."""
+        content = 'x' * 100000
+        response = MockedHTTPResponse.from_dict(response_dict(content))
+        results = []
+
+        def replay():
+            cursor = response.cursor()
+            chunks = []
+            while True:
+                chunk = cursor.read(100)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            results.append(''.join(chunks))
+
+        threads = [threading.Thread(target=replay) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [content] * 8)
+
+
+def gzip_content(content):
+    buf = StringIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(content)
+    return buf.getvalue()
+
+
+class TestStreaming(TestCase):
+
+    def setUp(self):
+        self.blob_directory = os.path.join(TEMPORARY_RESPONSES_ROOT, 'blobs')
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        if os.path.isdir(self.blob_directory):
+            shutil.rmtree(self.blob_directory)
+
+    def test_stream_chunks(self):
+        """Verify that the content is streamed in chunks of chunk_size."""
+        response = MockedHTTPResponse.from_dict(response_dict('x' * 10))
+        for replay in (response, response.cursor()):
+            self.assertEqual(list(replay.stream(4)), ['xxxx', 'xxxx', 'xx'])
+
+    def test_stream_decode_content(self):
+        """Verify that compressed contents are only decompressed when
+        decode_content is true."""
+        content = 'hello world' * 100
+        data = response_dict(gzip_content(content))
+        data['headers']['content-encoding'] = 'gzip'
+        cursor = MockedHTTPResponse.from_dict(data).cursor()
+
+        self.assertEqual(''.join(cursor.stream(16, decode_content=True)),
+                         content)
+        cursor.rewind()
+        self.assertEqual(''.join(cursor.stream(16)), data['content'])
+
+    def test_urllib3_stream(self):
+        """Verify that urllib3 streams the whole content of a cursor."""
+        content = 'x' * 100000
+        cursor = MockedHTTPResponse.from_dict(response_dict(content)).cursor()
+        self.assertFalse(cursor.isclosed())
+
+        response = HTTPResponse.from_httplib(cursor, preload_content=False)
+        self.assertEqual(''.join(response.stream(1024)), content)
+        self.assertTrue(cursor.isclosed())
+
+    def test_readinto(self):
+        response = MockedHTTPResponse.from_dict(response_dict())
+        for replay in (response, response.cursor()):
+            b = bytearray(4)
+            self.assertEqual(replay.readinto(b), 4)
+            self.assertEqual(b, bytearray('cont'))
+            self.assertEqual(replay.readinto(b), 3)
+            self.assertEqual(b[:3], bytearray('ent'))
+            self.assertEqual(replay.readinto(b), 0)
+
+    def test_mapped_body(self):
+        """Verify that contents of a blob store are read from a memory
+        map."""
+        store = BlobStore(self.blob_directory)
+        digest = store.put('large content')
+        data = response_dict()
+        del data['content']
+        data['content_digest'] = digest
+        response = MockedHTTPResponse.from_dict(data, store)
+
+        cursor = response.cursor()
+        self.assertEqual(list(cursor.stream(5)), ['large', ' cont', 'ent'])
+        self.assertEqual(response._content, None)
+        self.assertEqual(response.cursor().read(), 'large content')
+
+    def test_mapped_body_is_closed(self):
+        """Verify that cursors close the memory map of the content once it
+        is read or the cursor is closed."""
+        store = BlobStore(self.blob_directory)
+        digest = store.put('large content')
+        data = response_dict()
+        del data['content']
+        data['content_digest'] = digest
+        response = MockedHTTPResponse.from_dict(data, store)
+
+        cursor = response.cursor()
+        self.assertEqual(cursor.read(5), 'large')
+        body = cursor._body
+        self.assertEqual(cursor.read(), ' content')
+        self.assertRaises(ValueError, body.read, 1)
+        self.assertEqual(cursor.read(), '')
+
+        cursor.rewind()
+        self.assertEqual(cursor.read(5), 'large')
+        body = cursor._body
+        cursor.close()
+        self.assertRaises(ValueError, body.read, 1)
+        self.assertEqual(cursor.read(), ' content')
@@ -1,13 +1,24 @@
+import multiprocessing
 import os
+import shutil
 
 import mock
 
+from cassette.blob_store import BlobStore
 from cassette.cassette_library import (CassetteLibrary,
                                        DirectoryCassetteLibrary,
-                                       FileCassetteLibrary)
+                                       FileCassetteLibrary,
+                                       IndexedFileCassetteLibrary,
+                                       SqliteCassetteLibrary)
+from cassette.config import Config
+from cassette.files import FILE_MODE
+from cassette.http_response import MockedHTTPResponse, ResponseCursor
+from cassette.journal import read_records
 from cassette.tests.base import (TEMPORARY_RESPONSES_FILENAME,
-                                 TEMPORARY_RESPONSES_ROOT, TestCase)
-from cassette.utils import JsonEncoder, YamlEncoder
+                                 TEMPORARY_RESPONSES_ROOT, TestCase,
+                                 remove_file)
+from cassette.utils import (CompressedEncoder, IndexedEncoder, JsonEncoder,
+                            YamlEncoder)
 
 BAD_DIRECTORY = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.json')
 BAD_FILE = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp')
@@ -23,6 +34,569 @@ class TestFileCassetteLibrary(TestCase):
         self.assertEqual(mock_load.called, False)
 
 
+def make_response(content):
+    """Return a mocked response with the given content."""
+    return MockedHTTPResponse.from_dict({
+        'headers': {'content-length': str(len(content))},
+        'content': content,
+        'status': 200,
+        'reason': 'OK',
+        'raw_headers': ['Content-Length: %d\r\n' % len(content)],
+    })
+
+
+def record(lib, cassette_name, content):
+    """Record a mocked response in the library as add_response would."""
+    lib.data[cassette_name] = make_response(content)
+    lib.dirty_names.add(cassette_name)
+    lib.is_dirty = True
+
+
+class TestLibraryCursors(TestCase):
+
+    def test_lookup_returns_cursor(self):
+        """Verify that every lookup returns a new cursor over the shared
+        response."""
+        lib = FileCassetteLibrary(TEMPORARY_RESPONSES_FILENAME, JsonEncoder())
+        lib.data['first'] = make_response('first content')
+
+        first = lib['first']
+        second = lib['first']
+        self.assertTrue(isinstance(first, ResponseCursor))
+        self.assertFalse(first is second)
+        self.assertTrue(first.response is second.response)
+        self.assertEqual(first.read(), 'first content')
+        self.assertEqual(second.read(), 'first content')
+
+
+class TestFileCassetteLibraryJournal(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.json')
+        self.addCleanup(self.clean_up)
+
+        lib = self.create_library()
+        record(lib, 'first', 'first content')
+        lib.dump_to_file()
+
+    def clean_up(self):
+        remove_file(self.filename)
+
+    def create_library(self):
+        config = Config()
+        config['journal'] = True
+        return CassetteLibrary.create_new_cassette_library(
+            self.filename, '', config)
+
+    def test_write_appends_to_journal(self):
+        """Verify that only new responses are appended to the journal."""
+        with open(self.filename) as f:
+            base_content = f.read()
+
+        lib = self.create_library()
+        record(lib, 'second', 'second content')
+        lib.write_to_file()
+        self.assertFalse(lib.is_dirty)
+
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), base_content)
+        records = list(read_records(lib.journal_filename))
+        self.assertEqual([name for name, _ in records], ['second'])
+
+        lib = self.create_library()
+        self.assertEqual(lib['first'].read(), 'first content')
+        self.assertEqual(lib['second'].read(), 'second content')
+
+    def test_corrupted_record_is_ignored(self):
+        """Verify that a torn write only loses the incomplete record."""
+        lib = self.create_library()
+        record(lib, 'second', 'second content')
+        lib.write_to_file()
+        record(lib, 'third', 'third content')
+        lib.write_to_file()
+
+        with open(lib.journal_filename, 'rb+') as f:
+            f.truncate(os.path.getsize(lib.journal_filename) - 1)
+
+        lib = self.create_library()
+        self.assertTrue('second' in lib)
+        self.assertFalse('third' in lib)
+
+    def test_compact(self):
+        """Verify that compaction folds the journal into the file."""
+        lib = self.create_library()
+        record(lib, 'second', 'second content')
+        lib.write_to_file()
+
+        lib = self.create_library()
+        lib.compact()
+        self.assertFalse(os.path.exists(lib.journal_filename))
+
+        lib = self.create_library()
+        self.assertEqual(sorted(lib.get_all_available()), ['first', 'second'])
+
+    def test_rewrite_removes_journal(self):
+        """Verify that responses of the journal do not replace the ones of a
+        later rewrite of the file."""
+        lib = self.create_library()
+        record(lib, 'first', 'old content')
+        lib.write_to_file()
+
+        CassetteLibrary.cache.clear()
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        record(lib, 'first', 'new content')
+        lib.write_to_file()
+        self.assertFalse(os.path.exists(lib.journal_filename))
+        self.assertEqual(lib['first'].read(), 'new content')
+
+        CassetteLibrary.cache.clear()
+        lib = self.create_library()
+        self.assertEqual(lib['first'].read(), 'new content')
+
+
+class TestIndexedFileCassetteLibraryJournal(TestFileCassetteLibraryJournal):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.idx')
+        self.addCleanup(self.clean_up)
+
+        lib = self.create_library()
+        record(lib, 'first', 'first content')
+        lib.dump_to_file()
+
+
+def record_in_process(filename, cassette_name):
+    """Record a response from another process."""
+    lib = CassetteLibrary.create_new_cassette_library(filename, '')
+    record(lib, cassette_name, cassette_name + ' content')
+    lib.write_to_file()
+
+
+class TestFileCassetteLibraryMerge(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.json')
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        remove_file(self.filename)
+        CassetteLibrary.cache.clear()
+
+    def create_library(self, merge_conflicts='ours'):
+        config = Config()
+        config['merge_conflicts'] = merge_conflicts
+        return CassetteLibrary.create_new_cassette_library(
+            self.filename, '', config)
+
+    def read_contents(self):
+        CassetteLibrary.cache.clear()
+        lib = self.create_library()
+        return dict((name, lib[name].read()) for name in lib.data)
+
+    def test_merge_concurrent_writes(self):
+        """Verify that responses written by another library since the file
+        was loaded are kept."""
+        first = self.create_library()
+        second = self.create_library()
+        record(first, 'first', 'first content')
+        record(second, 'second', 'second content')
+        first.write_to_file()
+        second.write_to_file()
+
+        self.assertEqual(self.read_contents(), {
+            'first': 'first content',
+            'second': 'second content',
+        })
+
+    def check_conflict(self, merge_conflicts, expected_content):
+        first = self.create_library()
+        second = self.create_library(merge_conflicts)
+        record(first, 'name', 'first content')
+        record(second, 'name', 'second content')
+        first.write_to_file()
+        second.write_to_file()
+
+        self.assertEqual(self.read_contents(), {'name': expected_content})
+
+    def test_conflict_ours(self):
+        self.check_conflict('ours', 'second content')
+
+    def test_conflict_theirs(self):
+        self.check_conflict('theirs', 'first content')
+
+    def test_unsupported_merge_policy(self):
+        first = self.create_library()
+        second = self.create_library('mine')
+        record(first, 'first', 'first content')
+        record(second, 'second', 'second content')
+        first.write_to_file()
+        self.assertRaises(ValueError, second.write_to_file)
+
+    def test_merge_indexed_file(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.idx')
+        first = self.create_library()
+        second = self.create_library()
+        record(first, 'first', 'first content')
+        record(second, 'second', 'second content')
+        first.write_to_file()
+        second.write_to_file()
+
+        self.assertEqual(self.read_contents(), {
+            'first': 'first content',
+            'second': 'second content',
+        })
+
+    def test_merge_indexed_file_without_decoding(self):
+        """Verify that entries merged from an indexed file are copied over
+        without being decoded."""
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.idx')
+        first = self.create_library()
+        record(first, 'first', 'first content')
+        first.write_to_file()
+
+        second = self.create_library()
+        second.data
+        third = self.create_library()
+        record(third, 'third', 'third content')
+        third.write_to_file()
+
+        record(second, 'second', 'second content')
+        with mock.patch.object(second.encoder, 'load_entry') as load_entry:
+            second.write_to_file()
+
+        self.assertFalse(load_entry.called)
+        self.assertEqual(self.read_contents(), {
+            'first': 'first content',
+            'second': 'second content',
+            'third': 'third content',
+        })
+
+    def test_processes(self):
+        """Verify that processes recording into the same file do not lose
+        each other's responses."""
+        names = ['name%d' % i for i in range(4)]
+        processes = [multiprocessing.Process(target=record_in_process,
+                                             args=(self.filename, name))
+                     for name in names]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        self.assertEqual(sorted(self.read_contents()), names)
+
+    def test_lock_file_is_removed(self):
+        lib = self.create_library()
+        record(lib, 'name', 'content')
+        lib.write_to_file()
+
+        self.assertFalse(os.path.exists(self.filename + '.lock'))
+
+
+class TestFileCassetteLibraryAppendable(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.yamls')
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        remove_file(self.filename)
+
+    def test_write_appends_to_file(self):
+        """Verify that new responses are appended to the file."""
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        record(lib, 'first', 'first content')
+        lib.write_to_file()
+        with open(self.filename) as f:
+            first_content = f.read()
+
+        record(lib, 'second', 'second content')
+        lib.write_to_file()
+        with open(self.filename) as f:
+            self.assertTrue(f.read().startswith(first_content))
+
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertEqual(lib['first'].read(), 'first content')
+        self.assertEqual(lib['second'].read(), 'second content')
+
+    def test_append_after_torn_write(self):
+        """Verify that responses appended after a torn write are kept."""
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        record(lib, 'first', 'first content')
+        record(lib, 'second', 'second content')
+        lib.write_to_file()
+        with open(self.filename, 'r+b') as f:
+            f.truncate(os.path.getsize(self.filename) - 10)
+
+        CassetteLibrary.cache.clear()
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        record(lib, 'third', 'third content')
+        lib.write_to_file()
+
+        CassetteLibrary.cache.clear()
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertEqual(len(lib.get_all_available()), 2)
+        self.assertEqual(lib['third'].read(), 'third content')
+
+
+class TestFileCassetteLibraryJsonLines(TestFileCassetteLibraryAppendable):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.jsonl')
+        self.addCleanup(self.clean_up)
+
+    def test_lazy_decoding(self):
+        """Verify that only the requested lines are parsed."""
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        record(lib, 'first', 'first content')
+        record(lib, 'second', 'second content')
+        lib.write_to_file()
+
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertTrue(isinstance(lib, IndexedFileCassetteLibrary))
+        with mock.patch.object(lib.encoder, 'load_entry',
+                               wraps=lib.encoder.load_entry) as load_entry:
+            self.assertTrue('first' in lib)
+            self.assertEqual(lib['second'].read(), 'second content')
+
+        self.assertEqual(load_entry.call_count, 1)
+
+
+class TestIndexedFileCassetteLibrary(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.idx')
+        self.addCleanup(self.clean_up)
+
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        lib.data['first'] = make_response('first content')
+        lib.data['second'] = make_response('second content')
+        lib.write_to_file()
+
+    def clean_up(self):
+        remove_file(self.filename)
+
+    def test_lazy_decoding(self):
+        """Verify that entries are only decoded when requested."""
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertTrue(isinstance(lib, IndexedFileCassetteLibrary))
+
+        self.assertTrue('first' in lib)
+        self.assertFalse('third' in lib)
+        self.assertEqual(lib.data.responses, {})
+
+        self.assertEqual(lib['second'].read(), 'second content')
+        self.assertEqual(lib.data.responses.keys(), ['second'])
+
+    def test_write_keeps_undecoded_entries(self):
+        """Verify that untouched entries survive a rewrite."""
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        lib.data['third'] = make_response('third content')
+        lib.write_to_file()
+
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertEqual(sorted(lib.get_all_available()),
+                         ['first', 'second', 'third'])
+        self.assertEqual(lib['first'].read(), 'first content')
+        self.assertEqual(lib['third'].read(), 'third content')
+
+    def test_truncated_file(self):
+        """Verify that the entries of a truncated file are recovered, and
+        that the next write restores the file."""
+        with open(self.filename, 'rb') as f:
+            encoded_str = f.read()
+        with open(self.filename, 'wb') as f:
+            f.write(encoded_str[:-1])
+
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertEqual(len(lib.get_all_available()), 1)
+        lib.data['third'] = make_response('third content')
+        lib.write_to_file()
+
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertEqual(len(lib.get_all_available()), 2)
+        self.assertEqual(lib['third'].read(), 'third content')
+
+
+class TestDirectoryCassetteLibrary(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmpdir')
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        if os.path.isdir(self.filename):
+            shutil.rmtree(self.filename)
+
+    def test_write_only_dirty_entries(self):
+        """Verify that only the responses recorded since the last write are
+        written, each one cached under its own path."""
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        record(lib, 'first', 'first content')
+        record(lib, 'second', 'second content')
+        lib.write_to_file()
+        self.assertEqual(lib.dirty_names, set())
+
+        first_path = lib.generate_path_from_cassette_name('first')
+        second_path = lib.generate_path_from_cassette_name('second')
+        self.assertEqual(CassetteLibrary.cache[first_path]['data'],
+                         lib.data['first'])
+        self.assertEqual(CassetteLibrary.cache[second_path]['data'],
+                         lib.data['second'])
+
+        with mock.patch.object(lib.encoder, 'dump',
+                               wraps=lib.encoder.dump) as dump:
+            record(lib, 'third', 'third content')
+            lib.write_to_file()
+
+        self.assertEqual(dump.call_count, 1)
+        self.assertEqual(sorted(os.listdir(self.filename)),
+                         ['first.json', 'second.json', 'third.json'])
+
+
+class TestDirectoryCassetteLibraryFlush(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmpdir')
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        if os.path.isdir(self.filename):
+            shutil.rmtree(self.filename)
+
+    def check_flush(self, pool):
+        config = Config()
+        config['flush_pool'] = pool
+        lib = CassetteLibrary.create_new_cassette_library(
+            self.filename, '', config)
+        for i in range(10):
+            record(lib, 'name%d' % i, 'content %d' % i)
+        lib.write_to_file()
+
+        self.assertEqual(sorted(os.listdir(self.filename)),
+                         sorted('name%d.json' % i for i in range(10)))
+        CassetteLibrary.cache.clear()
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertEqual(lib['name7'].read(), 'content 7')
+
+    def test_flush_in_threads(self):
+        """Verify that responses are written in parallel."""
+        self.check_flush('thread')
+
+    def test_flush_in_processes(self):
+        self.check_flush('process')
+
+    def test_file_mode(self):
+        """Verify that files get the permissions open() would give them."""
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        record(lib, 'name', 'content')
+        lib.write_to_file()
+
+        mode = os.stat(os.path.join(self.filename, 'name.json')).st_mode
+        self.assertEqual(mode & 0777, FILE_MODE)
+
+    def test_interrupted_flush(self):
+        """Verify that a failed write leaves the previous files intact and
+        no temporary file."""
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        record(lib, 'first', 'first content')
+        lib.write_to_file()
+
+        record(lib, 'first', 'new content')
+        record(lib, 'second', 'second content')
+        with mock.patch.object(lib.encoder, 'dump', side_effect=ValueError):
+            self.assertRaises(ValueError, lib.write_to_file)
+
+        self.assertEqual(os.listdir(self.filename), ['first.json'])
+        with open(os.path.join(self.filename, 'first.json')) as f:
+            self.assertTrue('first content' in f.read())
+
+
+class TestDirectoryCassetteLibraryPreload(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmpdir')
+        self.addCleanup(self.clean_up)
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        record(lib, 'first', 'first content')
+        record(lib, 'second', 'second content')
+        lib.write_to_file()
+        CassetteLibrary.cache.clear()
+
+    def clean_up(self):
+        if os.path.isdir(self.filename):
+            shutil.rmtree(self.filename)
+
+    def check_preload(self, pool):
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertEqual(lib.preload(workers=2, pool=pool), 2)
+        self.assertEqual(sorted(lib.preloaded), ['first.json', 'second.json'])
+
+        with mock.patch.object(lib, '_load_request_from_file') as load:
+            self.assertTrue('first' in lib)
+            self.assertEqual(lib['first'].read(), 'first content')
+            self.assertEqual(load.called, False)
+
+        self.assertEqual(sorted(lib.preloaded), ['second.json'])
+        self.assertTrue('first' in lib.data)
+
+    def test_preload_in_threads(self):
+        """Verify that preloaded responses are replayed without reading the
+        directory again."""
+        self.check_preload('thread')
+
+    def test_preload_in_processes(self):
+        self.check_preload('process')
+
+    def test_preload_names(self):
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertEqual(lib.preload(['second', 'missing']), 1)
+        self.assertEqual(list(lib.preloaded), ['second.json'])
+
+    def test_unsupported_pool(self):
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertRaises(ValueError, lib.preload, pool='fiber')
+
+
+class TestSqliteCassetteLibrary(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.sqlite')
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.filename + suffix):
+                os.remove(self.filename + suffix)
+
+    def test_write_and_read(self):
+        """Verify that responses are stored in and read from the
+        database."""
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertTrue(isinstance(lib, SqliteCassetteLibrary))
+        record(lib, 'first', 'first content')
+        record(lib, 'binary', '\x89PNG\x00\xff')
+        lib.write_to_file()
+        self.assertFalse(lib.is_dirty)
+
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertTrue('first' in lib)
+        self.assertFalse('third' in lib)
+        self.assertEqual(lib['first'].read(), 'first content')
+        self.assertEqual(lib['first'].getheader('content-length'), '13')
+        self.assertEqual(lib['binary'].read(), '\x89PNG\x00\xff')
+        self.assertEqual(sorted(lib.get_all_available()), ['binary', 'first'])
+
+        with self.assertRaises(KeyError):
+            lib['third']
+
+    def test_wal_mode(self):
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        journal_mode, = lib.connection.execute(
+            'PRAGMA journal_mode').fetchone()
+        self.assertEqual(journal_mode, 'wal')
+
+
 class TestCassetteLibrary(TestCase):
     """Verify that CassetteLibrary creates the correct subclasses."""
 
@@ -64,6 +638,17 @@ class TestCassetteLibrary(TestCase):
         self.assertTrue(isinstance(lib, FileCassetteLibrary))
         self.assertTrue(isinstance(lib.encoder, YamlEncoder))
 
+        filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.idx')
+        lib = CassetteLibrary.create_new_cassette_library(filename, '')
+        self.assertTrue(isinstance(lib, IndexedFileCassetteLibrary))
+        self.assertTrue(isinstance(lib.encoder, IndexedEncoder))
+
+        filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.json.gz')
+        lib = CassetteLibrary.create_new_cassette_library(filename, '')
+        self.assertTrue(isinstance(lib, FileCassetteLibrary))
+        self.assertTrue(isinstance(lib.encoder, CompressedEncoder))
+        self.assertTrue(isinstance(lib.encoder.encoder, JsonEncoder))
+
     def test_create_new_cassette_library_with_directory(self):
         """Verify correct encoder is attached to a directory CassetteLibrary."""
         filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp')
@@ -102,3 +687,125 @@ class TestCassetteLibrary(TestCase):
         # Check to see if unsupported encoding raises error
         with self.assertRaises(KeyError):
             CassetteLibrary.create_new_cassette_library(BAD_DIRECTORY, 'derp')
+
+
+class TestDirectoryCassetteLibraryHashedLayout(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmpdir')
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        if os.path.isdir(self.filename):
+            shutil.rmtree(self.filename)
+
+    def create_library(self, layout):
+        return CassetteLibrary.create_new_cassette_library(
+            self.filename, '', {'layout': layout})
+
+    def test_generate_filename(self):
+        """Verify that filenames have a fixed length and are sharded."""
+        lib = self.create_library('hashed')
+        filename = lib.generate_filename('httplib:GET host:80/' + 'a' * 500)
+
+        first, second, basename = filename.split(os.sep)
+        self.assertEqual(len(basename), 40 + len('.json'))
+        self.assertEqual(first + second, basename[:4])
+
+    def test_write_and_read(self):
+        """Verify that responses are stored with their name."""
+        lib = self.create_library('hashed')
+        record(lib, 'first name', 'first content')
+        lib.write_to_file()
+
+        filename = lib.generate_filename('first name')
+        with open(os.path.join(self.filename, filename)) as f:
+            self.assertEqual(lib.encoder.load(f.read())['name'], 'first name')
+
+        lib = self.create_library('hashed')
+        self.assertTrue('first name' in lib)
+        self.assertEqual(lib['first name'].read(), 'first content')
+        self.assertEqual(lib.get_all_available(), [filename])
+
+    def test_migrate_to_hashed_layout(self):
+        """Verify that flat files are found after the migration."""
+        lib = self.create_library('flat')
+        record(lib, 'first name', 'first content')
+        record(lib, 'second name', 'second content')
+        lib.write_to_file()
+
+        self.assertEqual(lib.migrate_to_hashed_layout(), 2)
+
+        lib = self.create_library('hashed')
+        self.assertEqual(lib['first name'].read(), 'first content')
+        self.assertEqual(lib['second name'].read(), 'second content')
+        self.assertEqual(len(lib.get_all_available()), 2)
+
+        filename = lib.generate_filename('first name')
+        with open(os.path.join(self.filename, filename)) as f:
+            self.assertEqual(lib.encoder.load(f.read())['name'], 'first_name')
+
+    def test_unsupported_layout(self):
+        with self.assertRaises(ValueError):
+            self.create_library('derp')
+
+
+class TestBlobStore(TestCase):
+
+    def setUp(self):
+        self.blob_directory = os.path.join(TEMPORARY_RESPONSES_ROOT, 'blobs')
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        for filename in (self.filename('json'), self.filename('idx')):
+            remove_file(filename)
+        if os.path.isdir(self.blob_directory):
+            shutil.rmtree(self.blob_directory)
+
+    def filename(self, file_format):
+        return os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.' + file_format)
+
+    def create_library(self, file_format):
+        config = {'blob_store': self.blob_directory, 'blob_threshold': 10}
+        return CassetteLibrary.create_new_cassette_library(
+            self.filename(file_format), '', config)
+
+    def check_blob_store(self, file_format):
+        lib = self.create_library(file_format)
+        record(lib, 'first', 'large shared content')
+        record(lib, 'second', 'large shared content')
+        record(lib, 'third', 'small')
+        lib.write_to_file()
+
+        digest = BlobStore.digest('large shared content')
+        self.assertEqual(os.listdir(self.blob_directory), [digest[:2]])
+        self.assertEqual(lib.encode_response(lib.data['first']),
+                         lib.encode_response(lib.data['second']))
+        self.assertEqual(lib.encode_response(lib.data['third'])['content'],
+                         'small')
+
+        # Make sure the responses are decoded again
+        CassetteLibrary.cache.clear()
+        lib = self.create_library(file_format)
+        # Bodies are mapped rather than read
+        with mock.patch.object(BlobStore, 'map',
+                               wraps=lib.blob_store.map) as map_:
+            response = lib['first']
+            self.assertEqual(response.content_digest, digest)
+            self.assertEqual(response.read(), 'large shared content')
+
+        self.assertEqual(map_.call_count, 1)
+        self.assertEqual(lib['third'].read(), 'small')
+
+    def test_file_library(self):
+        """Verify that large bodies are stored once, and read on replay."""
+        self.check_blob_store('json')
+
+    def test_indexed_file_library(self):
+        """Verify that large bodies are stored once for indexed files too."""
+        self.check_blob_store('idx')
+
+    def test_missing_blob(self):
+        store = BlobStore(self.blob_directory)
+        with self.assertRaises(KeyError):
+            store.get(BlobStore.digest('missing'))
@@ -0,0 +1,146 @@
+import os
+import shutil
+
+import mock
+
+from cassette.cassette_library import CassetteLibrary
+from cassette.manifest import BloomFilter, Manifest
+from cassette.tests.base import TEMPORARY_RESPONSES_ROOT, TestCase
+from cassette.tests.test_cassette_library import record
+
+DIRECTORY = os.path.join(TEMPORARY_RESPONSES_ROOT, 'manifestdir')
+
+
+class TestBloomFilter(TestCase):
+
+    def test_no_false_negatives(self):
+        """Verify that every added item is found."""
+        bloom = BloomFilter.for_capacity(1000)
+        items = ['item%d' % i for i in range(1000)]
+        for item in items:
+            bloom.add(item)
+
+        self.assertTrue(all(item in bloom for item in items))
+
+    def test_false_positive_rate(self):
+        """Verify that the false positive rate is close to the target."""
+        bloom = BloomFilter.for_capacity(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add('item%d' % i)
+
+        false_positives = sum('other%d' % i in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_dict_round_trip(self):
+        bloom = BloomFilter.for_capacity(10)
+        bloom.add('item')
+        bloom = BloomFilter.from_dict(bloom.to_dict())
+
+        self.assertTrue('item' in bloom)
+        self.assertFalse('other' in bloom)
+
+
+class TestDirectoryManifest(TestCase):
+
+    def setUp(self):
+        self.addCleanup(self.clean_up)
+
+        lib = self.create_library()
+        record(lib, 'first', 'first content')
+        record(lib, 'second', 'second content')
+        lib.write_to_file()
+
+    def clean_up(self):
+        if os.path.isdir(DIRECTORY):
+            shutil.rmtree(DIRECTORY)
+
+    def create_library(self):
+        return CassetteLibrary.create_new_cassette_library(
+            DIRECTORY, '', {'manifest': True})
+
+    def test_lookups_do_not_stat(self):
+        """Verify that lookups are answered by the manifest."""
+        lib = self.create_library()
+        lib.manifest
+
+        with mock.patch('os.path.exists') as exists:
+            with mock.patch('os.stat') as stat:
+                self.assertTrue('first' in lib)
+                self.assertFalse('third' in lib)
+
+        self.assertFalse(exists.called)
+        self.assertFalse(stat.called)
+
+    def test_get_all_available(self):
+        """Verify that the manifest itself is not reported."""
+        lib = self.create_library()
+
+        with mock.patch('os.listdir') as listdir:
+            available = lib.get_all_available()
+
+        self.assertFalse(listdir.called)
+        self.assertEqual(sorted(available), ['first.json', 'second.json'])
+
+    def test_stale_manifest_is_rebuilt(self):
+        """Verify that files added behind the library's back are found."""
+        shutil.copy(os.path.join(DIRECTORY, 'first.json'),
+                    os.path.join(DIRECTORY, 'third.json'))
+
+        lib = self.create_library()
+        self.assertTrue('third' in lib)
+        self.assertEqual(lib['third'].read(), 'first content')
+
+    def test_manifest_is_reused(self):
+        """Verify that a fresh manifest is not rebuilt."""
+        # Make sure the manifest was written after the last directory change
+        Manifest.load(DIRECTORY)
+        os.utime(os.path.join(DIRECTORY, Manifest.FILENAME), (0, 2 ** 31))
+
+        with mock.patch.object(Manifest, 'rebuild') as rebuild:
+            self.create_library().manifest
+
+        self.assertFalse(rebuild.called)
+
+    def test_file_added_to_shard(self):
+        """Verify that files added to existing subdirectories of the hashed
+        layout make the manifest stale."""
+        shutil.rmtree(DIRECTORY)
+        config = {'manifest': True, 'layout': 'hashed'}
+        lib = CassetteLibrary.create_new_cassette_library(DIRECTORY, '',
+                                                          config)
+        record(lib, 'first', 'first content')
+        lib.write_to_file()
+        other = 'other'
+        other_path = os.path.join(DIRECTORY, lib.generate_filename(other))
+        os.makedirs(os.path.dirname(other_path))
+        # Make sure the manifest was written after the last directory change
+        os.utime(os.path.dirname(other_path), (0, 2 ** 30))
+        Manifest.load(DIRECTORY).save()
+        os.utime(os.path.join(DIRECTORY, Manifest.FILENAME), (0, 2 ** 31))
+
+        # Another file in an existing shard, as if pulled from version
+        # control
+        shutil.copy(os.path.join(DIRECTORY, lib.generate_filename('first')),
+                    other_path)
+
+        lib = CassetteLibrary.create_new_cassette_library(DIRECTORY, '',
+                                                          config)
+        self.assertTrue(other in lib)
+        self.assertEqual(lib[other].read(), 'first content')
+
+    def test_shard_manifest_is_reused(self):
+        """Verify that the modification times of the subdirectories are kept
+        in the manifest."""
+        shutil.rmtree(DIRECTORY)
+        config = {'manifest': True, 'layout': 'hashed'}
+        lib = CassetteLibrary.create_new_cassette_library(DIRECTORY, '',
+                                                          config)
+        record(lib, 'first', 'first content')
+        lib.write_to_file()
+        os.utime(os.path.join(DIRECTORY, Manifest.FILENAME), (0, 2 ** 31))
+
+        with mock.patch.object(Manifest, 'rebuild') as rebuild:
+            manifest = Manifest.load(DIRECTORY)
+
+        self.assertFalse(rebuild.called)
+        self.assertEqual(len(manifest.subdirectories), 2)
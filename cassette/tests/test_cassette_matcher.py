@@ -0,0 +1,142 @@
+import mock
+
+from cassette.cassette_library import CassetteLibrary, CassetteName
+from cassette.matcher import (MEMO_BODY_SIZE, Matcher, canonicalize_json,
+                              canonicalize_query)
+from cassette.tests.base import TEMPORARY_RESPONSES_ROOT, TestCase
+
+REQUEST = {
+    'host': 'example.com',
+    'port': 80,
+    'method': 'POST',
+    'url': '/items?b=2&a=1',
+    'body': '{"b": 2, "a": 1}',
+    'headers': {'Host': 'example.com', 'Date': 'Mon, 01 Jan 2015',
+                'Content-Type': 'application/json'},
+}
+
+
+def request(**kwargs):
+    """Return the arguments of a request, with some of them replaced."""
+    arguments = dict(REQUEST, headers=dict(REQUEST['headers']))
+    arguments.update(kwargs)
+    return arguments
+
+
+class TestMatcher(TestCase):
+
+    def test_default(self):
+        """Verify that names are unchanged without options."""
+        for will_hash_body in (False, True):
+            matcher = Matcher(will_hash_body=will_hash_body)
+            self.assertEqual(
+                matcher.cassette_name(**request()),
+                CassetteName.from_httplib_connection(
+                    will_hash_body=will_hash_body, **request()))
+
+    def test_headers_not_modified(self):
+        arguments = request()
+        Matcher().cassette_name(**arguments)
+        self.assertEqual(arguments['headers'], REQUEST['headers'])
+
+    def test_ignore_headers(self):
+        matcher = Matcher({'ignore_headers': ['date']})
+        headers = dict(REQUEST['headers'], Date='Tue, 02 Jan 2015')
+        self.assertEqual(matcher.cassette_name(**request()),
+                         matcher.cassette_name(**request(headers=headers)))
+
+        headers = dict(REQUEST['headers'], Accept='text/html')
+        self.assertNotEqual(matcher.cassette_name(**request()),
+                            matcher.cassette_name(**request(headers=headers)))
+
+    def test_normalize_headers(self):
+        matcher = Matcher({'normalize_headers': {
+            'Content-Type': lambda value: value.split(';')[0]}})
+        headers = dict(REQUEST['headers'],
+                       **{'Content-Type': 'application/json; charset=utf-8'})
+        self.assertEqual(matcher.cassette_name(**request()),
+                         matcher.cassette_name(**request(headers=headers)))
+
+    def test_canonicalize(self):
+        for will_hash_body in (False, True):
+            matcher = Matcher({'canonicalize_query': True,
+                               'canonicalize_json': True},
+                              will_hash_body=will_hash_body)
+            self.assertEqual(
+                matcher.cassette_name(**request()),
+                matcher.cassette_name(**request(url='/items?a=1&b=2',
+                                                body='{"a":1,"b":2}')))
+
+    def test_match_on(self):
+        matcher = Matcher({'match_on': ['method', 'host', 'port', 'path']},
+                          will_hash_body=True)
+        self.assertEqual(
+            matcher.cassette_name(**request()),
+            matcher.cassette_name(**request(url='/items?c=3', body='other',
+                                            headers={})))
+        self.assertNotEqual(matcher.cassette_name(**request()),
+                            matcher.cassette_name(**request(url='/other')))
+
+    def test_unknown_options(self):
+        with self.assertRaises(ValueError):
+            Matcher({'ignore_header': ['Date']})
+        with self.assertRaises(ValueError):
+            Matcher({'match_on': ['url']})
+
+    def test_memoize(self):
+        """Verify that names of identical requests are computed once."""
+        matcher = Matcher({'canonicalize_json': True})
+        with mock.patch.object(matcher, 'compute_name',
+                               wraps=matcher.compute_name) as compute_name:
+            names = set(matcher.cassette_name(**request()) for _ in range(3))
+            matcher.cassette_name(**request(body='{}'))
+
+        self.assertEqual(len(names), 1)
+        self.assertEqual(compute_name.call_count, 2)
+
+    def test_memoize_large_body(self):
+        """Verify that large bodies are memoized by their digest."""
+        matcher = Matcher()
+        body = 'a' * (MEMO_BODY_SIZE + 1)
+        name = matcher.cassette_name(**request(body=body))
+        self.assertEqual(matcher.cassette_name(**request(body=body)), name)
+        self.assertNotEqual(
+            matcher.cassette_name(**request(body=body + 'b')), name)
+
+        for key in matcher.memo.entries:
+            self.assertFalse(body in key)
+
+    def test_unhashable_body(self):
+        matcher = Matcher()
+        matcher.cassette_name(**request(body=bytearray('body')))
+        self.assertEqual(len(matcher.memo), 0)
+
+
+class TestCanonicalize(TestCase):
+
+    def test_canonicalize_query(self):
+        self.assertEqual(canonicalize_query('/path?b=2&a=1&a=0&c='),
+                         '/path?a=0&a=1&b=2&c=')
+        self.assertEqual(canonicalize_query('/path'), '/path')
+
+    def test_canonicalize_json(self):
+        self.assertEqual(canonicalize_json('{"b": [1, 2], "a": null}'),
+                         '{"a":null,"b":[1,2]}')
+        self.assertEqual(canonicalize_json('a=1'), 'a=1')
+
+
+class TestCassetteLibraryMatcher(TestCase):
+
+    def test_library_matcher(self):
+        """Verify that libraries compile the matcher from their config."""
+        lib = CassetteLibrary.create_new_cassette_library(
+            TEMPORARY_RESPONSES_ROOT + '/tmpdir', '',
+            {'matcher': {'ignore_headers': ['Date']}})
+        self.assertTrue(lib.matcher is lib.matcher)
+        self.assertTrue(lib.matcher.will_hash_body)
+
+        headers = dict(REQUEST['headers'], Date='Tue, 02 Jan 2015')
+        self.assertEqual(
+            lib.cassette_name_for_httplib_connection(**request()),
+            lib.cassette_name_for_httplib_connection(
+                **request(headers=headers)))
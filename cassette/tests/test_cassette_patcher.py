@@ -0,0 +1,191 @@
+import httplib
+import socket
+import threading
+
+import mock
+
+import cassette
+from cassette import patcher
+from cassette.cassette_library import CassetteLibrary
+from cassette.patcher import (current_library, patch, pop_library,
+                              push_library, unpatch, unpatched_HTTPConnection)
+from cassette.tests.base import TEMPORARY_RESPONSES_FILENAME, TestCase
+from cassette.tests.test_cassette_library import record
+from cassette.unpatched import unpatched_httplib_context
+
+
+def create_library(content):
+    """Return a library replaying the content for GET http://127.0.0.1:1/."""
+    lib = CassetteLibrary.create_new_cassette_library(
+        TEMPORARY_RESPONSES_FILENAME, 'json')
+    lib._data = {}
+    name = lib.cassette_name_for_httplib_connection(
+        host='127.0.0.1', port=1, method='GET', url='/', body=None,
+        headers=None)
+    record(lib, name, content)
+    return lib
+
+
+def get_content():
+    connection = httplib.HTTPConnection('127.0.0.1', 1)
+    connection.request('GET', '/')
+    return connection.getresponse().read()
+
+
+def reset_routing():
+    """Deactivate the libraries left active by other tests."""
+    del patcher._active[:]
+    patcher._routing.stack = []
+    patcher._unpatch()
+
+
+class TestPatcher(TestCase):
+
+    def setUp(self):
+        reset_routing()
+        self.addCleanup(reset_routing)
+
+    def test_patch_once(self):
+        """Verify that the standard library stays patched until the last
+        library is removed."""
+        first = create_library('first')
+        second = create_library('second')
+
+        patch(first)
+        patch(second)
+        self.assertTrue(current_library() is second)
+        self.assertEqual(get_content(), 'second')
+
+        unpatch(second)
+        self.assertTrue(current_library() is first)
+        self.assertEqual(get_content(), 'first')
+
+        unpatch(first)
+        self.assertTrue(current_library() is None)
+        self.assertTrue(httplib.HTTPConnection is unpatched_HTTPConnection)
+
+    def test_threads(self):
+        """Verify that every thread replays from its own library."""
+        libraries_patched = threading.Semaphore(0)
+        contents = {}
+
+        def play(content):
+            lib = create_library(content)
+            patch(lib)
+            try:
+                libraries_patched.release()
+                # Wait until the other thread patched its library
+                started.wait()
+                contents[content] = get_content()
+            finally:
+                unpatch(lib)
+
+        started = threading.Event()
+        threads = [threading.Thread(target=play, args=(content,))
+                   for content in ('first', 'second')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            libraries_patched.acquire()
+        started.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(contents, {'first': 'first', 'second': 'second'})
+        self.assertTrue(httplib.HTTPConnection is unpatched_HTTPConnection)
+
+    def test_thread_without_library(self):
+        """Verify that threads without a library of their own are not routed
+        to the library of another thread."""
+        lib = create_library('content')
+        libraries = []
+
+        patch(lib)
+        try:
+            thread = threading.Thread(
+                target=lambda: libraries.append(current_library()))
+            thread.start()
+            thread.join()
+        finally:
+            unpatch(lib)
+
+        self.assertEqual(libraries, [None])
+
+    def test_thread_without_library_warns(self):
+        """Verify that requests reaching the network because their thread
+        has no library are logged."""
+        lib = create_library('content')
+        errors = []
+
+        def request():
+            try:
+                get_content()
+            except socket.error as e:
+                errors.append(e)
+
+        patch(lib)
+        try:
+            with mock.patch('cassette.http_connection.log') as log:
+                thread = threading.Thread(target=request)
+                thread.start()
+                thread.join()
+        finally:
+            unpatch(lib)
+
+        # Nothing listens on the port
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(log.warning.call_count, 1)
+
+    def test_push_library(self):
+        """Verify that threads can be routed to a library explicitly."""
+        lib = create_library('content')
+        contents = []
+
+        def worker():
+            push_library(lib)
+            try:
+                contents.append(get_content())
+            finally:
+                pop_library()
+
+        patch(lib)
+        try:
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join()
+        finally:
+            unpatch(lib)
+
+        self.assertEqual(contents, ['content'])
+
+    def test_unpatched_context(self):
+        lib = create_library('content')
+
+        patch(lib)
+        try:
+            with unpatched_httplib_context(lib):
+                self.assertTrue(current_library() is None)
+            self.assertTrue(current_library() is lib)
+        finally:
+            unpatch(lib)
+
+    def test_eject_from_other_thread(self):
+        """Verify that a thread cannot eject the cassette of another
+        thread."""
+        errors = []
+
+        def eject():
+            try:
+                cassette.eject()
+            except RuntimeError as e:
+                errors.append(e)
+
+        cassette.insert(TEMPORARY_RESPONSES_FILENAME, 'json')
+        try:
+            thread = threading.Thread(target=eject)
+            thread.start()
+            thread.join()
+            self.assertEqual(len(errors), 1)
+            self.assertTrue(current_library() is cassette.player.library)
+        finally:
+            cassette.eject()
@@ -1,11 +1,18 @@
+import json
 import os
 import shutil
+import sys
+import time
 import urllib2
 from datetime import datetime, timedelta
 from unittest import skip
 
 import cassette
-from cassette.tests.base import TestCase
+from cassette.cassette_library import CassetteName
+from cassette.http_response import MockedHTTPResponse
+from cassette.matcher import Matcher
+from cassette.tests.base import TestCase, remove_file
+from cassette.utils import SUPPORTED_FORMATS
 
 TEST_URL = "http://127.0.0.1:5000/non-ascii-content"
 CASSETTE_FILE = './cassette/tests/data/performance.tmp'
@@ -19,13 +26,11 @@ class TestCassettePerformanceSingleFile(TestCase):
     def setUp(self):
         self.filename = CASSETTE_FILE
 
-        if os.path.exists(self.filename):
-            os.remove(self.filename)
+        remove_file(self.filename)
 
     def tearDown(self):
         # Tear down for every test case
-        if os.path.exists(self.filename):
-            os.remove(self.filename)
+        remove_file(self.filename)
 
     def generate_large_cassette_yaml(self):
         """Generate a large set of responses and store in YAML."""
@@ -151,3 +156,171 @@ class TestCassettePerformanceDirectory(TestCassettePerformanceSingleFile):
         # Tear down for every test case
         if os.path.exists(self.filename) and os.path.isdir(self.filename):
             shutil.rmtree(self.filename)
+
+
+def generate_responses(count=200):
+    """Return the dict representation of many text responses."""
+    responses = {}
+    for i in range(count):
+        content = json.dumps({
+            'id': i,
+            'items': [{'name': 'item %d' % j, 'value': j} for j in range(50)],
+        })
+        responses['httplib:GET 127.0.0.1:5000/items?%d' % i] = {
+            'headers': {'content-length': str(len(content)),
+                        'content-type': 'application/json'},
+            'content': content,
+            'status': 200,
+            'reason': 'OK',
+            'raw_headers': ['Content-Type: application/json\r\n',
+                            'Content-Length: %d\r\n' % len(content)],
+            'length': len(content),
+            'version': 11,
+        }
+    return responses
+
+
+def measure_encoder(encoder, data, repeat=5):
+    """Return the encoded size and the best decode time of the data."""
+    encoded_str = encoder.dump(data)
+    timings = []
+    for _ in range(repeat):
+        start_time = time.time()
+        encoder.load(encoded_str)
+        timings.append(time.time() - start_time)
+    return len(encoded_str), min(timings)
+
+
+@skip('Skipping performance tests')
+class TestCompressedEncoderPerformance(TestCase):
+    """Benchmark the size/decode time tradeoff of compressed encoders."""
+
+    def test_size_and_decode_time(self):
+        """Verify compressed files are 5x smaller and decode in under 2x the
+        time."""
+        data = generate_responses()
+
+        print('\n%-10s %10s %12s' % ('format', 'bytes', 'decode (ms)'))
+        for file_format in ('json', 'yaml'):
+            size, decode_time = measure_encoder(
+                SUPPORTED_FORMATS[file_format], data)
+            print('%-10s %10d %12.1f' % (file_format, size,
+                                         decode_time * 1000))
+
+            for suffix in ('gz', 'bz2', 'xz'):
+                compressed_format = '%s.%s' % (file_format, suffix)
+                if compressed_format not in SUPPORTED_FORMATS:
+                    continue
+
+                compressed_size, compressed_decode_time = measure_encoder(
+                    SUPPORTED_FORMATS[compressed_format], data)
+                print('%-10s %10d %12.1f' % (compressed_format,
+                                             compressed_size,
+                                             compressed_decode_time * 1000))
+
+                self.assertLess(compressed_size * 5, size)
+                self.assertLess(compressed_decode_time, decode_time * 2)
+
+
+class EagerMockedHTTPResponse(object):
+    """Response storing its attributes in a __dict__ and building its file
+    descriptor and message when loaded, for comparison."""
+
+    @classmethod
+    def from_dict(cls, data):
+        obj = cls()
+        obj.__dict__.update(data)
+        # What loading a response used to cost
+        response = MockedHTTPResponse.from_dict(data)
+        obj.fp = response.fp
+        obj.msg = response.msg
+        return obj
+
+
+def measure_responses(response_class, data, repeat=5):
+    """Return the size of one response and the best time to load all the
+    responses."""
+    timings = []
+    for _ in range(repeat):
+        start_time = time.time()
+        responses = [response_class.from_dict(v) for v in data.itervalues()]
+        timings.append(time.time() - start_time)
+
+    response = responses[0]
+    size = sys.getsizeof(response)
+    if '__dict__' in dir(response) and response.__dict__:
+        size += sys.getsizeof(response.__dict__)
+    return size, min(timings)
+
+
+@skip('Skipping performance tests')
+class TestMockedHTTPResponsePerformance(TestCase):
+    """Benchmark the per-response memory and load time of responses."""
+
+    def test_memory_and_load_time(self):
+        """Verify responses are 2x smaller and load 2x faster than eagerly
+        built ones."""
+        data = generate_responses(10000)
+
+        eager_size, eager_time = measure_responses(EagerMockedHTTPResponse,
+                                                   data)
+        size, load_time = measure_responses(MockedHTTPResponse, data)
+
+        print('\n%-8s %12s %12s' % ('', 'bytes/entry', 'load (ms)'))
+        print('%-8s %12d %12.1f' % ('eager', eager_size, eager_time * 1000))
+        print('%-8s %12d %12.1f' % ('lazy', size, load_time * 1000))
+
+        self.assertLess(size * 2, eager_size)
+        self.assertLess(load_time * 2, eager_time)
+
+
+def measure_cassette_names(cassette_name, requests, repeat=5):
+    """Return the best time, in microseconds, to compute the name of a
+    request."""
+    timings = []
+    for _ in range(repeat):
+        start_time = time.time()
+        for arguments in requests:
+            cassette_name(**arguments)
+        timings.append(time.time() - start_time)
+    return min(timings) / len(requests) * 1e6
+
+
+@skip('Skipping performance tests')
+class TestMatcherPerformance(TestCase):
+    """Benchmark the cost of computing the cassette name of a request."""
+
+    def test_cassette_name_cost(self):
+        """Verify memoized names cost under a fifth of computed ones."""
+        body = json.dumps({'items': range(1000)})
+        requests = [{
+            'host': '127.0.0.1',
+            'port': 5000,
+            'method': 'POST',
+            'url': '/items?page=%d&sort=name' % (i % 10),
+            'body': body,
+            'headers': {'Content-Type': 'application/json',
+                        'Date': 'Mon, 01 Jan 2015 00:00:%02d GMT' % i},
+        } for i in range(1000)]
+
+        def legacy(**arguments):
+            arguments['headers'] = dict(arguments['headers'])
+            return CassetteName.from_httplib_connection(
+                will_hash_body=True, **arguments)
+
+        options = {'ignore_headers': ['Date'], 'canonicalize_query': True,
+                   'canonicalize_json': True}
+        compiled = Matcher(options, will_hash_body=True, memo_size=0)
+        memoized = Matcher(options, will_hash_body=True)
+
+        print('\n%-10s %14s' % ('', 'us/request'))
+        legacy_cost = measure_cassette_names(legacy, requests)
+        print('%-10s %14.1f' % ('legacy', legacy_cost))
+        compiled_cost = measure_cassette_names(compiled.cassette_name,
+                                               requests)
+        print('%-10s %14.1f' % ('matcher', compiled_cost))
+        memoized_cost = measure_cassette_names(memoized.cassette_name,
+                                               requests)
+        print('%-10s %14.1f' % ('memoized', memoized_cost))
+
+        self.assertLess(memoized_cost * 5, compiled_cost)
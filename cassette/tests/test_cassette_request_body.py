@@ -0,0 +1,137 @@
+import hashlib
+from cStringIO import StringIO
+from httplib import HTTPConnection
+
+import mock
+
+from cassette.cassette_library import CassetteLibrary, CassetteName
+from cassette.http_connection import CassetteHTTPConnection
+from cassette.request_body import StreamedBody, is_streamed
+from cassette.tests.base import TEMPORARY_RESPONSES_ROOT, TestCase
+
+CONTENT = 'streamed body ' * 1000
+
+
+class NonSeekableFile(object):
+
+    def __init__(self, content):
+        self.fp = StringIO(content)
+
+    def read(self, amt=None):
+        return self.fp.read() if amt is None else self.fp.read(amt)
+
+
+class TestStreamedBody(TestCase):
+
+    def test_is_streamed(self):
+        self.assertFalse(is_streamed(None))
+        self.assertFalse(is_streamed('body'))
+        self.assertFalse(is_streamed(u'body'))
+        self.assertFalse(is_streamed(bytearray('body')))
+        self.assertTrue(is_streamed(StringIO('body')))
+        self.assertTrue(is_streamed(iter(['body'])))
+
+    def test_seekable_file(self):
+        """Verify that seekable files are hashed in chunks and seeked back
+        to their position."""
+        fp = StringIO('header' + CONTENT)
+        fp.seek(6)
+        body = StreamedBody(fp, chunk_size=100)
+
+        self.assertEqual(body.hexdigest, hashlib.md5(CONTENT).hexdigest())
+        self.assertEqual(len(body), len(CONTENT))
+        self.assertTrue(body.fp is fp)
+        self.assertEqual(body.read(), CONTENT)
+
+    def test_spooled(self):
+        """Verify that non-seekable files and iterables are replayed from a
+        spool."""
+        chunks = [CONTENT[i:i + 100] for i in range(0, len(CONTENT), 100)]
+        for source in (NonSeekableFile(CONTENT), iter(chunks),
+                       (chunk for chunk in chunks)):
+            body = StreamedBody(source, max_size=1000)
+            self.assertEqual(body.hexdigest, hashlib.md5(CONTENT).hexdigest())
+            self.assertEqual(body.read(10), CONTENT[:10])
+            self.assertEqual(body.read(), CONTENT[10:])
+
+    def test_close(self):
+        body = StreamedBody(iter([CONTENT]), max_size=100)
+        spool = body.spool
+        body.close()
+        self.assertTrue(spool.closed)
+
+        fp = StringIO(CONTENT)
+        StreamedBody(fp).close()
+        self.assertFalse(fp.closed)
+
+    def test_equality(self):
+        body = StreamedBody(StringIO(CONTENT))
+        self.assertEqual(body, StreamedBody(iter([CONTENT])))
+        self.assertEqual(hash(body), hash(StreamedBody(iter([CONTENT]))))
+        self.assertNotEqual(body, StreamedBody(StringIO('other')))
+        self.assertFalse(StreamedBody(StringIO('')))
+
+    def test_cassette_name(self):
+        """Verify that streamed bodies are named after their content."""
+        for will_hash_body in (False, True):
+            name = CassetteName.from_httplib_connection(
+                'example.com', 80, 'POST', '/upload',
+                StreamedBody(StringIO(CONTENT)), {},
+                will_hash_body=will_hash_body)
+            self.assertTrue(hashlib.md5(CONTENT).hexdigest() in name)
+
+        self.assertEqual(
+            CassetteName.from_httplib_connection(
+                'example.com', 80, 'POST', '/upload',
+                StreamedBody(StringIO(CONTENT)), {}, will_hash_body=True),
+            CassetteName.from_httplib_connection(
+                'example.com', 80, 'POST', '/upload', CONTENT, {},
+                will_hash_body=True))
+
+
+class TestCassetteHTTPConnectionStreamedBody(TestCase):
+
+    def test_send_streamed_body(self):
+        """Verify that streamed bodies are still sent on a miss."""
+        lib = CassetteLibrary.create_new_cassette_library(
+            TEMPORARY_RESPONSES_ROOT + '/tmpdir', '')
+        connection = CassetteHTTPConnection('127.0.0.1', 5000)
+        connection._cassette_library = lib
+
+        sent = []
+
+        def send(connection, method, url, body, headers):
+            self.assertTrue(isinstance(body, StreamedBody))
+            sent.append(body.read())
+
+        with mock.patch.object(HTTPConnection, 'request', send):
+            connection.request('POST', '/upload',
+                               (chunk for chunk in [CONTENT]))
+
+        self.assertEqual(sent, [CONTENT])
+        self.assertTrue(hashlib.md5(CONTENT).hexdigest() in
+                        connection._cassette_name)
+
+    def test_spool_is_closed(self):
+        """Verify that the spool is removed once the body is sent, and not
+        kept by the memo of the matcher."""
+        lib = CassetteLibrary.create_new_cassette_library(
+            TEMPORARY_RESPONSES_ROOT + '/tmpdir', '')
+        connection = CassetteHTTPConnection('127.0.0.1', 5000)
+        connection._cassette_library = lib
+
+        bodies = []
+
+        def send(connection, method, url, body, headers):
+            bodies.append(body)
+
+        with mock.patch.object(HTTPConnection, 'request', send):
+            connection.request('POST', '/upload',
+                               (chunk for chunk in [CONTENT]))
+
+        body = bodies[0]
+        self.assertEqual(body.spool, None)
+        self.assertEqual(body.fp, None)
+        self.assertEqual(len(lib.matcher.memo), 1)
+        for key, _ in lib.matcher.memo.entries.items():
+            self.assertFalse(any(item is body for item in key))
@@ -0,0 +1,167 @@
+import os
+import shutil
+import time
+
+import mock
+
+from cassette.cassette_library import RACY_DELAY, CassetteLibrary
+from cassette.indexed import IndexedResponses
+from cassette.shared import SharedCache
+from cassette.tests.base import (TEMPORARY_RESPONSES_ROOT, TestCase,
+                                 remove_file)
+from cassette.tests.test_cassette_library import record
+
+DIRECTORY = os.path.join(TEMPORARY_RESPONSES_ROOT, 'shared')
+
+
+def set_old_mtime(path):
+    """Make the file old enough to be identified by its stat signature."""
+    past = time.time() - RACY_DELAY - 1
+    os.utime(path, (past, past))
+
+
+def published_files():
+    """Return the paths of the files published in the directory."""
+    return [os.path.join(dirpath, filename)
+            for dirpath, _, filenames in os.walk(DIRECTORY)
+            for filename in filenames
+            if filename.endswith(SharedCache.EXTENSION)]
+
+
+class TestSharedCache(TestCase):
+
+    def setUp(self):
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        if os.path.isdir(DIRECTORY):
+            shutil.rmtree(DIRECTORY)
+
+    def test_publish_once(self):
+        """Verify that files are only published by the first process."""
+        cache = SharedCache(DIRECTORY)
+        build = mock.Mock(return_value={'name': {'status': 200}})
+        for _ in range(2):
+            responses = cache.attach('/path', (1, 2, 3), build,
+                                     None, lambda entry: entry)
+            self.assertEqual(responses['name'], {'status': 200})
+            responses.close()
+
+        self.assertEqual(build.call_count, 1)
+
+    def test_remove_outdated(self):
+        """Verify that publishing a new version of a file removes the
+        previous one."""
+        cache = SharedCache(DIRECTORY)
+        cache.attach('/path', (1, 2, 3), dict, None, None).close()
+        cache.attach('/other', (1, 2, 3), dict, None, None).close()
+        cache.attach('/path', (1, 2, 4), dict, None, None).close()
+
+        self.assertEqual(sorted(published_files()), sorted([
+            cache.path('/path', (1, 2, 4)),
+            cache.path('/other', (1, 2, 3)),
+        ]))
+
+    def test_remove_outdated_lists_own_directory(self):
+        """Verify that publishing a file only lists the files published for
+        the same source file."""
+        cache = SharedCache(DIRECTORY)
+        cache.attach('/other', (1, 2, 3), dict, None, None).close()
+
+        with mock.patch('os.listdir', wraps=os.listdir) as listdir:
+            cache.attach('/path', (1, 2, 3), dict, None, None).close()
+
+        listdir.assert_called_once_with(
+            os.path.dirname(cache.path('/path', (1, 2, 3))))
+
+    def test_evict(self):
+        """Verify that the least recently used files are removed past the
+        size cap."""
+        cache = SharedCache(DIRECTORY)
+        entries = {'name': {'content': 'x' * 1000}}
+        for i, filename in enumerate(('/first', '/second', '/third')):
+            cache.attach(filename, (1, 2, 3), lambda: entries, None,
+                         None).close()
+            path = cache.path(filename, (1, 2, 3))
+            os.utime(path, (i, i))
+            size = os.path.getsize(path)
+
+        SharedCache(DIRECTORY, 2 * size).evict()
+        self.assertEqual(sorted(published_files()), sorted([
+            cache.path('/second', (1, 2, 3)),
+            cache.path('/third', (1, 2, 3)),
+        ]))
+
+
+class TestFileCassetteLibrarySharedCache(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.json')
+        self.config = {'shared_cache': True, 'shared_cache_dir': DIRECTORY}
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        if os.path.isdir(DIRECTORY):
+            shutil.rmtree(DIRECTORY)
+        remove_file(self.filename)
+
+    def create_library(self):
+        return CassetteLibrary.create_new_cassette_library(
+            self.filename, '', self.config)
+
+    def test_attach(self):
+        """Verify that libraries map the published file."""
+        lib = self.create_library()
+        record(lib, 'first', 'first content')
+        lib.write_to_file()
+
+        # Recently modified files are not shared
+        self.assertFalse(isinstance(self.create_library().data,
+                                    IndexedResponses))
+
+        set_old_mtime(self.filename)
+        for _ in range(2):
+            lib = self.create_library()
+            with mock.patch.object(lib.encoder, 'load',
+                                   wraps=lib.encoder.load) as load:
+                self.assertTrue(isinstance(lib.data, IndexedResponses))
+                self.assertEqual(lib['first'].read(), 'first content')
+        self.assertEqual(load.call_count, 0)
+
+        # New responses are written along with the shared ones
+        record(lib, 'second', 'second content')
+        lib.write_to_file()
+        set_old_mtime(self.filename)
+
+        lib = self.create_library()
+        self.assertEqual(lib['first'].read(), 'first content')
+        self.assertEqual(lib['second'].read(), 'second content')
+
+
+class TestDirectoryCassetteLibrarySharedCache(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmpdir')
+        self.config = {'shared_cache': True, 'shared_cache_dir': DIRECTORY}
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        for directory in (DIRECTORY, self.filename):
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+
+    def test_attach(self):
+        lib = CassetteLibrary.create_new_cassette_library(
+            self.filename, '', self.config)
+        record(lib, 'first', 'first content')
+        lib.write_to_file()
+        set_old_mtime(lib.generate_path_from_cassette_name('first'))
+
+        for _ in range(2):
+            lib = CassetteLibrary.create_new_cassette_library(
+                self.filename, '', self.config)
+            with mock.patch.object(lib.encoder, 'load',
+                                   wraps=lib.encoder.load) as load:
+                self.assertEqual(lib['first'].read(), 'first content')
+        self.assertEqual(load.call_count, 0)
+        self.assertEqual(len(published_files()), 1)
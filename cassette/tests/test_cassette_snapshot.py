@@ -0,0 +1,136 @@
+import os
+import shutil
+import time
+
+import mock
+
+from cassette.cassette_library import CassetteLibrary
+from cassette.snapshot import SnapshotCache
+from cassette.tests.base import (TEMPORARY_RESPONSES_ROOT, TestCase,
+                                 remove_file)
+from cassette.tests.test_cassette_library import record
+
+DIRECTORY = os.path.join(TEMPORARY_RESPONSES_ROOT, 'snapshots')
+
+
+class TestSnapshotCache(TestCase):
+
+    def setUp(self):
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        if os.path.isdir(DIRECTORY):
+            shutil.rmtree(DIRECTORY)
+
+    def test_put_and_get(self):
+        snapshots = SnapshotCache(DIRECTORY)
+        key = snapshots.key('abc', '.json')
+        self.assertEqual(snapshots.get(key), None)
+
+        snapshots.put(key, {'name': {'content': '\x00\xff'}})
+        self.assertEqual(snapshots.get(key), {'name': {'content': '\x00\xff'}})
+
+    def test_key(self):
+        """Verify that keys depend on the hash, format and version."""
+        snapshots = SnapshotCache(DIRECTORY)
+        key = snapshots.key('abc', '.json')
+        self.assertNotEqual(key, snapshots.key('abd', '.json'))
+        self.assertNotEqual(key, snapshots.key('abc', '.yaml'))
+
+        with mock.patch.object(SnapshotCache, 'VERSION',
+                               SnapshotCache.VERSION + 1):
+            self.assertNotEqual(key, snapshots.key('abc', '.json'))
+
+    def test_corrupted(self):
+        snapshots = SnapshotCache(DIRECTORY)
+        snapshots.put('key', {})
+        with open(snapshots.path('key'), 'wb') as f:
+            f.write('garbage')
+
+        self.assertEqual(snapshots.get('key'), None)
+
+    def test_evict_least_recently_used(self):
+        """Verify that the least recently used snapshots are removed past
+        the size cap."""
+        snapshots = SnapshotCache(DIRECTORY)
+        for key in ('first', 'second', 'third'):
+            snapshots.put(key, 'x' * 100)
+        size = os.path.getsize(snapshots.path('first'))
+
+        past = time.time() - 10
+        for i, key in enumerate(('first', 'second', 'third')):
+            os.utime(snapshots.path(key), (past + i, past + i))
+        # Reading a snapshot marks it as recently used
+        snapshots.get('first')
+
+        snapshots.max_bytes = size * 2
+        snapshots.put('fourth', 'x' * 100)
+
+        self.assertEqual(sorted(os.listdir(DIRECTORY)),
+                         ['first.snap', 'fourth.snap'])
+
+    def test_scan_only_past_the_cap(self):
+        """Verify that the directory is only scanned on the first write and
+        when the total size crosses the cap."""
+        snapshots = SnapshotCache(DIRECTORY, max_bytes=1000)
+        with mock.patch('os.listdir', wraps=os.listdir) as listdir:
+            for key in ('first', 'second', 'third'):
+                snapshots.put(key, 'x' * 100)
+            self.assertEqual(listdir.call_count, 1)
+
+            snapshots.put('fourth', 'x' * 1000)
+            self.assertEqual(listdir.call_count, 2)
+
+        self.assertTrue(snapshots.total_bytes <= 1000)
+
+
+class TestCassetteLibrarySnapshots(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.yaml')
+        self.config = {'snapshot_dir': DIRECTORY}
+        self.addCleanup(self.clean_up)
+        CassetteLibrary.cache.clear()
+
+    def clean_up(self):
+        CassetteLibrary.cache.clear()
+        if os.path.isdir(DIRECTORY):
+            shutil.rmtree(DIRECTORY)
+        remove_file(self.filename)
+
+    def create_library(self):
+        return CassetteLibrary.create_new_cassette_library(
+            self.filename, '', self.config)
+
+    def test_skip_decoding(self):
+        """Verify that files are only decoded once across processes."""
+        lib = self.create_library()
+        record(lib, 'first', 'first content')
+        lib.write_to_file()
+
+        for _ in range(2):
+            # Simulate a new process
+            CassetteLibrary.cache.clear()
+            lib = self.create_library()
+            with mock.patch.object(lib.encoder, 'load',
+                                   wraps=lib.encoder.load) as load:
+                self.assertEqual(lib['first'].read(), 'first content')
+        self.assertEqual(load.call_count, 0)
+        self.assertEqual(len(os.listdir(DIRECTORY)), 1)
+
+    def test_invalidation(self):
+        """Verify that modified files are decoded again."""
+        lib = self.create_library()
+        record(lib, 'first', 'first content')
+        lib.write_to_file()
+        CassetteLibrary.cache.clear()
+        self.create_library().data
+
+        lib = self.create_library()
+        record(lib, 'first', 'other content')
+        lib.write_to_file()
+        CassetteLibrary.cache.clear()
+
+        lib = self.create_library()
+        self.assertEqual(lib['first'].read(), 'other content')
+        self.assertEqual(len(os.listdir(DIRECTORY)), 2)
@@ -0,0 +1,178 @@
+import os
+import shutil
+from cStringIO import StringIO
+
+import mock
+
+from cassette.blob_store import BlobStore
+from cassette.cassette_library import CassetteLibrary
+from cassette.files import FILE_MODE
+from cassette.spool import Spool
+from cassette.tests.base import (TEMPORARY_RESPONSES_ROOT, TestCase,
+                                 remove_file)
+
+BLOB_DIRECTORY = os.path.join(TEMPORARY_RESPONSES_ROOT, 'blobs')
+
+
+class UpstreamResponse(object):
+    """Minimal httplib response."""
+
+    def __init__(self, content):
+        self.fp = StringIO(content)
+        self.status = 200
+        self.reason = 'OK'
+        self.version = 11
+        self.length = len(content)
+        self.msg = mock.Mock(headers=['Content-Length: %d\r\n' %
+                                      len(content)])
+
+    def getheaders(self):
+        return [('content-length', str(self.length))]
+
+    def read(self, amt=None):
+        return self.fp.read() if amt is None else self.fp.read(amt)
+
+
+class TestSpool(TestCase):
+
+    def setUp(self):
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        if os.path.isdir(BLOB_DIRECTORY):
+            shutil.rmtree(BLOB_DIRECTORY)
+
+    def test_tee(self):
+        """Verify that the content is spooled as it is read."""
+        spool = Spool(UpstreamResponse('0123456789'), max_size=100)
+        self.assertEqual(spool.read(4), '0123')
+        self.assertEqual(spool.size, 4)
+        self.assertEqual(spool.read(), '456789')
+        self.assertTrue(spool.done)
+        self.assertEqual(spool.getvalue(), '0123456789')
+        self.assertTrue(spool.is_in_memory())
+
+    def test_read_after_drain(self):
+        """Verify that draining the spool does not lose bytes for the
+        reader."""
+        spool = Spool(UpstreamResponse('0123456789'), max_size=4)
+        self.assertEqual(spool.read(2), '01')
+        spool.drain()
+        self.assertEqual(spool.read(3), '234')
+        self.assertEqual(spool.read(), '56789')
+        self.assertEqual(spool.read(), '')
+
+    def test_spill_to_disk(self):
+        spool = Spool(UpstreamResponse('0123456789'), max_size=4,
+                      directory=BLOB_DIRECTORY)
+        self.assertEqual(spool.read(3), '012')
+        self.assertTrue(spool.is_in_memory())
+        self.assertEqual(spool.read(3), '345')
+        self.assertFalse(spool.is_in_memory())
+        self.assertEqual(os.path.dirname(spool.name),
+                         os.path.abspath(BLOB_DIRECTORY))
+
+        self.assertEqual(spool.body()[:], '0123456789')
+        self.assertEqual(spool.read(), '6789')
+
+        name = spool.name
+        spool.close()
+        self.assertFalse(os.path.exists(name))
+
+    def test_move_to_blob_store(self):
+        """Verify that spilled spools are moved into the blob store."""
+        store = BlobStore(BLOB_DIRECTORY)
+        spool = Spool(UpstreamResponse('0123456789'), max_size=4,
+                      directory=BLOB_DIRECTORY)
+        spool.read(6)
+        name = spool.name
+        with mock.patch.object(spool, 'getvalue') as getvalue:
+            digest = store.put_spool(spool)
+        self.assertFalse(getvalue.called)
+        self.assertFalse(os.path.exists(name))
+
+        self.assertEqual(digest, BlobStore.digest('0123456789'))
+        self.assertEqual(store.get(digest), '0123456789')
+
+    def test_blob_file_mode(self):
+        """Verify that blobs get the permissions open() would give them."""
+        store = BlobStore(BLOB_DIRECTORY)
+        spool = Spool(UpstreamResponse('0123456789'), max_size=4,
+                      directory=BLOB_DIRECTORY)
+        digests = [store.put('content'), store.put_spool(spool)]
+
+        for digest in digests:
+            mode = os.stat(store.path(digest)).st_mode
+            self.assertEqual(mode & 0777, FILE_MODE)
+
+
+class TestCassetteLibrarySpool(TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(TEMPORARY_RESPONSES_ROOT, 'tmp.json')
+        self.addCleanup(self.clean_up)
+
+    def clean_up(self):
+        remove_file(self.filename)
+        if os.path.isdir(BLOB_DIRECTORY):
+            shutil.rmtree(BLOB_DIRECTORY)
+
+    def test_record(self):
+        """Verify that recorded bodies are spooled and moved into the blob
+        store when written."""
+        config = {'blob_store': BLOB_DIRECTORY, 'blob_threshold': 8,
+                  'spool_threshold': 4}
+        lib = CassetteLibrary.create_new_cassette_library(
+            self.filename, '', config)
+        content = 'large content'
+        cursor = lib.add_response('first', UpstreamResponse(content))
+        self.assertEqual(cursor.read(5), 'large')
+        self.assertFalse(cursor.isclosed())
+
+        # Replaying drains the upstream response
+        self.assertEqual(lib['first'].read(), content)
+        self.assertEqual(cursor.read(), ' content')
+        self.assertTrue(cursor.isclosed())
+
+        lib.write_to_file()
+        digest = BlobStore.digest(content)
+        self.assertEqual(lib.data['first'].content_digest, digest)
+        self.assertEqual(BlobStore(BLOB_DIRECTORY).get(digest), content)
+        self.assertFalse([f for f in os.listdir(BLOB_DIRECTORY)
+                          if f.startswith('.spool-')])
+
+        CassetteLibrary.cache.clear()
+        lib = CassetteLibrary.create_new_cassette_library(
+            self.filename, '', config)
+        self.assertEqual(lib['first'].read(), content)
+
+    def test_record_without_blob_store(self):
+        """Verify that spooled bodies are written inline without a blob
+        store."""
+        lib = CassetteLibrary.create_new_cassette_library(
+            self.filename, '', {'spool_threshold': 4})
+        lib.add_response('first', UpstreamResponse('0123456789'))
+        lib.write_to_file()
+
+        CassetteLibrary.cache.clear()
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertEqual(lib['first'].read(), '0123456789')
+
+    def test_close_early(self):
+        """Verify that the rest of the body is recorded when the client
+        closes the response before reading it."""
+        lib = CassetteLibrary.create_new_cassette_library(
+            self.filename, '', {'spool_threshold': 4})
+        upstream = UpstreamResponse('0123456789')
+        cursor = lib.add_response('first', upstream)
+        self.assertEqual(cursor.read(2), '01')
+        self.assertFalse(cursor.isclosed())
+        cursor.close()
+        self.assertTrue(cursor.isclosed())
+        # The upstream connection can be reused once the body was read
+        self.assertEqual(upstream.read(), '')
+        lib.write_to_file()
+
+        CassetteLibrary.cache.clear()
+        lib = CassetteLibrary.create_new_cassette_library(self.filename, '')
+        self.assertEqual(lib['first'].read(), '0123456789')
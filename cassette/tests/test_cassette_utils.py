@@ -1,5 +1,12 @@
+import mock
+import yaml
+
+import cassette
 from cassette.tests.base import TestCase
-from cassette.utils import Encoder, JsonEncoder, YamlEncoder
+from cassette.utils import (SUPPORTED_FORMATS, BinaryEncoder,
+                            CompressedEncoder, Encoder, IndexedEncoder,
+                            JsonEncoder, JsonLinesEncoder, YamlEncoder,
+                            YamlStreamEncoder)
 
 TEST_DATA = {
     'binary_data': '\x89\x70\x00',
@@ -48,3 +55,205 @@ class TestYamlEncoder(TestCase, CommonEncoderTest):
 
     def setUp(self):
         self.encoder = YamlEncoder()
+
+    def test_python_objects_are_not_constructed(self):
+        """Verify that YAML files cannot run arbitrary code."""
+        if not hasattr(yaml, 'FullLoader'):
+            self.skipTest('PyYAML < 5.1 only has the unsafe loader')
+
+        with self.assertRaises(yaml.constructor.ConstructorError):
+            self.encoder.load("!!python/object/apply:os.getcwd []")
+
+
+class TestJsonLinesEncoder(TestCase, CommonEncoderTest):
+    """Verify that the JSON Lines dump/load is working."""
+
+    def setUp(self):
+        self.encoder = JsonLinesEncoder()
+
+    def test_sorted_ascii_lines(self):
+        """Verify that there is one sorted, ASCII line per key."""
+        lines = self.encoder.dump(TEST_DATA).splitlines()
+
+        self.assertEqual(len(lines), len(TEST_DATA))
+        self.assertEqual(lines, sorted(lines))
+        for line in lines:
+            line.decode('ascii')
+
+    def test_load_index(self):
+        """Verify that single lines can be decoded through the index."""
+        encoded_str = self.encoder.dump(TEST_DATA)
+        encoded_str += self.encoder.dump({'normal_str': 'HIJ'})
+
+        with mock.patch.object(JsonLinesEncoder, 'KEY_PREFIX_LENGTH', 5):
+            index = self.encoder.load_index(encoded_str)
+
+        self.assertEqual(sorted(index.keys()), sorted(TEST_DATA.keys()))
+        offset, length = index['normal_str']
+        self.assertEqual(self.encoder.load_entry(encoded_str, offset, length),
+                         'HIJ')
+
+    def test_skip_torn_line(self):
+        """Verify that a line cut by a torn write is skipped, even when
+        other lines were appended after it."""
+        encoded_str = self.encoder.dump(TEST_DATA)
+        encoded_str = encoded_str[:-5] + '\n' + self.encoder.dump(
+            {'other': 'HIJ'})
+
+        index = self.encoder.load_index(encoded_str)
+        self.assertEqual(len(index), len(TEST_DATA))
+        self.assertTrue('other' in index)
+
+    def test_recover_index(self):
+        """Verify that a truncated last line is left out."""
+        encoded_str = self.encoder.dump(TEST_DATA)
+        index = self.encoder.recover_index(encoded_str[:-2])
+        self.assertEqual(len(index), len(TEST_DATA) - 1)
+
+
+class TestYamlStreamEncoder(TestCase, CommonEncoderTest):
+    """Verify that the YAML stream dump/load is working."""
+
+    def setUp(self):
+        self.encoder = YamlStreamEncoder()
+
+    def test_one_document_per_key(self):
+        """Verify that appended documents replace earlier keys."""
+        encoded_str = self.encoder.dump(TEST_DATA)
+        self.assertEqual(encoded_str.count('---'), len(TEST_DATA))
+
+        encoded_str += self.encoder.dump({'normal_str': 'HIJ'})
+        self.assertEqual(self.encoder.load(encoded_str)['normal_str'], 'HIJ')
+
+    def test_skip_torn_document(self):
+        """Verify that the other documents are loaded when one of them was
+        cut by a torn write."""
+        encoded_str = self.encoder.dump({'torn': 'ABC: DEF GHI'})[:-5]
+        encoded_str += '\n' + self.encoder.dump(TEST_DATA)
+
+        self.assertEqual(self.encoder.load(encoded_str), TEST_DATA)
+
+    def test_non_ascii_str(self):
+        """Verify that non-ASCII strings are loaded back as bytes."""
+        data = {'utf8': u'\xe9t\xe9'.encode('utf-8'), 'binary': '\xff\xfe'}
+        self.assertEqual(self.encoder.load(self.encoder.dump(data)), data)
+
+    def test_pure_python_fallback(self):
+        """Verify that the encoder works without libyaml."""
+        with mock.patch('cassette.utils.YAML_SAFE_LOADER', yaml.SafeLoader):
+            with mock.patch('cassette.utils.YAML_SAFE_DUMPER',
+                            yaml.SafeDumper):
+                data = self.encoder.load(self.encoder.dump(TEST_DATA))
+
+        self.assertEqual(data, TEST_DATA)
+
+
+class TestIndexedEncoder(TestCase, CommonEncoderTest):
+    """Verify that the indexed binary dump/load is working."""
+
+    def setUp(self):
+        self.encoder = IndexedEncoder()
+
+    def test_load_single_entry(self):
+        """Verify that a single entry can be decoded through the index."""
+        encoded_str = self.encoder.dump(TEST_DATA)
+        index = self.encoder.load_index(encoded_str)
+
+        self.assertEqual(sorted(index.keys()), sorted(TEST_DATA.keys()))
+        offset, length = index['deep_list']
+        self.assertEqual(self.encoder.load_entry(encoded_str, offset, length),
+                         TEST_DATA['deep_list'])
+
+    def test_load_bad_magic(self):
+        """Verify that files from other formats are rejected."""
+        with self.assertRaises(ValueError):
+            self.encoder.load_index(JsonEncoder().dump(TEST_DATA) * 2)
+
+    def test_load_truncated(self):
+        """Verify that truncated files are rejected, and that the entries
+        written before the cut are recovered."""
+        encoded_str = self.encoder.dump(TEST_DATA)
+        for size in range(1, len(encoded_str)):
+            buf = encoded_str[:size]
+            with self.assertRaises(ValueError):
+                self.encoder.load_index(buf)
+
+            index = self.encoder.recover_index(buf)
+            for key, (offset, length) in index.iteritems():
+                self.assertEqual(self.encoder.load_entry(buf, offset, length),
+                                 TEST_DATA[key])
+
+        index = self.encoder.recover_index(encoded_str[:-1])
+        self.assertEqual(len(index), len(TEST_DATA) - 1)
+
+    def test_recover_bad_magic(self):
+        with self.assertRaises(ValueError):
+            self.encoder.recover_index(JsonEncoder().dump(TEST_DATA))
+
+
+class TestBinaryEncoder(TestCase, CommonEncoderTest):
+    """Verify that the binary dump/load is working."""
+
+    def setUp(self):
+        self.encoder = BinaryEncoder()
+
+    def test_raw_bytes(self):
+        """Verify that bytes are stored as they are."""
+        self.assertIn(TEST_DATA['binary_data'], self.encoder.dump(TEST_DATA))
+
+
+class TestCompressedJsonEncoder(TestCase, CommonEncoderTest):
+    """Verify that the gzipped JSON dump/load is working."""
+
+    def setUp(self):
+        self.encoder = SUPPORTED_FORMATS['json.gz']
+
+    def test_compressed(self):
+        """Verify that the output is smaller than the wrapped encoder's."""
+        data = {'key%d' % i: TEST_DATA for i in range(100)}
+        self.assertTrue(isinstance(self.encoder, CompressedEncoder))
+        self.assertEqual(self.encoder.file_ext, '.json.gz')
+        self.assertLess(len(self.encoder.dump(data)),
+                        len(self.encoder.encoder.dump(data)) / 10)
+
+
+class TestCompressedYamlEncoder(TestCase, CommonEncoderTest):
+    """Verify that the bzipped YAML dump/load is working."""
+
+    def setUp(self):
+        self.encoder = SUPPORTED_FORMATS['yaml.bz2']
+
+
+class TestGetExtension(TestCase):
+
+    def test_get_extension(self):
+        self.assertEqual(Encoder.get_extension('a/b.json'), '.json')
+        self.assertEqual(Encoder.get_extension('a/b.c.json.gz'), '.json.gz')
+        self.assertEqual(Encoder.get_extension('a/b.yaml.BZ2'), '.yaml.bz2')
+        self.assertEqual(Encoder.get_extension('a/b.tar.gz'), '.gz')
+        self.assertEqual(Encoder.get_extension('a/b/'), '')
+
+
+class CustomEncoder(JsonEncoder):
+    file_ext = '.custom'
+
+
+class TestRegisterEncoder(TestCase):
+
+    def test_register_encoder(self):
+        """Verify that a registered encoder is found by format and
+        extension."""
+        encoder = CustomEncoder()
+        cassette.register_encoder('Custom', encoder)
+        self.addCleanup(cassette.unregister_encoder, 'custom')
+
+        self.assertTrue(Encoder.is_supported_format('custom'))
+        self.assertEqual(Encoder.get_encoder_from_file_format('custom'),
+                         encoder)
+        self.assertEqual(Encoder.get_encoder_from_extension('.custom'),
+                         encoder)
+
+    def test_register_encoder_type_error(self):
+        with self.assertRaises(TypeError):
+            cassette.register_encoder('custom', object())
+        self.assertFalse(Encoder.is_supported_format('custom'))
@@ -6,10 +6,13 @@ import contextlib
 
 @contextlib.contextmanager
 def unpatched_httplib_context(cassette_library):
-    """Create a context in which httplib is unpatched."""
+    """Create a context in which the requests of the current thread reach
+    the network."""
 
-    from cassette.patcher import patch, unpatch
+    from cassette.patcher import pop_library, push_library
 
-    unpatch()
-    yield
-    patch(cassette_library)
+    push_library(None)
+    try:
+        yield
+    finally:
+        pop_library()
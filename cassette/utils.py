@@ -3,12 +3,34 @@
 
     Helper functions.
 """
+import bz2
 import json
+import marshal
+import os
+import re
+import struct
+import zlib
 
 import yaml
 
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
 TEXT_ENCODING = 'ISO-8859-1'
 
+# Use libyaml when it is available. The full loader does not construct
+# arbitrary Python objects; PyYAML < 5.1 only has the unsafe one, which
+# yaml.load used by default.
+YAML_LOADER = getattr(yaml, 'CFullLoader', getattr(yaml, 'FullLoader',
+                                                   yaml.Loader))
+YAML_SAFE_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YAML_SAFE_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
 
 class Encoder(object):
     """Abstract class for an encoder consumed by cassette."""
@@ -16,6 +38,14 @@ class Encoder(object):
     # Used for matching filenames that correspond to the encoder
     file_ext = '.file'
 
+    # Whether single-file libraries can decode entries one at a time (see
+    # IndexedEncoder)
+    lazy = False
+
+    # Whether the encoded string of new entries can be appended to an
+    # existing file, later entries replacing earlier ones
+    appendable = False
+
     @staticmethod
     def is_supported_format(file_format):
         """Return whether the file format is supported.
@@ -43,9 +73,25 @@ class Encoder(object):
             # It's a dir.
             return DEFAULT_ENCODER
 
-        file_format = extension.replace('.', '')
+        file_format = extension.lstrip('.')
         return Encoder.get_encoder_from_file_format(file_format)
 
+    @staticmethod
+    def get_extension(path):
+        """Return the extension of the path.
+
+        Supported formats spanning several extensions (e.g. ``.json.gz``)
+        are returned whole.
+
+        :param str path:
+        """
+        basename = os.path.basename(path).lower()
+        for file_format in SUPPORTED_FORMATS:
+            if '.' in file_format and basename.endswith('.' + file_format):
+                return '.' + file_format
+
+        return os.path.splitext(path)[1]
+
     def dump(self, data):
         """Abstract method for dumping objects into an encoded form."""
         raise NotImplementedError('Encoder not implemented.')
@@ -121,13 +167,390 @@ class YamlEncoder(Encoder):
 
     def load(self, encoded_str):
         """Return an object from the encoded JSON string."""
-        return yaml.load(encoded_str)
+        return yaml.load(encoded_str, Loader=YAML_LOADER)
+
+
+class YamlStreamEncoder(Encoder):
+    """YAML encoder storing one document per entry.
+
+    Documents only use standard YAML tags, so they are parsed with the safe
+    loaders of libyaml when it is available. New entries can be appended to
+    an existing file without dumping the previous ones again.
+    """
+
+    file_ext = '.yamls'
+    appendable = True
+
+    def dump(self, data):
+        """Return a YAML stream of the data, one document per key."""
+        return yaml.dump_all(({k: v} for k, v in data.iteritems()),
+                             Dumper=YAML_SAFE_DUMPER, explicit_start=True)
+
+    def load(self, encoded_str):
+        """Return an object from the YAML stream.
+
+        The documents are merged in order.
+        """
+        try:
+            documents = list(yaml.load_all(encoded_str,
+                                           Loader=YAML_SAFE_LOADER))
+        except yaml.YAMLError:
+            documents = self.load_documents(encoded_str)
+
+        data = {}
+        for document in documents:
+            if document:
+                data.update(YamlStreamEncoder.yaml_str_decode(document))
+        return data
+
+    def load_documents(self, encoded_str):
+        """Return the documents of the YAML stream that can be loaded, e.g.
+        all but the one cut by a torn write.
+
+        Documents are told apart by their explicit start marker.
+        """
+        documents = []
+        for encoded_document in re.split(r'\n(?=---)', encoded_str):
+            try:
+                documents.append(yaml.load(encoded_document,
+                                           Loader=YAML_SAFE_LOADER))
+            except yaml.YAMLError:
+                continue
+        return documents
+
+    @staticmethod
+    def yaml_str_decode(data):
+        """Decode the unicode strings of a YAML document as strings.
+
+        The safe loader returns non-ASCII strings as unicode, whereas the
+        mock HTTP response needs the original bytes.
+        """
+        if isinstance(data, unicode):
+            return data.encode('utf-8')
+        elif isinstance(data, list):
+            return [YamlStreamEncoder.yaml_str_decode(item) for item in data]
+        elif isinstance(data, dict):
+            return {YamlStreamEncoder.yaml_str_decode(k):
+                    YamlStreamEncoder.yaml_str_decode(v)
+                    for k, v in data.iteritems()}
+        return data
+
+
+class IndexedEncoder(Encoder):
+    """Binary encoder storing an offset index in front of the entries.
+
+    The encoded string starts with a fixed-size header (magic and index
+    length), followed by the marshalled index mapping each key to the offset
+    and length of its entry, followed by the marshalled entries themselves.
+    Each entry can therefore be decoded on its own, without touching the
+    rest of the file.
+    """
+
+    file_ext = '.idx'
+    lazy = True
+
+    MAGIC = 'CASSIDX1'
+    HEADER = struct.Struct('>8sQ')
+
+    def dump(self, data):
+        """Return an indexed binary string of the data."""
+        return self.dump_encoded(
+            (k, self.dump_entry(k, v)) for k, v in data.iteritems())
+
+    def dump_entry(self, key, value):
+        """Return a single encoded entry."""
+        return marshal.dumps(value)
+
+    def dump_encoded(self, encoded_entries):
+        """Return an indexed binary string from already encoded entries.
+
+        :param encoded_entries: iterable of ``(key, encoded_entry)`` tuples.
+        """
+        index = {}
+        entries = []
+        offset = 0
+        for key, encoded in encoded_entries:
+            index[key] = (offset, len(encoded))
+            entries.append(encoded)
+            offset += len(encoded)
+
+        encoded_index = marshal.dumps(index)
+        header = self.HEADER.pack(self.MAGIC, len(encoded_index))
+        return ''.join([header, encoded_index] + entries)
+
+    def load(self, encoded_str):
+        """Return an object from the indexed binary string."""
+        index = self.load_index(encoded_str)
+        return {k: self.load_entry(encoded_str, offset, length)
+                for k, (offset, length) in index.iteritems()}
+
+    def load_index(self, buf):
+        """Return a dict mapping keys to the absolute offset and length of
+        their entry.
+
+        :param buf: encoded string, or any buffer supporting slicing (e.g.
+            an ``mmap``).
+        """
+        index = self._read_index(buf)
+        if any(offset + length > len(buf)
+               for offset, length in index.itervalues()):
+            raise ValueError('Truncated indexed cassette file.')
+
+        return index
+
+    def recover_index(self, buf):
+        """Return the index of the entries that were completely written to
+        a truncated buffer.
+
+        :param buf: encoded string, or any buffer supporting slicing.
+        """
+        try:
+            index = self._read_index(buf)
+        except ValueError:
+            # Files that are not indexed cannot be recovered
+            if not self.MAGIC.startswith(buf[:len(self.MAGIC)]):
+                raise
+            # Without its index, none of the entries can be found
+            return {}
+
+        return {k: (offset, length) for k, (offset, length)
+                in index.iteritems() if offset + length <= len(buf)}
+
+    def _read_index(self, buf):
+        """Return the index of the buffer, without checking that its entries
+        were completely written."""
+        if not len(buf):
+            return {}
+
+        if not self.MAGIC.startswith(buf[:len(self.MAGIC)]):
+            raise ValueError('Not an indexed cassette file.')
+        if len(buf) < self.HEADER.size:
+            raise ValueError('Truncated indexed cassette file.')
+
+        _, index_length = self.HEADER.unpack(buf[:self.HEADER.size])
+
+        start = self.HEADER.size
+        entries_start = start + index_length
+        if entries_start > len(buf):
+            raise ValueError('Truncated indexed cassette file.')
+
+        try:
+            index = marshal.loads(buf[start:entries_start])
+        except (EOFError, TypeError):
+            raise ValueError('Corrupted indexed cassette file.')
+
+        return {k: (entries_start + offset, length)
+                for k, (offset, length) in index.iteritems()}
+
+    def load_entry(self, buf, offset, length):
+        """Return a single entry decoded from the buffer."""
+        return marshal.loads(buf[offset:offset + length])
+
+
+class JsonLinesEncoder(Encoder):
+    """JSON Lines encoder storing one ``[key, value]`` entry per line.
+
+    Lines only contain ASCII characters and are sorted by key, so that files
+    diff and merge well. Keys are read without parsing the rest of the line,
+    so single-file libraries only parse the entries that are requested. New
+    entries can be appended to an existing file.
+    """
+
+    file_ext = '.jsonl'
+    lazy = True
+    appendable = True
+
+    # Keys are decoded from this many bytes at the start of a line, before
+    # falling back to the whole line
+    KEY_PREFIX_LENGTH = 1024
+
+    def dump(self, data):
+        """Return a JSON Lines string of the data."""
+        return self.dump_encoded(
+            (k, self.dump_entry(k, v)) for k, v in data.iteritems())
+
+    def dump_entry(self, key, value):
+        """Return a single encoded line, without the line break."""
+        return json.dumps([key, value], encoding=TEXT_ENCODING,
+                          sort_keys=True)
 
+    def dump_encoded(self, encoded_entries):
+        """Return a JSON Lines string from already encoded lines.
 
+        :param encoded_entries: iterable of ``(key, encoded_line)`` tuples.
+        """
+        return ''.join(line + '\n' for _, line in sorted(encoded_entries))
+
+    def load(self, encoded_str):
+        """Return an object from the JSON Lines string."""
+        index = self.load_index(encoded_str)
+        return {k: self.load_entry(encoded_str, offset, length)
+                for k, (offset, length) in index.iteritems()}
+
+    def load_index(self, buf):
+        """Return a dict mapping keys to the offset and length of their line.
+
+        When a key appears on several lines, the last one wins. Lines cut by
+        a torn write are skipped.
+
+        :param buf: encoded string, or any buffer supporting slicing and
+            ``find`` (e.g. an ``mmap``).
+        """
+        decoder = json.JSONDecoder(TEXT_ENCODING)
+        index = {}
+        offset = 0
+        size = len(buf)
+        while offset < size:
+            end = buf.find('\n', offset)
+            if end == -1:
+                end = size
+
+            length = end - offset
+            # Encoded lines end with the closing bracket of their list
+            if length and buf[end - 1] == ']':
+                prefix = buf[offset:offset + min(length,
+                                                 self.KEY_PREFIX_LENGTH)]
+                try:
+                    key, _ = decoder.raw_decode(prefix, 1)
+                except ValueError:
+                    key, _ = decoder.raw_decode(buf[offset:end], 1)
+                index[key.encode(TEXT_ENCODING)] = (offset, length)
+
+            offset = end + 1
+
+        return index
+
+    def recover_index(self, buf):
+        """Return the index of the lines that were completely written to a
+        truncated buffer.
+
+        :param buf: encoded string, or any buffer supporting slicing and
+            ``rfind``.
+        """
+        return self.load_index(buf[:buf.rfind('\n') + 1])
+
+    def load_entry(self, buf, offset, length):
+        """Return the value of a single line decoded from the buffer."""
+        _, value = json.loads(buf[offset:offset + length], TEXT_ENCODING,
+                              object_hook=JsonEncoder.json_str_decode_dict)
+        if isinstance(value, unicode):
+            value = value.encode(TEXT_ENCODING)
+        elif isinstance(value, list):
+            value = JsonEncoder.json_str_decode_list(value)
+        return value
+
+
+class BinaryEncoder(Encoder):
+    """Binary encoder storing HTTP responses with ``marshal``.
+
+    Bodies are stored as raw bytes, without any text transcoding. The output
+    is tied to the marshal format of the Python version that wrote it.
+    """
+
+    file_ext = '.bin'
+
+    MAGIC = 'CASSBIN1'
+    MARSHAL_VERSION = 2
+
+    def dump(self, data):
+        """Return a binary string of the data."""
+        return self.MAGIC + marshal.dumps(data, self.MARSHAL_VERSION)
+
+    def load(self, encoded_str):
+        """Return an object from the binary string."""
+        if not encoded_str.startswith(self.MAGIC):
+            raise ValueError('Not a binary cassette file.')
+
+        return marshal.loads(encoded_str[len(self.MAGIC):])
+
+
+class CompressedEncoder(Encoder):
+    """Encoder compressing the output of another encoder.
+
+    Directory libraries compress every entry on its own, single-file
+    libraries compress the whole file.
+
+    :param Encoder encoder: encoder producing the uncompressed string.
+    :param str suffix: extension added to the encoder's (e.g. ``'.gz'``).
+    :param callable compress:
+    :param callable decompress:
+    """
+
+    def __init__(self, encoder, suffix, compress, decompress):
+        self.encoder = encoder
+        self.file_ext = encoder.file_ext + suffix
+        self.compress = compress
+        self.decompress = decompress
+
+    def dump(self, data):
+        """Return a compressed string of the encoded data."""
+        return self.compress(self.encoder.dump(data))
+
+    def load(self, encoded_str):
+        """Return an object from the compressed encoded string."""
+        return self.encoder.load(self.decompress(encoded_str))
+
+
+def gzip_compress(data):
+    """Return the data compressed in the gzip format."""
+    compressor = zlib.compressobj(
+        zlib.Z_BEST_COMPRESSION, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def gzip_decompress(data):
+    """Return the data decompressed from the gzip format."""
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+COMPRESSIONS = {
+    'gz': (gzip_compress, gzip_decompress),
+    'bz2': (bz2.compress, bz2.decompress),
+}
+if lzma:
+    COMPRESSIONS['xz'] = (lzma.compress, lzma.decompress)
+
+
+# Registry of the supported file formats, see register_encoder
 SUPPORTED_FORMATS = {
+    'bin': BinaryEncoder(),
+    'idx': IndexedEncoder(),
     'json': JsonEncoder(),
-    'yaml': YamlEncoder()
+    'jsonl': JsonLinesEncoder(),
+    'yaml': YamlEncoder(),
+    'yamls': YamlStreamEncoder(),
 }
 
+for _file_format in ('json', 'yaml'):
+    for _suffix, (_compress, _decompress) in COMPRESSIONS.items():
+        SUPPORTED_FORMATS['%s.%s' % (_file_format, _suffix)] = \
+            CompressedEncoder(SUPPORTED_FORMATS[_file_format], '.' + _suffix,
+                              _compress, _decompress)
+
+
+def register_encoder(file_format, encoder):
+    """Register an encoder for a file format.
+
+    The file format is used both for the ``file_format`` argument and for
+    the file extension, e.g. registering ``'msgpack'`` makes
+    ``responses.msgpack`` use the encoder.
+
+    :param str file_format:
+    :param Encoder encoder: the instantiated encoder.
+    """
+    if not isinstance(encoder, Encoder):
+        raise TypeError('%r is not an Encoder.' % encoder)
+
+    SUPPORTED_FORMATS[file_format.lower()] = encoder
+
+
+def unregister_encoder(file_format):
+    """Remove the encoder registered for a file format.
+
+    :param str file_format:
+    """
+    del SUPPORTED_FORMATS[file_format.lower()]
+
+
 DEFAULT_COMPATIBLE_ENCODER = SUPPORTED_FORMATS['yaml']
 DEFAULT_ENCODER = SUPPORTED_FORMATS['json']